@@ -0,0 +1,258 @@
+"""Admission control for the public availability and booking endpoints.
+
+Each limited route has a per-client token bucket and a concurrency limit
+with a bounded FIFO queue. A client over its rate gets ``429``; a request
+that finds the queue full, or waits in it longer than
+``ADMISSION_QUEUE_TIMEOUT``, gets ``503``. Both carry ``Retry-After`` and
+are answered without touching the database, so a scraper or a flash-sale
+rush is shed at a fixed cost while admitted requests keep their latency.
+
+Admin routes are never limited or queued, and the default public
+concurrency limits (28 in all) add up to less than the default database
+pool (``DB_POOL_SIZE`` plus ``DB_MAX_OVERFLOW``, 30), so admin requests
+always find a connection. Keep it that way when raising them.
+
+Routes are matched on the path without trailing slashes, so
+``/api/bookings/`` is limited like ``/api/bookings``.
+
+Limits are per worker process. Each route reads ``ADMISSION_<ROUTE>_RATE``
+(requests per second per client, 0 for no rate limit), ``_BURST``,
+``_CONCURRENCY`` and ``_QUEUE``; ``ADMISSION_ENABLED=false`` turns the
+layer off.
+"""
+from collections import OrderedDict, deque
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+import asyncio
+import math
+import os
+import time
+
+from starlette.responses import JSONResponse
+
+from db_pool import env_flag
+from metrics import ADMISSION_DECISIONS, ADMISSION_QUEUE
+
+ADMISSION_ENABLED = env_flag("ADMISSION_ENABLED", True)
+# Longest a request waits for a slot before it is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "1"))
+# Token buckets kept per route; the least recently seen client is dropped beyond this
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", "10000"))
+# Take the client address from X-Forwarded-For (only behind a proxy that sets it)
+ADMISSION_TRUST_PROXY = env_flag("ADMISSION_TRUST_PROXY", False)
+
+# Outcomes counted in ADMISSION_DECISIONS
+ADMITTED = "admitted"
+QUEUED = "queued"
+RATE_LIMITED = "rate_limited"
+SHED = "shed"
+TIMED_OUT = "timed_out"
+
+
+class RouteLimits(NamedTuple):
+    rate: float
+    burst: int
+    concurrency: int
+    queue: int
+
+
+# (method, path) -> (name, default limits)
+LIMITED_ROUTES: Dict[Tuple[str, str], Tuple[str, RouteLimits]] = {
+    ("GET", "/api/rooms/availability"): ("availability", RouteLimits(rate=5, burst=20, concurrency=8, queue=32)),
+    ("GET", "/api/rooms/availability/calendar"): ("calendar", RouteLimits(rate=2, burst=10, concurrency=4, queue=16)),
+    ("POST", "/api/holds"): ("holds", RouteLimits(rate=1, burst=5, concurrency=4, queue=16)),
+    ("POST", "/api/quotes"): ("quotes", RouteLimits(rate=5, burst=20, concurrency=4, queue=16)),
+    ("POST", "/api/bookings"): ("bookings", RouteLimits(rate=0.5, burst=5, concurrency=8, queue=32)),
+}
+
+
+def route_limits_from_env() -> Dict[Tuple[str, str], Tuple[str, RouteLimits]]:
+    routes = {}
+    for key, (name, defaults) in LIMITED_ROUTES.items():
+        prefix = f"ADMISSION_{name.upper()}_"
+        routes[key] = (name, RouteLimits(
+            rate=float(os.environ.get(prefix + "RATE", defaults.rate)),
+            burst=int(os.environ.get(prefix + "BURST", defaults.burst)),
+            concurrency=int(os.environ.get(prefix + "CONCURRENCY", defaults.concurrency)),
+            queue=int(os.environ.get(prefix + "QUEUE", defaults.queue)),
+        ))
+    return routes
+
+
+class RateLimit:
+    """Token bucket per client: ``burst`` requests at once, refilled at ``rate`` per second"""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = ADMISSION_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, last refill), least recently seen first
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        """Spend a token; returns 0 if there was one, else seconds until there is"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.pop(client, None)
+        tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self.buckets[client] = (tokens, now)
+        if len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimit:
+    """At most ``limit`` requests at once; up to ``queue`` more wait their
+    turn in arrival order for at most ``timeout`` seconds"""
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _publish(self):
+        ADMISSION_QUEUE.set((self.name, "active"), self.active)
+        ADMISSION_QUEUE.set((self.name, "waiting"), len(self._waiters))
+
+    async def acquire(self) -> str:
+        """Take a slot; returns ``ADMITTED`` or ``QUEUED`` when one was taken,
+        ``SHED`` or ``TIMED_OUT`` when not"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._publish()
+            return ADMITTED
+        if len(self._waiters) >= self.queue:
+            return SHED
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            return TIMED_OUT
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the client went away
+                self.release()
+            else:
+                self._forget(waiter)
+            raise
+        return QUEUED
+
+    def _forget(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._publish()
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+
+class RouteAdmission:
+    def __init__(self, name: str, limits: RouteLimits):
+        self.name = name
+        self.limits = limits
+        self.rate_limit = RateLimit(limits.rate, limits.burst)
+        self.concurrency = ConcurrencyLimit(name, limits.concurrency, limits.queue)
+
+    def status(self) -> dict:
+        return {
+            "rate": self.limits.rate,
+            "burst": self.limits.burst,
+            "concurrency": self.limits.concurrency,
+            "queue": self.limits.queue,
+            "active": self.concurrency.active,
+            "waiting": self.concurrency.waiting,
+            "clients": len(self.rate_limit.buckets),
+        }
+
+
+class AdmissionControl:
+    """Limits for every route in ``routes``; other routes pass straight through"""
+
+    def __init__(self, routes: Optional[Dict[Tuple[str, str], Tuple[str, RouteLimits]]] = None,
+                 enabled: bool = ADMISSION_ENABLED):
+        self.enabled = enabled
+        routes = route_limits_from_env() if routes is None else routes
+        self.routes = {key: RouteAdmission(name, limits) for key, (name, limits) in routes.items()}
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queueTimeout": ADMISSION_QUEUE_TIMEOUT,
+            "routes": {route.name: route.status() for route in self.routes.values()},
+        }
+
+
+def client_address(scope) -> str:
+    if ADMISSION_TRUST_PROXY:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def route_path(scope) -> str:
+    return scope["path"].rstrip("/") or "/"
+
+
+def rejection(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail}, status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an ``AdmissionControl`` before routing"""
+
+    def __init__(self, app, admission: AdmissionControl):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        route = None
+        if scope["type"] == "http" and self.admission.enabled:
+            route = self.admission.routes.get((scope["method"], route_path(scope)))
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = route.rate_limit.take(client_address(scope))
+        if wait:
+            ADMISSION_DECISIONS.inc((route.name, RATE_LIMITED))
+            await rejection(429, "Too many requests", wait)(scope, receive, send)
+            return
+        outcome = await route.concurrency.acquire()
+        ADMISSION_DECISIONS.inc((route.name, outcome))
+        if outcome in (SHED, TIMED_OUT):
+            await rejection(503, "Server busy, please retry", route.concurrency.timeout)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route.concurrency.release()
@@ -0,0 +1,262 @@
+"""Occupancy and revenue analytics from daily rollups.
+
+Every booking and block write also adjusts one rollup row per room type and
+night it occupies (as the availability calendar counts it, and as it was
+charged), in the same write: units booked and blocked, room
+revenue (a booking's total spread evenly over its nights) and, on the
+arrival night, the number of arrivals and their summed lead time in days.
+Cancelling a booking takes back everything it added and counts a
+cancellation on its arrival night. A report then reads one row per room
+type and night however many bookings there are, and aggregates them with
+NumPy.
+
+Archiving leaves the rollups alone. ``StorageBackend.rebuild_rollups``
+recomputes them from the live and archived stays with ``RollupBuilder``;
+cancelled bookings are deleted, so the cancellation counts are carried
+over rather than recomputed.
+
+Over the nights of a report:
+
+- occupancy: units booked or blocked / units in the catalog
+- ADR (average daily rate): revenue / room-nights booked
+- RevPAR: revenue / room-nights in the catalog
+- lead time: mean days from booking to arrival, over arrivals in range
+- cancellation rate: cancellations / (arrivals + cancellations)
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple
+import os
+
+import numpy as np
+
+from availability import ACTIVE_BOOKING_STATUSES, stay_dates
+from listings import BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE, BOOKINGS
+
+ROLLUP_FIELDS = ["bookedUnits", "blockedUnits", "revenue", "arrivals", "cancellations", "leadTimeDays"]
+
+# Longest range one report covers
+ANALYTICS_MAX_DAYS = int(os.environ.get("ANALYTICS_MAX_DAYS", "1100"))
+# Stays streamed, and rollup rows written, per batch when rebuilding
+ROLLUP_BATCH_SIZE = int(os.environ.get("ROLLUP_BATCH_SIZE", "5000"))
+
+EPOCH = date(1970, 1, 1)
+
+BLOCK_KINDS = (BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE)
+
+# (roomType, night) -> field -> amount to add
+RollupDeltas = Dict[Tuple[str, date], Dict[str, float]]
+
+
+def lead_time_days(check_in: datetime, created_at: datetime) -> int:
+    return max((check_in.date() - created_at.date()).days, 0)
+
+
+def occupied_nights(check_in: datetime, check_out: datetime) -> List[date]:
+    """The nights a stay occupies, as the availability calendar counts them"""
+    first, end = stay_dates(check_in, check_out)
+    return [first + timedelta(days=offset) for offset in range((end - first).days)]
+
+
+def _add(deltas: RollupDeltas, key: Tuple[str, date], field: str, amount: float):
+    row = deltas.setdefault(key, {})
+    row[field] = row.get(field, 0) + amount
+
+
+def stay_deltas(kind: str, records: Iterable[dict], sign: int = 1) -> RollupDeltas:
+    """What storing bookings or blocks of ``kind`` adds to the rollups
+    (``sign=-1``: what deleting them takes away)"""
+    deltas: RollupDeltas = {}
+    for record in records:
+        nights = occupied_nights(record["checkIn"], record["checkOut"])
+        room_type = record["roomType"]
+        if kind in BLOCK_KINDS:
+            for night in nights:
+                _add(deltas, (room_type, night), "blockedUnits", sign)
+            continue
+        if (record.get("status") or "confirmed") not in ACTIVE_BOOKING_STATUSES:
+            continue
+        nightly = (record.get("totalPrice") or 0) / len(nights)
+        for night in nights:
+            _add(deltas, (room_type, night), "bookedUnits", sign)
+            _add(deltas, (room_type, night), "revenue", sign * nightly)
+        arrival = (room_type, nights[0])
+        _add(deltas, arrival, "arrivals", sign)
+        created_at = record.get("createdAt") or datetime.utcnow()
+        _add(deltas, arrival, "leadTimeDays", sign * lead_time_days(record["checkIn"], created_at))
+    return deltas
+
+
+def cancellation_deltas(booking: dict) -> RollupDeltas:
+    """Take back a booking and count its cancellation"""
+    deltas = stay_deltas(BOOKINGS, [booking], sign=-1)
+    first, _ = stay_dates(booking["checkIn"], booking["checkOut"])
+    _add(deltas, (booking["roomType"], first), "cancellations", 1)
+    return deltas
+
+
+def rollup_params(deltas: RollupDeltas) -> List[dict]:
+    """One dict per row with every field, in primary key order"""
+    return [
+        {"roomType": room_type, "night": night, **{field: row.get(field, 0) for field in ROLLUP_FIELDS}}
+        for (room_type, night), row in sorted(deltas.items())
+    ]
+
+
+def day_numbers(values: Sequence[datetime]) -> np.ndarray:
+    """Days since the epoch of the dates of naive UTC datetimes"""
+    return np.array(values, dtype="datetime64[us]").astype("datetime64[D]").astype("int64")
+
+
+def night_ranges(check_ins: Sequence[datetime], check_outs: Sequence[datetime]) -> Tuple[np.ndarray, np.ndarray]:
+    """Day numbers [first, end) of the nights stays occupy (``stay_dates``)"""
+    first = day_numbers(check_ins)
+    return first, np.maximum(day_numbers(check_outs), first + 1)
+
+
+class RollupBuilder:
+    """Rollups of many stays at once, fed column chunks of streamed rows.
+
+    Per room type, nightly counts and revenue are kept as difference
+    arrays over a day range that grows to fit the stays seen so far.
+    """
+
+    def __init__(self):
+        # room type -> (first day, field -> array over the days from it)
+        self.rooms: Dict[str, Tuple[int, Dict[str, np.ndarray]]] = {}
+
+    def _arrays(self, room_type: str, low: int, high: int) -> Tuple[int, Dict[str, np.ndarray]]:
+        """Arrays of a room type covering days [low, high]"""
+        origin, arrays = self.rooms.get(room_type, (low, None))
+        if arrays is None:
+            arrays = {field: np.zeros(high - low + 2) for field in ROLLUP_FIELDS}
+        else:
+            size = len(arrays["revenue"])
+            first, last = min(origin, low), max(origin + size, high + 2)
+            if first < origin or last > origin + size:
+                grown = {field: np.zeros(last - first) for field in ROLLUP_FIELDS}
+                for field in ROLLUP_FIELDS:
+                    grown[field][origin - first:origin - first + size] = arrays[field]
+                origin, arrays = first, grown
+        self.rooms[room_type] = (origin, arrays)
+        return origin, arrays
+
+    def _chunks(self, room_types: Sequence[str], first: np.ndarray, end: np.ndarray):
+        room_types = np.asarray(room_types, dtype=object)
+        stays = end > first
+        for room_type in set(room_types[stays]):
+            mask = stays & (room_types == room_type)
+            origin, arrays = self._arrays(room_type, int(first[mask].min()), int(end[mask].max()))
+            yield mask, first[mask] - origin, end[mask] - origin, arrays
+
+    def add_bookings(self, room_types: Sequence[str], check_ins: Sequence[datetime], check_outs: Sequence[datetime],
+                     total_prices: Sequence[float], created_ats: Sequence[datetime]):
+        """Add active bookings, given column by column"""
+        first, end = night_ranges(check_ins, check_outs)
+        prices = np.asarray(total_prices, dtype=float)
+        created = day_numbers(created_ats)
+        # No lead time for bookings without a creation time
+        lead = np.where(np.isnat(created.astype("datetime64[D]")), 0, np.maximum(first - created, 0))
+        for mask, start, stop, arrays in self._chunks(room_types, first, end):
+            nightly = prices[mask] / (stop - start)
+            np.add.at(arrays["bookedUnits"], start, 1)
+            np.add.at(arrays["bookedUnits"], stop, -1)
+            np.add.at(arrays["revenue"], start, nightly)
+            np.add.at(arrays["revenue"], stop, -nightly)
+            np.add.at(arrays["arrivals"], start, 1)
+            np.add.at(arrays["leadTimeDays"], start, lead[mask])
+
+    def add_blocks(self, room_types: Sequence[str], check_ins: Sequence[datetime], check_outs: Sequence[datetime]):
+        first, end = night_ranges(check_ins, check_outs)
+        for _, start, stop, arrays in self._chunks(room_types, first, end):
+            np.add.at(arrays["blockedUnits"], start, 1)
+            np.add.at(arrays["blockedUnits"], stop, -1)
+
+    def add_cancellations(self, room_type: str, night: date, cancellations: int):
+        day = (night - EPOCH).days
+        origin, arrays = self._arrays(room_type, day, day)
+        arrays["cancellations"][day - origin] += cancellations
+
+    def rows(self) -> List[dict]:
+        """Every non-empty rollup row"""
+        rows = []
+        for room_type in sorted(self.rooms):
+            origin, arrays = self.rooms[room_type]
+            columns = {
+                "bookedUnits": np.cumsum(arrays["bookedUnits"]).round().astype(int),
+                "blockedUnits": np.cumsum(arrays["blockedUnits"]).round().astype(int),
+                "revenue": np.cumsum(arrays["revenue"]).round(6),
+                "arrivals": arrays["arrivals"].astype(int),
+                "cancellations": arrays["cancellations"].astype(int),
+                "leadTimeDays": arrays["leadTimeDays"].astype(int),
+            }
+            used = np.zeros(len(arrays["revenue"]), dtype=bool)
+            for values in columns.values():
+                used |= values != 0
+            for index in np.flatnonzero(used):
+                rows.append({
+                    "roomType": room_type, "night": EPOCH + timedelta(days=int(origin + index)),
+                    **{field: columns[field][index].item() for field in ROLLUP_FIELDS},
+                })
+        return rows
+
+
+def ratio(numerator: float, denominator: float, digits: int = 4):
+    return round(numerator / denominator, digits) if denominator else None
+
+
+def summarize(totals: Dict[str, float], available: float) -> dict:
+    totals = {field: float(value) for field, value in totals.items()}
+    available = float(available)
+    sold = totals["bookedUnits"]
+    return {
+        "roomNightsAvailable": int(available),
+        "roomNightsBooked": int(sold),
+        "roomNightsBlocked": int(totals["blockedUnits"]),
+        "occupancy": ratio(sold + totals["blockedUnits"], available),
+        "revenue": round(totals["revenue"], 2),
+        "adr": ratio(totals["revenue"], sold, 2),
+        "revpar": ratio(totals["revenue"], available, 2),
+        "arrivals": int(totals["arrivals"]),
+        "cancellations": int(totals["cancellations"]),
+        "cancellationRate": ratio(totals["cancellations"], totals["arrivals"] + totals["cancellations"]),
+        "avgLeadTimeDays": ratio(totals["leadTimeDays"], totals["arrivals"], 1),
+    }
+
+
+def analytics_report(rows: Iterable[tuple], rooms: Dict[str, int], start: date, end: date,
+                     nightly: bool = False) -> dict:
+    """Report over the nights [start, end) for the room types in ``rooms``
+    (id -> units), from (roomType, night, *ROLLUP_FIELDS) rollup rows.
+    With ``nightly`` each room type also gets its per-night series."""
+    room_types = list(rooms)
+    position = {room_type: index for index, room_type in enumerate(room_types)}
+    days = (end - start).days
+    grid = np.zeros((len(ROLLUP_FIELDS), len(room_types), days))
+    rows = [row for row in rows if row[0] in position and start <= row[1] < end]
+    if rows:
+        room_index = np.array([position[row[0]] for row in rows])
+        day_index = np.array([(row[1] - start).days for row in rows])
+        values = np.array([row[2:] for row in rows], dtype=float).T
+        for field_index in range(len(ROLLUP_FIELDS)):
+            np.add.at(grid[field_index], (room_index, day_index), values[field_index])
+    units = np.array([rooms[room_type] for room_type in room_types], dtype=float)
+    totals = grid.sum(axis=2)
+
+    report = {"start": start, "end": end, "rooms": {}}
+    if nightly:
+        report["nights"] = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+    booked, blocked, revenue = (grid[ROLLUP_FIELDS.index(field)] for field in ("bookedUnits", "blockedUnits", "revenue"))
+    for index, room_type in enumerate(room_types):
+        entry = {
+            "totalUnits": int(units[index]),
+            "summary": summarize(dict(zip(ROLLUP_FIELDS, totals[:, index])), units[index] * days),
+        }
+        if nightly:
+            occupancy = (booked[index] + blocked[index]) / units[index] if units[index] else np.zeros(days)
+            entry["occupancy"] = np.round(occupancy, 4).tolist()
+            entry["booked"] = booked[index].astype(int).tolist()
+            entry["blocked"] = blocked[index].astype(int).tolist()
+            entry["revenue"] = np.round(revenue[index], 2).tolist()
+        report["rooms"][room_type] = entry
+    report["summary"] = summarize(dict(zip(ROLLUP_FIELDS, totals.sum(axis=1))), units.sum() * days)
+    return report
@@ -0,0 +1,87 @@
+"""Archival of past stays.
+
+Bookings and blocks whose stay ended more than ``ARCHIVE_AFTER_DAYS`` ago
+are moved, ids and all, from the live tables (collections) into their
+archive kinds (``listings.ARCHIVE_KINDS``). Availability checks, the
+calendar and the admin listings then only scan current and future
+inventory, however much history accumulates; archived records stay
+readable through the ``/api/admin/archive`` endpoints.
+
+API processes archive in the background unless ``ARCHIVE_WORKER=false``;
+several workers may run it at once. ``python archive.py`` archives once
+against the configured storage backend, for cron.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+
+from db_pool import env_flag
+from listings import ARCHIVE_KINDS
+from metrics import ARCHIVED_RECORDS
+
+logger = logging.getLogger(__name__)
+
+# The availability index loads stays from yesterday on, so anything that
+# ended before today is safe to move; keep a month for day-to-day admin work
+ARCHIVE_AFTER_DAYS = max(1, int(os.environ.get("ARCHIVE_AFTER_DAYS", "30")))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "1000"))
+# Seconds between archive runs
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_WORKER = env_flag("ARCHIVE_WORKER", True)
+
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Stays that checked out by this time are archived"""
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+async def archive_past_stays(storage, before: Optional[datetime] = None,
+                             batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """Archive every stay that ended by ``before`` (default ``archive_cutoff()``)
+    in batches of ``batch_size``; returns how many records of each kind moved"""
+    before = before or archive_cutoff()
+    moved = {}
+    for kind in ARCHIVE_KINDS:
+        moved[kind] = 0
+        while True:
+            count = await storage.archive_stays(kind, before, batch_size)
+            moved[kind] += count
+            ARCHIVED_RECORDS.inc((kind,), count)
+            if count < batch_size:
+                break
+    return moved
+
+
+async def run_archiver(storage, interval: float = ARCHIVE_INTERVAL):
+    """Archive past stays every ``interval`` seconds; run as a background task"""
+    while True:
+        try:
+            moved = await archive_past_stays(storage)
+            if any(moved.values()):
+                logger.info("Archived past stays: %s", ", ".join(f"{count} {kind}" for kind, count in moved.items()))
+        except Exception:
+            logger.exception("Archiving past stays failed")
+        await asyncio.sleep(interval)
+
+
+async def run_once():
+    from server import build_storage
+
+    storage = build_storage()
+    await storage.startup()
+    try:
+        print(await archive_past_stays(storage))
+    finally:
+        await storage.shutdown()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_once())
+
+
+if __name__ == "__main__":
+    main()
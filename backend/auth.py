@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Header
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
+import bcrypt
+import hashlib
+import hmac
+import jwt
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# JWT Secret
+JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
+JWT_ALGORITHM = "HS256"
+
+# Admin credentials; set ADMIN_PASSWORD_HASH to a bcrypt hash in production
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD_HASH = os.environ.get("ADMIN_PASSWORD_HASH")
+
+# Highest bcrypt cost we generate or accept without warning that logins
+# will be slow, and the cost used for hashes we generate
+ADMIN_BCRYPT_MAX_ROUNDS = 12
+ADMIN_BCRYPT_ROUNDS = min(int(os.environ.get("ADMIN_BCRYPT_ROUNDS", "10")), ADMIN_BCRYPT_MAX_ROUNDS)
+
+# Concurrent bcrypt checks; extra login attempts queue instead of
+# saturating every core
+LOGIN_CONCURRENCY = int(os.environ.get("LOGIN_CONCURRENCY", "2"))
+
+# Verified-token cache bounds
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+
+# Lifetime of the tokens that open an admin event stream, in seconds
+STREAM_TOKEN_TTL = int(os.environ.get("STREAM_TOKEN_TTL", "60"))
+# Scope of those tokens; scoped tokens are not admin tokens
+STREAM_SCOPE = "events"
+
+
+def hash_password(password: str, rounds: int = ADMIN_BCRYPT_ROUNDS) -> bytes:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds))
+
+
+def bcrypt_rounds(hashed: bytes) -> int:
+    return int(hashed.split(b"$")[2])
+
+
+def load_admin_password_hash() -> bytes:
+    if ADMIN_PASSWORD_HASH:
+        hashed = ADMIN_PASSWORD_HASH.encode()
+        if bcrypt_rounds(hashed) > ADMIN_BCRYPT_MAX_ROUNDS:
+            logger.warning("ADMIN_PASSWORD_HASH uses more than %s bcrypt rounds; logins will be slow",
+                           ADMIN_BCRYPT_MAX_ROUNDS)
+        return hashed
+    return hash_password(os.environ.get("ADMIN_PASSWORD", "admin123"))
+
+
+_admin_password_hash: Optional[bytes] = None
+_login_slots = asyncio.Semaphore(LOGIN_CONCURRENCY)
+
+
+async def check_admin_credentials(username: str, password: str) -> bool:
+    """Constant-time check of admin credentials against the stored bcrypt hash.
+
+    The hash is checked even when the username is wrong, so response time
+    does not reveal which of the two was rejected.
+    """
+    global _admin_password_hash
+    async with _login_slots:
+        if _admin_password_hash is None:
+            _admin_password_hash = await run_in_threadpool(load_admin_password_hash)
+        password_ok = await run_in_threadpool(bcrypt.checkpw, password.encode(), _admin_password_hash)
+    username_ok = hmac.compare_digest(username.encode(), ADMIN_USERNAME.encode())
+    return username_ok and password_ok
+
+
+class TokenCache:
+    """Bounded LRU of verified token claims, keyed by token digest.
+
+    Entries expire after ``ttl`` seconds or at the token's own ``exp``,
+    whichever comes first.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, claims = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return claims
+
+    def put(self, token: str, claims: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        key = self.key(token)
+        self._entries[key] = (expires_at, claims)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def create_jwt_token(username: str) -> str:
+    payload = {
+        "username": username,
+        "exp": datetime.utcnow() + timedelta(hours=24)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def create_stream_token(username: str) -> str:
+    """Short-lived token that only opens an event stream. It goes in the
+    stream URL (EventSource cannot send headers), where proxies and access
+    logs see it, so it must not be worth more than that."""
+    payload = {
+        "username": username,
+        "scope": STREAM_SCOPE,
+        "exp": datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_TTL)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def verify_stream_token(token: str) -> dict:
+    payload = verify_jwt_token(token)
+    if payload.get("scope") != STREAM_SCOPE:
+        raise HTTPException(status_code=401, detail="Invalid stream token")
+    return payload
+
+
+def verify_jwt_token(token: str) -> dict:
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.put(token, payload)
+    return payload
+
+
+async def verify_admin_token(authorization: Optional[str] = Header(None)):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+
+    try:
+        token = authorization.replace("Bearer ", "")
+        payload = verify_jwt_token(token)
+        if "scope" in payload:
+            raise HTTPException(status_code=401, detail="Scoped token")
+        return payload
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
@@ -0,0 +1,205 @@
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+# Seconds a loaded room type stays valid without a local write; bounds how
+# long writes made by other workers can go unseen
+AVAILABILITY_INDEX_TTL = float(os.environ.get("AVAILABILITY_INDEX_TTL", "30"))
+
+# Bookings that hold inventory
+ACTIVE_BOOKING_STATUSES = ("confirmed",)
+
+# Backend coroutine returning the (bookings, blocks) intervals of a room type
+# still open after a given instant
+OccupancyLoader = Callable[[str, datetime], Awaitable[Tuple[list, list]]]
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Normalize a datetime to the naive UTC form stored in the database"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def max_concurrent(intervals: Iterable[Tuple[datetime, datetime]], start: datetime, end: datetime) -> int:
+    """Peak number of intervals open at any instant of [start, end)"""
+    events = []
+    for check_in, check_out in intervals:
+        events.append((max(check_in, start), 1))
+        events.append((min(check_out, end), -1))
+    # Departures sort before arrivals at the same instant
+    events.sort()
+    peak = current = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+class IntervalIndex:
+    """Half-open intervals sorted by start.
+
+    Every stored interval is at most ``max_length`` long, so anything that
+    overlaps [start, end) must begin inside [start - max_length, end). Both
+    ends of that window are found by bisection.
+    """
+
+    def __init__(self, intervals: Iterable[tuple]):
+        self.items = sorted(intervals, key=lambda item: item[0])
+        self.starts = [item[0] for item in self.items]
+        self.max_length = max((item[1] - item[0] for item in self.items), default=timedelta(0))
+
+    def overlapping(self, start: datetime, end: datetime) -> List[tuple]:
+        lo = bisect_left(self.starts, start - self.max_length)
+        hi = bisect_left(self.starts, end)
+        return [item for item in self.items[lo:hi] if item[1] > start]
+
+
+class RoomTypeOccupancy:
+    """Occupancy of one room type from its bookings and per-unit blocks"""
+
+    def __init__(self, horizon: datetime, bookings: Iterable[tuple], blocks: Iterable[tuple]):
+        self.horizon = horizon
+        self.bookings = IntervalIndex(bookings)
+        # Blocks are (checkIn, checkOut, roomUnit)
+        self.blocks = IntervalIndex(blocks)
+
+    def covers(self, check_in: datetime) -> bool:
+        return check_in >= self.horizon
+
+    def occupied(self, check_in: datetime, check_out: datetime) -> Tuple[int, int]:
+        """Return (blocked units, booked units) for a stay"""
+        blocked_units = {unit for _, _, unit in self.blocks.overlapping(check_in, check_out)}
+        booked = max_concurrent(self.bookings.overlapping(check_in, check_out), check_in, check_out)
+        return len(blocked_units), booked
+
+
+class AvailabilityIndex:
+    """Process-wide occupancy index, loaded lazily per room type.
+
+    Only stays that end after the load-time horizon (yesterday) are kept in
+    memory; the rare query that starts before the horizon is answered
+    straight from the backend.
+    """
+
+    def __init__(self, ttl: float = AVAILABILITY_INDEX_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, RoomTypeOccupancy]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def invalidate(self, *room_types: str):
+        if not room_types:
+            self._entries.clear()
+        for room_type in room_types:
+            self._entries.pop(room_type, None)
+
+    def _fresh(self, room_type: str) -> Optional[RoomTypeOccupancy]:
+        entry = self._entries.get(room_type)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    async def occupancy(self, load: OccupancyLoader, room_type: str) -> RoomTypeOccupancy:
+        occupancy = self._fresh(room_type)
+        if occupancy is not None:
+            return occupancy
+        lock = self._locks.setdefault(room_type, asyncio.Lock())
+        async with lock:
+            # Another request may have reloaded while we waited
+            occupancy = self._fresh(room_type)
+            if occupancy is None:
+                loaded_at = time.monotonic()
+                horizon = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+                bookings, blocks = await load(room_type, horizon)
+                occupancy = RoomTypeOccupancy(horizon, bookings, blocks)
+                self._entries[room_type] = (loaded_at, occupancy)
+            return occupancy
+
+    async def check(self, load: OccupancyLoader, room_type: str, total_units: int,
+                    check_in: datetime, check_out: datetime, consistent: bool = False) -> dict:
+        """Availability of a room type for a stay.
+
+        ``consistent`` bypasses the index and calls ``load`` directly, for
+        checks that guard a write (e.g. inside the caller's transaction).
+        """
+        check_in, check_out = to_naive_utc(check_in), to_naive_utc(check_out)
+        occupancy = None if consistent else await self.occupancy(load, room_type)
+        if occupancy is None or not occupancy.covers(check_in):
+            bookings, blocks = await load(room_type, check_in)
+            occupancy = RoomTypeOccupancy(check_in, bookings, blocks)
+        blocked, booked = occupancy.occupied(check_in, check_out)
+        return {
+            "roomType": room_type,
+            "totalUnits": total_units,
+            "blockedUnits": blocked,
+            "bookedUnits": booked,
+            "availableUnits": max(0, total_units - blocked - booked),
+        }
+
+
+def stay_dates(check_in: datetime, check_out: datetime) -> Tuple[date, date]:
+    """First night a stay occupies and the date after its last.
+
+    A stay occupies the nights of its check-in date up to, but excluding,
+    its check-out date (UTC dates, whatever the times of day); a same-day
+    stay occupies its single date.
+    """
+    first = check_in.date()
+    return first, max(check_out.date(), first + timedelta(days=1))
+
+
+def night_span(check_in: datetime, check_out: datetime, start: date, nights: int) -> Tuple[int, int]:
+    """Indexes [first, last) of the window nights a stay occupies (``stay_dates``)"""
+    first_night, end = stay_dates(check_in, check_out)
+    first, last = (first_night - start).days, (end - start).days
+    return max(first, 0), min(last, nights)
+
+
+def calendar_window(start: date, end: date) -> Tuple[datetime, datetime]:
+    """Naive datetimes bounding the nights [start, end)"""
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+
+
+def availability_calendar(rooms: Dict[str, int], stays: Iterable[tuple], start: date, end: date) -> dict:
+    """Per-night availability matrix for several room types over [start, end).
+
+    ``rooms`` maps room type to its unit count. ``stays`` are the bookings and
+    blocks overlapping the window as (roomType, roomUnit, checkIn, checkOut),
+    with a ``None`` roomUnit for bookings.
+    """
+    nights = (end - start).days
+    booked = {room_type: [0] * nights for room_type in rooms}
+    units = {
+        room_type: {str(unit): [False] * nights for unit in range(1, total + 1)}
+        for room_type, total in rooms.items()
+    }
+    for room_type, room_unit, check_in, check_out in stays:
+        first, last = night_span(check_in, check_out, start, nights)
+        if room_unit is None:
+            row = booked[room_type]
+            for night in range(first, last):
+                row[night] += 1
+        else:
+            row = units[room_type].setdefault(room_unit, [False] * nights)
+            for night in range(first, last):
+                row[night] = True
+
+    matrix = {}
+    for room_type, total in rooms.items():
+        blocked = [sum(flags) for flags in zip(*units[room_type].values())] or [0] * nights
+        matrix[room_type] = {
+            "totalUnits": total,
+            "available": [max(0, total - b - n) for b, n in zip(blocked, booked[room_type])],
+            "booked": booked[room_type],
+            "blockedUnits": units[room_type],
+        }
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "nights": [(start + timedelta(days=i)).isoformat() for i in range(nights)],
+        "rooms": matrix,
+    }
+
@@ -0,0 +1,206 @@
+"""Push of availability and booking changes over Server-Sent Events.
+
+Routes that change inventory publish a compact event to ``broadcaster``
+once their write has committed, and ``GET /api/events`` streams the events
+to every subscriber, so open booking dialogs and admin dashboards stay
+current without polling the database. Topics:
+
+- ``availability`` (public): ``{"roomType", "checkIn", "checkOut"}`` of a
+  stay whose availability changed, with both dates ``null`` when any night
+  may have (expired holds). Clients re-check the stays it overlaps.
+- ``bookings`` (admin): ``booking.created``, ``booking.cancelled``,
+  ``block.created`` and ``block.deleted`` carrying the record as the
+  listings return it. Browsers open it with a stream token from ``POST
+  /api/events/token`` in the ``token`` query parameter: it expires after
+  ``STREAM_TOKEN_TTL`` seconds and opens nothing but streams, since URLs
+  are written to access logs.
+
+Each subscriber has a queue of ``SSE_QUEUE_SIZE`` events. One that falls
+that far behind gets a single ``resync`` event instead of the backlog and
+should reload what it shows; so does a client reconnecting with a
+``Last-Event-ID`` older than the last ``SSE_REPLAY`` events, which are
+replayed to clients that reconnect in time. Event ids are
+``<boot>-<n>``, ``boot`` being drawn when the process starts, so a
+``Last-Event-ID`` issued before a restart (or by another worker) gets
+``resync`` rather than the unrelated events that reuse its number.
+
+The broadcaster is in-process: with several API workers a stream only
+carries the writes its own worker handled, so run the workers behind a
+proxy that sends ``/api/events`` to one of them, or treat pushed events as
+hints and keep a slow refresh.
+"""
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+import asyncio
+import os
+import secrets
+
+from metrics import LIVE_EVENTS, LIVE_RESYNCS, LIVE_SUBSCRIBERS
+from serialization import dumps
+
+# Events a subscriber may fall behind by before it is sent resync instead
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "256"))
+# Recent events kept for clients reconnecting with Last-Event-ID
+SSE_REPLAY = int(os.environ.get("SSE_REPLAY", "1024"))
+# Seconds between keep-alive comments on an idle stream
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "15"))
+# Open streams per worker; more are refused with 503
+SSE_MAX_SUBSCRIBERS = int(os.environ.get("SSE_MAX_SUBSCRIBERS", "1000"))
+# Reconnect delay suggested to clients, in milliseconds
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "3000"))
+
+AVAILABILITY = "availability"
+BOOKINGS = "bookings"
+TOPICS = (AVAILABILITY, BOOKINGS)
+# Topics that carry guest details
+ADMIN_TOPICS = frozenset({BOOKINGS})
+
+BLOCK_CREATED = "block.created"
+BLOCK_DELETED = "block.deleted"
+RESYNC = "resync"
+
+
+class Event(NamedTuple):
+    id: int
+    topic: str
+    type: str
+    room_type: Optional[str]
+    data: dict
+
+    def encode(self, boot: str) -> bytes:
+        return b"id: %s-%d\nevent: %s\ndata: %s\n\n" % (boot.encode(), self.id, self.type.encode(), dumps(self.data))
+
+
+class Subscription:
+    """Events of some topics (and room types; all when empty) for one stream"""
+
+    def __init__(self, topics: FrozenSet[str], room_types: FrozenSet[str]):
+        self.topics = topics
+        self.room_types = room_types
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue(SSE_QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+    def wants(self, event: Event) -> bool:
+        return event.topic in self.topics and (
+            not self.room_types or event.room_type is None or event.room_type in self.room_types
+        )
+
+    def push(self, event: Event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+def resync(boot: str, event_id: int) -> bytes:
+    return b"id: %s-%d\nevent: %s\ndata: {}\n\n" % (boot.encode(), event_id, RESYNC.encode())
+
+
+class Broadcaster:
+    """Fans events out to every subscription in the process"""
+
+    def __init__(self, replay: int = SSE_REPLAY, max_subscribers: int = SSE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscriptions: Set[Subscription] = set()
+        self.recent: Deque[Event] = deque(maxlen=replay)
+        self.last_id = 0
+        # Tells this process's event ids from those of earlier ones
+        self.boot = secrets.token_hex(4)
+
+    def publish(self, topic: str, event_type: str, data: dict, room_type: Optional[str] = None):
+        self.last_id += 1
+        event = Event(self.last_id, topic, event_type, room_type, data)
+        self.recent.append(event)
+        LIVE_EVENTS.inc((event_type,))
+        for subscription in self.subscriptions:
+            if subscription.wants(event):
+                subscription.push(event)
+
+    @property
+    def full(self) -> bool:
+        """Whether the worker already serves ``SSE_MAX_SUBSCRIBERS`` streams"""
+        return len(self.subscriptions) >= self.max_subscribers
+
+    def _replay(self, subscription: Subscription, last_event_id: str) -> Optional[List[Event]]:
+        """Events after ``last_event_id`` for a reconnecting subscription, or
+        ``None`` when some of them are no longer kept (or the id was issued
+        by another process)"""
+        boot, _, number = last_event_id.partition("-")
+        if boot != self.boot or not number.isdigit():
+            return None
+        last_event_id = int(number)
+        if last_event_id > self.last_id:
+            return None
+        if last_event_id < self.last_id and (not self.recent or self.recent[0].id > last_event_id + 1):
+            return None
+        return [event for event in self.recent if event.id > last_event_id and subscription.wants(event)]
+
+    async def stream(self, topics: Iterable[str], room_types: Iterable[str] = (), last_event_id: Optional[str] = None,
+                     heartbeat: float = SSE_HEARTBEAT) -> AsyncIterator[bytes]:
+        """SSE body with the events of ``topics`` for ``room_types`` (all
+        when empty), subscribed for as long as it is iterated. Check
+        ``full`` before starting one. ``last_event_id`` is the client's
+        ``Last-Event-ID`` header, if any."""
+        subscription = Subscription(frozenset(topics), frozenset(room_types))
+        self.subscriptions.add(subscription)
+        LIVE_SUBSCRIBERS.set((), len(self.subscriptions))
+        try:
+            yield b"retry: %d\n\n" % SSE_RETRY_MS
+            if last_event_id is not None:
+                missed = self._replay(subscription, last_event_id)
+                if missed is None:
+                    LIVE_RESYNCS.inc(("replay",))
+                    yield resync(self.boot, self.last_id)
+                else:
+                    for event in missed:
+                        yield event.encode(self.boot)
+            while not subscription.closed:
+                if subscription.overflowed:
+                    # Drop the backlog; the client reloads instead
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.overflowed = False
+                    LIVE_RESYNCS.inc(("overflow",))
+                    yield resync(self.boot, self.last_id)
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is not None:
+                    yield event.encode(self.boot)
+        finally:
+            self.subscriptions.discard(subscription)
+            LIVE_SUBSCRIBERS.set((), len(self.subscriptions))
+
+    def close(self):
+        """End every open stream, on shutdown"""
+        for subscription in list(self.subscriptions):
+            subscription.close()
+
+
+broadcaster = Broadcaster()
+
+
+def publish_availability(room_type: str, check_in: Optional[datetime] = None, check_out: Optional[datetime] = None):
+    broadcaster.publish(AVAILABILITY, AVAILABILITY, {
+        "roomType": room_type, "checkIn": check_in, "checkOut": check_out,
+    }, room_type)
+
+
+def publish_change(event_type: str, record: dict):
+    """A booking or block change: its record to admins, its stay to everyone"""
+    broadcaster.publish(BOOKINGS, event_type, record, record["roomType"])
+    publish_availability(record["roomType"], record["checkIn"], record["checkOut"])
@@ -0,0 +1,59 @@
+from typing import Optional, Tuple
+import asyncio
+import hashlib
+import os
+import time
+
+from serialization import dumps
+
+# Seconds before the cached catalog is reloaded even without a local write,
+# so room edits made through another worker still show up
+ROOM_CATALOG_TTL = float(os.environ.get("ROOM_CATALOG_TTL", "300"))
+ROOM_CATALOG_MAX_AGE = int(os.environ.get("ROOM_CATALOG_MAX_AGE", "60"))
+ROOM_CATALOG_CACHE_CONTROL = f"public, max-age={ROOM_CATALOG_MAX_AGE}, must-revalidate"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class RoomCatalog:
+    """Serialized room catalog shared by every request in the process"""
+
+    def __init__(self, ttl: float = ROOM_CATALOG_TTL):
+        self.ttl = ttl
+        self._entry: Optional[Tuple[float, bytes, str]] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._entry = None
+
+    def _fresh(self) -> Optional[Tuple[bytes, str]]:
+        entry = self._entry
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1], entry[2]
+        return None
+
+    async def load(self, storage) -> Tuple[bytes, str]:
+        loaded_at = time.monotonic()
+        rooms = sorted(await storage.list_rooms(), key=lambda room: room["id"])
+        body = dumps(rooms)
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self._entry = (loaded_at, body, etag)
+        return body, etag
+
+    async def get(self, storage) -> Tuple[bytes, str]:
+        """Return the catalog JSON body and its ETag"""
+        cached = self._fresh()
+        if cached:
+            return cached
+        async with self._lock:
+            return self._fresh() or await self.load(storage)
+
+
+room_catalog = RoomCatalog()
+
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, JSON, Date, DateTime, Boolean, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -18,6 +18,27 @@ class Room(Base):
     maxGuests = Column(Integer, nullable=False)
 
 
+class RateRule(Base):
+    """Multiplier on nightly rates or stay totals of one room type, or all when roomType is null (see pricing.py)"""
+    __tablename__ = "rate_rules"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    roomType = Column(String(50))
+    # night, stay or occupancy
+    kind = Column(String(20), nullable=False)
+    adjustment = Column(Float, nullable=False)
+    # night rules: nights in [start, end) on these weekdays (Monday is 0)
+    start = Column(Date)
+    end = Column(Date)
+    weekdays = Column(JSON)
+    # stay rules: stays of at least this many nights
+    minNights = Column(Integer)
+    # occupancy rules: nights with at least this share of units taken
+    minOccupancy = Column(Float)
+    description = Column(String(200))
+    createdAt = Column(DateTime, default=func.now())
+
+
 class Booking(Base):
     __tablename__ = "bookings"
     
@@ -35,6 +56,12 @@ class Booking(Base):
     status = Column(String(50), default="confirmed")
     createdAt = Column(DateTime, default=func.now())
 
+    __table_args__ = (
+        Index("ix_bookings_roomType_checkIn_checkOut", "roomType", "checkIn", "checkOut"),
+        Index("ix_bookings_createdAt_id", "createdAt", "id"),
+        Index("ix_bookings_checkOut", "checkOut"),
+    )
+
 
 class BlockedBooking(Base):
     __tablename__ = "blocked_bookings"
@@ -48,3 +75,148 @@ class BlockedBooking(Base):
     checkOut = Column(DateTime, nullable=False)
     reason = Column(String(500), default="Offline booking")
     createdAt = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_blocked_bookings_roomType_checkIn_checkOut", "roomType", "checkIn", "checkOut"),
+        Index("ix_blocked_bookings_roomType_roomUnit_checkIn", "roomType", "roomUnit", "checkIn"),
+        Index("ix_blocked_bookings_createdAt_id", "createdAt", "id"),
+        Index("ix_blocked_bookings_checkOut", "checkOut"),
+    )
+
+
+class BookingArchive(Base):
+    """Booking whose stay ended before the archive cutoff, moved out of ``bookings`` with its id"""
+    __tablename__ = "bookings_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    roomType = Column(String(50), nullable=False)
+    roomName = Column(String(100), nullable=False)
+    checkIn = Column(DateTime, nullable=False)
+    checkOut = Column(DateTime, nullable=False)
+    guests = Column(String(10), nullable=False)
+    fullName = Column(String(200), nullable=False)
+    email = Column(String(200), nullable=False)
+    phone = Column(String(50))
+    nights = Column(Integer, nullable=False)
+    totalPrice = Column(Float, nullable=False)
+    status = Column(String(50), default="confirmed")
+    createdAt = Column(DateTime)
+    archivedAt = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_bookings_archive_roomType_checkIn", "roomType", "checkIn"),
+        Index("ix_bookings_archive_createdAt_id", "createdAt", "id"),
+    )
+
+
+class BlockedBookingArchive(Base):
+    """Block whose stay ended before the archive cutoff, moved out of ``blocked_bookings`` with its id"""
+    __tablename__ = "blocked_bookings_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    roomId = Column(String(100), nullable=False)
+    roomType = Column(String(50), nullable=False)
+    roomName = Column(String(100), nullable=False)
+    roomUnit = Column(String(10), nullable=False)
+    checkIn = Column(DateTime, nullable=False)
+    checkOut = Column(DateTime, nullable=False)
+    reason = Column(String(500), default="Offline booking")
+    createdAt = Column(DateTime)
+    archivedAt = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_blocked_bookings_archive_roomType_checkIn", "roomType", "checkIn"),
+        Index("ix_blocked_bookings_archive_createdAt_id", "createdAt", "id"),
+    )
+
+
+class InventoryHold(Base):
+    """Unit of a room type reserved for a stay until expiresAt; counts as a booking meanwhile"""
+    __tablename__ = "inventory_holds"
+
+    id = Column(String(64), primary_key=True)
+    roomType = Column(String(50), nullable=False)
+    checkIn = Column(DateTime, nullable=False)
+    checkOut = Column(DateTime, nullable=False)
+    expiresAt = Column(DateTime, nullable=False)
+    # Address of the client that placed it, and the SHA-256 of its release token
+    client = Column(String(64), nullable=True)
+    releaseTokenHash = Column(String(64), nullable=True)
+    createdAt = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_inventory_holds_roomType_checkIn_checkOut", "roomType", "checkIn", "checkOut"),
+        Index("ix_inventory_holds_expiresAt", "expiresAt"),
+        Index("ix_inventory_holds_client", "client"),
+    )
+
+
+class InventoryNight(Base):
+    """One lock row per room type and night; reservations touching a night serialize on it"""
+    __tablename__ = "inventory_nights"
+
+    roomType = Column(String(50), primary_key=True)
+    night = Column(Date, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class DailyRollup(Base):
+    """Bookings, blocks and revenue of one room type on one night, kept current by booking writes (see analytics.py)"""
+    __tablename__ = "daily_rollups"
+
+    roomType = Column(String(50), primary_key=True)
+    night = Column(Date, primary_key=True)
+    bookedUnits = Column(Integer, nullable=False, default=0, server_default="0")
+    blockedUnits = Column(Integer, nullable=False, default=0, server_default="0")
+    revenue = Column(Float, nullable=False, default=0, server_default="0")
+    # Bookings arriving this night, their summed lead time, and cancelled ones
+    arrivals = Column(Integer, nullable=False, default=0, server_default="0")
+    leadTimeDays = Column(Integer, nullable=False, default=0, server_default="0")
+    cancellations = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class OutboxEvent(Base):
+    """Side effect of a booking change, written in the change's transaction and drained by the outbox worker"""
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False)
+    # pending until delivered (and deleted) or out of attempts (failed)
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # Next attempt; pushed forward while a worker holds the event and after failures
+    availableAt = Column(DateTime, nullable=False)
+    lastError = Column(Text)
+    createdAt = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_outbox_events_status_availableAt", "status", "availableAt"),
+    )
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(200), nullable=False)
+    appliedAt = Column(DateTime, default=func.now())
+
+
+class IdempotencyKey(Base):
+    """Outcome of a request sent with an Idempotency-Key header, replayed to retries until it expires"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(300), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # Null while the first request is still running
+    statusCode = Column(Integer)
+    response = Column(JSON)
+    # A running request that has not finished by then is presumed dead
+    lockedUntil = Column(DateTime, nullable=False)
+    expiresAt = Column(DateTime, nullable=False)
+    createdAt = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expiresAt", "expiresAt"),
+    )
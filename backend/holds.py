@@ -0,0 +1,60 @@
+"""Short-lived inventory holds.
+
+A hold reserves one unit of a room type for a stay while the guest
+completes checkout. Active holds count as booked units in every
+availability answer, so a booking that presents its hold (``holdId``) is
+converted without another availability check. Expired holds stop counting
+at once for checks that guard a write; the sweeper deletes them, drops
+the cached occupancy of their room types and tells open booking dialogs
+to re-check them.
+
+Holds need no login, so one client (by address, as admission control
+sees it) may have at most ``HOLD_MAX_PER_CLIENT`` active at once, and
+giving one back early takes the release token returned when it was
+placed, not just its id.
+"""
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+
+from broadcast import publish_availability
+
+logger = logging.getLogger(__name__)
+
+HOLD_TTL = timedelta(minutes=float(os.environ.get("HOLD_TTL_MINUTES", "10")))
+# Seconds between sweeps for expired holds
+HOLD_SWEEP_INTERVAL = float(os.environ.get("HOLD_SWEEP_INTERVAL", "5"))
+# Active holds one client may have at once
+HOLD_MAX_PER_CLIENT = int(os.environ.get("HOLD_MAX_PER_CLIENT", "3"))
+
+
+def new_hold_id() -> str:
+    """Unguessable id: presenting it is what lets a booking use the hold"""
+    return secrets.token_urlsafe(16)
+
+
+def new_release_token() -> str:
+    """Secret handed out once with a new hold; releasing the hold takes it"""
+    return secrets.token_urlsafe(16)
+
+
+def release_token_hash(token: str) -> str:
+    """What is stored of a release token"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def sweep_expired_holds(storage, interval: float = HOLD_SWEEP_INTERVAL):
+    """Delete expired holds every ``interval`` seconds; run as a background task"""
+    while True:
+        try:
+            room_types = await storage.expire_holds(datetime.utcnow())
+            if room_types:
+                logger.debug("Expired holds released inventory of %s", ", ".join(room_types))
+            for room_type in room_types:
+                publish_availability(room_type)
+        except Exception:
+            logger.exception("Sweeping expired holds failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,134 @@
+"""Idempotency-Key support for endpoints that create things.
+
+A client that may retry a request sends the same ``Idempotency-Key``
+header with every attempt. The first attempt claims the key in the storage
+backend and runs; its outcome (status code and body, including 4xx errors)
+is kept for ``IDEMPOTENCY_KEY_TTL`` and replayed to later attempts without
+running the handler again. An attempt that arrives while the first is still
+running waits for it rather than racing it. Reusing a key for a different
+request body is rejected.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from metrics import IDEMPOTENT_REQUESTS
+from serialization import JSONBytesResponse
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=float(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", "24")))
+# A claimed key whose request has not finished after this long is presumed
+# abandoned (the worker died) and the next attempt runs the request again
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=float(os.environ.get("IDEMPOTENCY_LOCK_TIMEOUT", "60")))
+# How long an attempt waits for a running one before answering 409
+IDEMPOTENCY_WAIT = float(os.environ.get("IDEMPOTENCY_WAIT", "10"))
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+IDEMPOTENCY_PURGE_INTERVAL = float(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Keys whose request runs in this process, so local duplicates wake as soon
+# as it finishes instead of polling the store
+_running: Dict[str, asyncio.Event] = {}
+
+
+def request_fingerprint(payload: BaseModel) -> str:
+    """Hash of a request body, to tell a retry from a reused key"""
+    body = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def replay(record: dict) -> JSONBytesResponse:
+    return JSONBytesResponse(
+        record["response"], status_code=record["statusCode"], headers={"Idempotent-Replayed": "true"}
+    )
+
+
+async def run_once(storage, scope: str, key: str, payload: BaseModel,
+                   handler: Callable[[], Awaitable]) -> JSONBytesResponse:
+    """Run ``handler`` at most once per ``key`` within ``scope``.
+
+    ``handler`` returns the response body; an ``HTTPException`` below 500 is
+    stored and replayed like a success, anything else releases the key so
+    the next attempt runs again.
+    """
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400, detail=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+        )
+    key = f"{scope}:{key}"
+    fingerprint = request_fingerprint(payload)
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        now = datetime.utcnow()
+        record = await storage.claim_idempotency_key(
+            key, fingerprint, now + IDEMPOTENCY_LOCK_TIMEOUT, now + IDEMPOTENCY_KEY_TTL
+        )
+        if record is None:
+            IDEMPOTENT_REQUESTS.inc(("executed",))
+            return await _run(storage, key, handler)
+        if record["fingerprint"] != fingerprint:
+            IDEMPOTENT_REQUESTS.inc(("mismatched",))
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record["statusCode"] is not None:
+            IDEMPOTENT_REQUESTS.inc(("replayed",))
+            return replay(record)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            IDEMPOTENT_REQUESTS.inc(("in_progress",))
+            raise HTTPException(
+                status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"}
+            )
+        running = _running.get(key)
+        if running is not None:
+            try:
+                await asyncio.wait_for(running.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # The first attempt runs in another worker
+            await asyncio.sleep(min(IDEMPOTENCY_POLL_INTERVAL, remaining))
+
+
+async def _run(storage, key: str, handler: Callable[[], Awaitable]) -> JSONBytesResponse:
+    done = _running[key] = asyncio.Event()
+    try:
+        try:
+            body, status_code = jsonable_encoder(await handler()), 200
+        except HTTPException as exc:
+            if exc.status_code >= 500:
+                raise
+            body, status_code = {"detail": exc.detail}, exc.status_code
+        await storage.complete_idempotency_key(key, status_code, body)
+    except BaseException:
+        try:
+            await storage.release_idempotency_key(key)
+        except Exception:
+            logger.exception("Could not release idempotency key %s", key)
+        raise
+    finally:
+        del _running[key]
+        done.set()
+    return JSONBytesResponse(body, status_code=status_code)
+
+
+async def purge_expired_keys(storage, interval: float = IDEMPOTENCY_PURGE_INTERVAL):
+    """Delete expired keys every ``interval`` seconds; run as a background task"""
+    while True:
+        try:
+            purged = await storage.purge_idempotency_keys(datetime.utcnow())
+            if purged:
+                logger.info("Purged %d expired idempotency keys", purged)
+        except Exception:
+            logger.exception("Purging idempotency keys failed")
+        await asyncio.sleep(interval)
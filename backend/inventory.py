@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List
+import asyncio
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import DailyRollup, InventoryNight
+
+# Attempts for a reservation that loses a lock conflict before giving up
+RESERVATION_ATTEMPTS = 3
+
+# MySQL deadlock and lock wait timeout error codes, and SQLite's busy error
+LOCK_CONFLICT_CODES = {1205, 1213, "database is locked"}
+
+IGNORE_PREFIXES = {"mysql": "IGNORE", "sqlite": "OR IGNORE"}
+
+
+def stay_nights(check_in: datetime, check_out: datetime) -> List[date]:
+    """Calendar dates touched by [check_in, check_out).
+
+    Two stays that overlap in time always share at least one of these dates,
+    so locking them is enough to serialize every conflicting reservation.
+    """
+    last = (check_out - timedelta(microseconds=1)).date()
+    nights = []
+    night = check_in.date()
+    while night <= last:
+        nights.append(night)
+        night += timedelta(days=1)
+    return nights
+
+
+def nights_by_room_type(stays: Iterable[dict]) -> Dict[str, List[date]]:
+    """Sorted union of the nights each room type's stays touch, keyed by
+    room type in lock order"""
+    nights: Dict[str, set] = {}
+    for stay in stays:
+        nights.setdefault(stay["roomType"], set()).update(stay_nights(stay["checkIn"], stay["checkOut"]))
+    return {room_type: sorted(nights[room_type]) for room_type in sorted(nights)}
+
+
+def is_lock_conflict(exc: OperationalError) -> bool:
+    args = getattr(exc.orig, "args", ())
+    return bool(args) and args[0] in LOCK_CONFLICT_CODES
+
+
+async def ensure_inventory_nights(db: AsyncSession, nights: Dict[str, List[date]]):
+    """Create missing lock rows, and the daily rollup rows of the same
+    nights, in their own short transaction.
+
+    Inserting them inside the reservation would take shared locks on rows
+    that already exist and invite deadlocks with competing reservations.
+    The reservation then only has to update its rollup rows.
+    """
+    keys = [
+        {"roomType": room_type, "night": night}
+        for room_type, room_nights in nights.items() for night in room_nights
+    ]
+    if not keys:
+        return
+    async with db.bind.begin() as conn:
+        prefix = IGNORE_PREFIXES.get(conn.dialect.name)
+        for model in (InventoryNight, DailyRollup):
+            stmt = insert(model)
+            if prefix:
+                stmt = stmt.prefix_with(prefix)
+            await conn.execute(stmt, keys)
+
+
+async def lock_stay(db: AsyncSession, room_type: str, check_in: datetime, check_out: datetime):
+    """Lock every night of a stay for a room type until the session's transaction ends.
+
+    Call it before any other read in the transaction so later reads see every
+    reservation committed before the lock was granted.
+    """
+    await lock_nights(db, {room_type: stay_nights(check_in, check_out)})
+
+
+async def lock_nights(db: AsyncSession, nights: Dict[str, List[date]]):
+    """Lock the given nights of each room type until the session's transaction ends.
+
+    Bumping each row's version takes the same row locks as SELECT ... FOR
+    UPDATE, in primary key order (room type, then night) so competing
+    reservations queue instead of deadlocking, and also opens a write
+    transaction on databases without row locks (SQLite).
+    """
+    await ensure_inventory_nights(db, nights)
+    for room_type in sorted(nights):
+        await db.execute(
+            update(InventoryNight)
+            .where(InventoryNight.roomType == room_type, InventoryNight.night.in_(nights[room_type]))
+            .values(version=InventoryNight.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def with_lock_retry(db: AsyncSession, reserve):
+    """Run ``reserve()`` and retry it if the database aborted it over a lock conflict"""
+    for attempt in range(1, RESERVATION_ATTEMPTS + 1):
+        try:
+            return await reserve()
+        except OperationalError as exc:
+            await db.rollback()
+            if attempt == RESERVATION_ATTEMPTS or not is_lock_conflict(exc):
+                raise
+            await asyncio.sleep(0.05 * attempt)
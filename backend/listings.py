@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, NamedTuple, Optional, Tuple
+import base64
+import csv
+import io
+
+from fastapi import HTTPException
+
+from availability import to_naive_utc
+from serialization import dumps
+
+# Records fetched from the backend per round-trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+BOOKINGS = "bookings"
+BLOCKED_BOOKINGS = "blocked_bookings"
+# Past stays moved out of the live kinds by ``archive.py``
+BOOKINGS_ARCHIVE = "bookings_archive"
+BLOCKED_BOOKINGS_ARCHIVE = "blocked_bookings_archive"
+ARCHIVE_KINDS = {BOOKINGS: BOOKINGS_ARCHIVE, BLOCKED_BOOKINGS: BLOCKED_BOOKINGS_ARCHIVE}
+
+BOOKING_FIELDS = [
+    "id", "roomType", "roomName", "checkIn", "checkOut", "guests", "fullName",
+    "email", "phone", "nights", "totalPrice", "status", "createdAt",
+]
+BLOCKED_BOOKING_FIELDS = [
+    "id", "roomId", "roomType", "roomName", "roomUnit", "checkIn", "checkOut",
+    "reason", "createdAt",
+]
+LISTING_FIELDS = {
+    BOOKINGS: BOOKING_FIELDS,
+    BLOCKED_BOOKINGS: BLOCKED_BOOKING_FIELDS,
+    BOOKINGS_ARCHIVE: BOOKING_FIELDS,
+    BLOCKED_BOOKINGS_ARCHIVE: BLOCKED_BOOKING_FIELDS,
+}
+
+
+class ListingFilters(NamedTuple):
+    """Admin listing filters; ``dateFrom``/``dateTo`` keep stays overlapping that window"""
+    roomType: Optional[str] = None
+    status: Optional[str] = None
+    dateFrom: Optional[datetime] = None
+    dateTo: Optional[datetime] = None
+
+
+def listing_filters(roomType: Optional[str] = None, status: Optional[str] = None,
+                    dateFrom: Optional[datetime] = None, dateTo: Optional[datetime] = None) -> ListingFilters:
+    return ListingFilters(
+        roomType, status,
+        to_naive_utc(dateFrom) if dateFrom else None,
+        to_naive_utc(dateTo) if dateTo else None,
+    )
+
+
+def encode_cursor(created_at: datetime, record_id) -> str:
+    raw = f"{created_at.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, parse_id: Callable) -> Tuple[datetime, object]:
+    """(createdAt, id) of the last record of the previous page.
+
+    ``parse_id`` turns the id back into the backend's native type and
+    returns ``None`` for ids that backend could never have issued.
+    """
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        created_at, record_id = datetime.fromisoformat(created_at), parse_id(record_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if record_id is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, record_id
+
+
+def next_cursor(records: List[dict], limit: int) -> Optional[str]:
+    if len(records) < limit:
+        return None
+    last = records[-1]
+    return encode_cursor(last["createdAt"], last["id"])
+
+
+def record_to_csv(record: dict) -> dict:
+    """CSV record with the same values as the listing response models"""
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in record.items()
+    }
+
+
+async def export_lines(batches: AsyncIterator[List[dict]], fields: List[str], fmt: str) -> AsyncIterator[bytes]:
+    """Encode batches of listing records as NDJSON or CSV, one chunk per batch"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        async for batch in batches:
+            for record in batch:
+                writer.writerow(record_to_csv(record))
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        async for batch in batches:
+            yield b"".join(dumps(record) + b"\n" for record in batch)
@@ -0,0 +1,277 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+from db_pool import env_flag
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger("timing")
+
+# Queries slower than this are logged with their statement
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# Emit one structured timing line per request (off by default, it is one line per request)
+TIMING_LOG = env_flag("TIMING_LOG", False)
+# Serve the registry on /metrics; off by default since it lists routes and pool state to anyone
+METRICS_ENABLED = env_flag("METRICS_ENABLED", False)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"{self.name}{format_labels(self.labels, key)} {value}"
+                 for key, value in sorted(self.values.items())]
+        return self.header() + "".join(line + "\n" for line in lines)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, labels: Tuple, value: float):
+        with self._lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = []
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return self.header() + "".join(line + "\n" for line in lines)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        return "".join(metric.render() for metric in self.metrics)
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status")))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being served", ("method",)))
+REQUEST_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "Database queries issued per request", ("method", "route"), QUERY_COUNT_BUCKETS))
+QUERY_LATENCY = registry.register(Histogram(
+    "db_query_duration_seconds", "Database query latency", ("operation",)))
+SLOW_QUERIES = registry.register(Counter(
+    "db_slow_queries_total", f"Queries slower than SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms)", ("operation",)))
+DB_POOL = registry.register(Gauge(
+    "db_pool_connections", "Connection pool occupancy", ("state",)))
+DB_POOL_WAIT = registry.register(Gauge(
+    "db_pool_wait_seconds", "Connection checkout wait statistics", ("stat",)))
+DB_POOL_TIMEOUTS = registry.register(Gauge(
+    "db_pool_checkout_timeouts", "Checkouts that gave up waiting for a connection"))
+DB_REPLICA_LAG = registry.register(Gauge(
+    "db_replica_lag_seconds", "Last measured replica lag, -1 when replication is broken", ("replica",)))
+DB_READ_SESSIONS = registry.register(Counter(
+    "db_read_sessions_total", "Read-only sessions by the engine they were routed to", ("target",)))
+IDEMPOTENT_REQUESTS = registry.register(Counter(
+    "idempotent_requests_total", "Requests carrying an Idempotency-Key by outcome", ("outcome",)))
+OUTBOX_EVENTS = registry.register(Counter(
+    "outbox_events_total", "Outbox event delivery attempts by outcome", ("topic", "outcome")))
+APP_STARTUP = registry.register(Gauge(
+    "app_startup_seconds", "Time spent in each phase of worker startup", ("phase",)))
+ARCHIVED_RECORDS = registry.register(Counter(
+    "archived_records_total", "Past stays moved to the archive", ("kind",)))
+ADMISSION_DECISIONS = registry.register(Counter(
+    "admission_decisions_total", "Admission control decisions for limited routes", ("route", "outcome")))
+ADMISSION_QUEUE = registry.register(Gauge(
+    "admission_requests", "Requests of limited routes running (active) and queued (waiting)", ("route", "state")))
+LIVE_SUBSCRIBERS = registry.register(Gauge(
+    "live_subscribers", "Open event streams"))
+LIVE_EVENTS = registry.register(Counter(
+    "live_events_total", "Events published to event streams by type", ("type",)))
+LIVE_RESYNCS = registry.register(Counter(
+    "live_resyncs_total", "Streams told to reload instead of catching up, by reason", ("reason",)))
+
+
+def collect_pool_metrics(engine):
+    """Refresh the pool gauges from an engine each time metrics are scraped;
+    returns the collector so it can be removed from ``registry.collectors``"""
+    from db_pool import pool_status
+
+    def collect():
+        status = pool_status(engine)
+        for state in ("checkedIn", "checkedOut", "overflow", "size"):
+            if state in status:
+                DB_POOL.set((state,), status[state])
+        DB_POOL_WAIT.set(("total",), status["waitSecondsTotal"])
+        DB_POOL_WAIT.set(("max",), status["waitSecondsMax"])
+        DB_POOL_TIMEOUTS.set((), status["timeouts"])
+
+    registry.collectors.append(collect)
+    return collect
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def instrument_engine(engine):
+    """Time every statement on an engine and attribute it to the current request"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        QUERY_LATENCY.observe((operation,), elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            SLOW_QUERIES.inc((operation,))
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed_query(context):
+        # after_cursor_execute never runs for a statement that raised
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def is_event_stream(message) -> bool:
+    return any(name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+               for name, value in message.get("headers", ()))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, in-flight requests and query counts.
+
+    Event streams stay open for as long as the client listens, so once a response
+    turns out to be one it leaves the in-flight gauge and is kept out of the
+    latency and query histograms."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = [500]
+        streaming = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if is_event_stream(message):
+                    streaming[0] = True
+                    REQUESTS_IN_FLIGHT.inc((method,), -1)
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        REQUESTS_IN_FLIGHT.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            if not streaming[0]:
+                self.record(method, scope, status[0], elapsed, stats)
+
+    def record(self, method: str, scope, status: int, elapsed: float, stats: RequestStats):
+        REQUESTS_IN_FLIGHT.inc((method,), -1)
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = getattr(scope.get("route"), "path", "unmatched")
+        REQUEST_LATENCY.observe((method, route, str(status)), elapsed)
+        REQUEST_QUERIES.observe((method, route), stats.queries)
+        if TIMING_LOG:
+            timing_logger.info(json.dumps({
+                "method": method,
+                "route": route,
+                "status": status,
+                "durationMs": round(elapsed * 1000, 2),
+                "queries": stats.queries,
+                "dbMs": round(stats.db_seconds * 1000, 2),
+            }))
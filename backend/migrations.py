@@ -0,0 +1,289 @@
+"""Versioned schema migrations.
+
+``Base.metadata.create_all`` builds a fresh database at the latest schema,
+but never alters tables that already exist. Each migration below brings an
+older deployment forward one step and is recorded in ``schema_migrations``.
+Steps must tolerate objects that already exist, since on a fresh database
+``create_all`` has created them before the migrations run.
+
+Run pending migrations against MYSQL_URL with ``python migrations.py``, or
+list them with ``python migrations.py --status``. API workers check the
+schema version when they start (``ensure_schema``) and only migrate when it
+is behind, one worker at a time; with ``DB_AUTO_MIGRATE=false`` they refuse
+to start instead, leaving migrations to the deploy step.
+"""
+from contextlib import contextmanager
+from sqlalchemy import delete, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection
+from typing import Callable, List, NamedTuple, Optional
+import argparse
+import logging
+
+from analytics import ROLLUP_BATCH_SIZE, RollupBuilder
+from availability import ACTIVE_BOOKING_STATUSES
+from db_pool import env_flag
+from database import (
+    Base, Booking, BookingArchive, BlockedBooking, BlockedBookingArchive, DailyRollup, IdempotencyKey,
+    InventoryHold, InventoryNight, OutboxEvent, RateRule, SchemaMigration
+)
+
+logger = logging.getLogger(__name__)
+
+DB_AUTO_MIGRATE = env_flag("DB_AUTO_MIGRATE", True)
+
+# MySQL named lock held while migrating, and how long other workers wait for it
+SCHEMA_LOCK_NAME = "edenrest_schema_migrations"
+SCHEMA_LOCK_TIMEOUT = 120
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def register(apply):
+        MIGRATIONS.append(Migration(version, description, apply))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return apply
+    return register
+
+
+def create_indexes(conn: Connection, model, *names: str):
+    """Create the named indexes declared on a model unless they already exist"""
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(model.__tablename__)}
+    for index in model.__table__.indexes:
+        if index.name in names and index.name not in existing:
+            logger.info("Creating index %s", index.name)
+            index.create(conn)
+
+
+def add_column(conn: Connection, model, name: str):
+    """Add a column declared on a model unless the table already has it"""
+    table = model.__table__
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    if name in existing:
+        return
+    column = table.c[name]
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    logger.info("Adding column %s.%s", table.name, name)
+    conn.exec_driver_sql(ddl)
+
+
+@migration(1, "Baseline schema")
+def baseline(conn: Connection):
+    Base.metadata.create_all(conn)
+
+
+@migration(2, "Composite range indexes on bookings and blocked bookings")
+def booking_range_indexes(conn: Connection):
+    create_indexes(conn, Booking, "ix_bookings_roomType_checkIn_checkOut")
+    create_indexes(
+        conn, BlockedBooking,
+        "ix_blocked_bookings_roomType_checkIn_checkOut",
+        "ix_blocked_bookings_roomType_roomUnit_checkIn",
+    )
+
+
+@migration(3, "Per-night inventory lock rows")
+def inventory_nights(conn: Connection):
+    InventoryNight.__table__.create(conn, checkfirst=True)
+
+
+@migration(4, "Version counter on inventory lock rows")
+def inventory_night_version(conn: Connection):
+    add_column(conn, InventoryNight, "version")
+
+
+@migration(5, "Keyset listing indexes on (createdAt, id)")
+def listing_indexes(conn: Connection):
+    create_indexes(conn, Booking, "ix_bookings_createdAt_id")
+    create_indexes(conn, BlockedBooking, "ix_blocked_bookings_createdAt_id")
+
+
+@migration(6, "Idempotency keys for booking requests")
+def idempotency_keys(conn: Connection):
+    IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+@migration(7, "Outbox for booking side effects")
+def outbox_events(conn: Connection):
+    OutboxEvent.__table__.create(conn, checkfirst=True)
+
+
+@migration(8, "Short-lived inventory holds")
+def inventory_holds(conn: Connection):
+    InventoryHold.__table__.create(conn, checkfirst=True)
+
+
+@migration(9, "Archive tables for past stays")
+def stay_archives(conn: Connection):
+    BookingArchive.__table__.create(conn, checkfirst=True)
+    BlockedBookingArchive.__table__.create(conn, checkfirst=True)
+    create_indexes(conn, Booking, "ix_bookings_checkOut")
+    create_indexes(conn, BlockedBooking, "ix_blocked_bookings_checkOut")
+
+
+@migration(10, "Rate rules for per-night pricing")
+def rate_rules(conn: Connection):
+    RateRule.__table__.create(conn, checkfirst=True)
+
+
+@migration(11, "Daily occupancy and revenue rollups")
+def daily_rollups(conn: Connection):
+    DailyRollup.__table__.create(conn, checkfirst=True)
+    rebuild_daily_rollups(conn)
+
+
+@migration(12, "Daily rollups on the nights stays occupy")
+def daily_rollup_nights(conn: Connection):
+    # Rollups used to count a check-out date that was not at midnight as a night
+    rebuild_daily_rollups(conn)
+
+
+@migration(13, "Client and release token on inventory holds")
+def hold_owners(conn: Connection):
+    # Holds placed before it have neither; they can only expire
+    add_column(conn, InventoryHold, "client")
+    add_column(conn, InventoryHold, "releaseTokenHash")
+    create_indexes(conn, InventoryHold, "ix_inventory_holds_client")
+
+
+def rebuild_daily_rollups(conn: Connection) -> int:
+    """Recompute every daily rollup from the live and archived stays.
+
+    Stays are streamed in batches of columns into a ``RollupBuilder``
+    rather than loaded as ORM objects. Cancelled bookings no longer exist,
+    so cancellation counts are carried over. Returns the rows written.
+
+    Every rollup row (and on MySQL, the gaps between them) is locked
+    before any stay is read. Writers update rollups in the transaction
+    that writes the stay, so each one has either committed before the
+    scan or waits for the rebuild to commit.
+    """
+    # A no-op update of every row; on SQLite it opens the write transaction
+    conn.execute(update(DailyRollup).values(cancellations=DailyRollup.cancellations))
+    builder = RollupBuilder()
+    carried = select(DailyRollup.roomType, DailyRollup.night, DailyRollup.cancellations).where(
+        DailyRollup.cancellations != 0
+    )
+    for room_type, night, cancellations in conn.execute(carried):
+        builder.add_cancellations(room_type, night, cancellations)
+    for model in (Booking, BookingArchive):
+        stays = select(model.roomType, model.checkIn, model.checkOut, model.totalPrice, model.createdAt).where(
+            model.status.in_(ACTIVE_BOOKING_STATUSES)
+        )
+        for partition in conn.execute(stays.execution_options(yield_per=ROLLUP_BATCH_SIZE)).partitions():
+            builder.add_bookings(*zip(*partition))
+    for model in (BlockedBooking, BlockedBookingArchive):
+        stays = select(model.roomType, model.checkIn, model.checkOut)
+        for partition in conn.execute(stays.execution_options(yield_per=ROLLUP_BATCH_SIZE)).partitions():
+            builder.add_blocks(*zip(*partition))
+
+    rows = builder.rows()
+    conn.execute(delete(DailyRollup))
+    for offset in range(0, len(rows), ROLLUP_BATCH_SIZE):
+        conn.execute(insert(DailyRollup), rows[offset:offset + ROLLUP_BATCH_SIZE])
+    logger.info("Rebuilt %s daily rollup rows", len(rows))
+    return len(rows)
+
+
+def applied_versions(conn: Connection) -> set:
+    SchemaMigration.__table__.create(conn, checkfirst=True)
+    return set(conn.scalars(select(SchemaMigration.version)))
+
+
+def migrate(conn: Connection, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to ``target`` (default: latest) in order"""
+    done = applied_versions(conn)
+    applied = []
+    for step in MIGRATIONS:
+        if step.version in done or (target is not None and step.version > target):
+            continue
+        logger.info("Applying migration %s: %s", step.version, step.description)
+        step.apply(conn)
+        conn.execute(SchemaMigration.__table__.insert().values(
+            version=step.version, description=step.description
+        ))
+        applied.append(step.version)
+    return applied
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def current_version(conn: Connection) -> int:
+    """Highest applied migration, 0 for a database never migrated"""
+    if not inspect(conn).has_table(SchemaMigration.__tablename__):
+        return 0
+    return conn.scalar(select(func.max(SchemaMigration.version))) or 0
+
+
+@contextmanager
+def schema_lock(conn: Connection):
+    """Let one worker at a time migrate. Only MySQL needs the named lock:
+    SQLite serializes writers on its own."""
+    if conn.dialect.name != "mysql":
+        yield
+        return
+    params = {"name": SCHEMA_LOCK_NAME, "timeout": SCHEMA_LOCK_TIMEOUT}
+    if not conn.scalar(text("SELECT GET_LOCK(:name, :timeout)"), params):
+        raise RuntimeError("Timed out waiting for another worker to migrate the schema")
+    try:
+        yield
+    finally:
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), params)
+
+
+def ensure_schema(conn: Connection, auto_migrate: bool = DB_AUTO_MIGRATE) -> List[int]:
+    """Check the schema version and migrate only if it is behind.
+
+    An up-to-date database costs one version query, so every worker but
+    the first of a deployment starts without DDL or table reflection.
+    Workers that start while another one migrates wait for the schema lock
+    and then find nothing pending.
+    """
+    version = current_version(conn)
+    if version >= latest_version():
+        return []
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Database schema is at version {version}, expected {latest_version()}; run `python migrations.py`"
+        )
+    with schema_lock(conn):
+        return migrate(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to MYSQL_URL")
+    parser.add_argument("--to", type=int, default=None, help="stop after this version")
+    parser.add_argument("--status", action="store_true", help="list migrations and exit")
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from server import MYSQL_URL
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(MYSQL_URL)
+    with engine.begin() as conn:
+        if args.status:
+            done = applied_versions(conn)
+            for step in MIGRATIONS:
+                mark = "x" if step.version in done else " "
+                print(f"[{mark}] {step.version:04d} {step.description}")
+            return
+        applied = migrate(conn, args.to)
+        print(f"Applied {len(applied)} migration(s)")
+
+
+if __name__ == "__main__":
+    main()
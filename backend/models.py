@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from typing import Annotated, Literal, Optional, List
+from datetime import date, datetime
 from bson import ObjectId
 
 class PyObjectId(ObjectId):
@@ -43,6 +43,8 @@ class BookingCreate(BaseModel):
     fullName: str
     email: EmailStr
     phone: Optional[str] = None
+    # Hold from POST /holds for the same room type and dates
+    holdId: Optional[str] = None
 
 class BookingResponse(BaseModel):
     id: str
@@ -63,6 +65,72 @@ class BookingResponse(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+# Inventory Hold Models
+# Longest a hold may last
+HOLD_MAX_MINUTES = 30
+
+class HoldCreate(BaseModel):
+    roomType: str
+    checkIn: datetime
+    checkOut: datetime
+    minutes: Optional[int] = Field(None, ge=1, le=HOLD_MAX_MINUTES)
+
+class HoldResponse(BaseModel):
+    id: str
+    roomType: str
+    checkIn: datetime
+    checkOut: datetime
+    expiresAt: datetime
+    # Send as X-Release-Token to release the hold early
+    releaseToken: str
+
+
+# Rate and Quote Models
+class RateRuleCreate(BaseModel):
+    # None: every room type
+    roomType: Optional[str] = None
+    kind: Literal["night", "stay", "occupancy"]
+    # Multiplier: 1.2 is a 20% uplift, 0.9 a 10% discount
+    adjustment: float = Field(..., gt=0)
+    # night rules
+    start: Optional[date] = None
+    end: Optional[date] = None
+    weekdays: Optional[List[Annotated[int, Field(ge=0, le=6)]]] = None
+    # stay rules
+    minNights: Optional[int] = Field(None, ge=1)
+    # occupancy rules
+    minOccupancy: Optional[float] = Field(None, ge=0, le=1)
+    description: Optional[str] = Field(None, max_length=200)
+
+class RateRuleResponse(RateRuleCreate):
+    id: str
+    createdAt: datetime
+
+# Most stays priced by one quote request
+QUOTE_MAX_STAYS = 100
+
+class QuoteStay(BaseModel):
+    roomType: str
+    checkIn: datetime
+    checkOut: datetime
+
+class QuoteRequest(BaseModel):
+    stays: List[QuoteStay] = Field(..., min_length=1, max_length=QUOTE_MAX_STAYS)
+    # Include the nightly rates of each stay
+    breakdown: bool = False
+
+class Quote(BaseModel):
+    roomType: str
+    checkIn: datetime
+    checkOut: datetime
+    nights: int
+    total: float
+    nightly: Optional[List[float]] = None
+
+class QuoteResponse(BaseModel):
+    quotes: List[Quote]
+
+
 # Blocked Booking Models
 class BlockedBookingCreate(BaseModel):
     roomId: str
@@ -87,6 +155,24 @@ class BlockedBookingResponse(BaseModel):
     class Config:
         json_encoders = {ObjectId: str}
 
+# Largest batch the bulk blocking endpoint accepts
+BULK_BLOCK_MAX_ITEMS = 500
+
+class BlockedBookingBulkCreate(BaseModel):
+    blocks: List[BlockedBookingCreate] = Field(..., min_length=1, max_length=BULK_BLOCK_MAX_ITEMS)
+    atomic: bool = False
+
+class BlockedBookingBulkResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BlockedBookingBulkResponse(BaseModel):
+    created: int
+    rejected: int
+    results: List[BlockedBookingBulkResult]
+
 
 # Admin Auth Model
 class AdminLogin(BaseModel):
@@ -0,0 +1,213 @@
+"""Transactional outbox for side effects of booking changes.
+
+Creating or cancelling a booking writes an event (``booking.created`` /
+``booking.cancelled``) in the same transaction as the booking row, so an
+event exists exactly when the change was committed. ``OutboxWorker`` drains
+pending events in batches in the background and hands them to the sinks:
+confirmation emails, admin notifications and channel-manager syncs. The
+booking request returns as soon as its row is durable.
+
+Delivery is at least once: a batch whose sink fails is retried with
+exponential backoff, and a worker that dies mid-batch leaves its claim to
+lapse after ``OUTBOX_LEASE``. Sinks should use the event ``id`` to drop
+duplicates. Events still failing after ``OUTBOX_MAX_ATTEMPTS`` are kept as
+``failed`` for inspection.
+
+The sinks here are local stand-ins so the pipeline runs offline; real
+integrations implement the same ``deliver`` coroutine.
+
+API processes drain the outbox themselves unless ``OUTBOX_WORKER=false``;
+``python outbox.py`` runs a standalone worker against the configured
+storage backend instead.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+
+from fastapi.encoders import jsonable_encoder
+
+from db_pool import env_flag
+from metrics import OUTBOX_EVENTS
+
+logger = logging.getLogger(__name__)
+
+BOOKING_CREATED = "booking.created"
+BOOKING_CANCELLED = "booking.cancelled"
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "100"))
+# Seconds between polls when no local write signalled new events
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", "600"))
+# How long a claimed batch is hidden from other workers
+OUTBOX_LEASE = timedelta(seconds=float(os.environ.get("OUTBOX_LEASE", "60")))
+# Set to false on all but the processes that should drain the outbox
+OUTBOX_WORKER = env_flag("OUTBOX_WORKER", True)
+
+# Set after a local commit wrote events, so the worker does not wait out its poll
+_written = asyncio.Event()
+
+
+def outbox_event(topic: str, data: dict) -> dict:
+    """Event for a storage backend to write alongside a booking change"""
+    return {"topic": topic, "payload": jsonable_encoder(data)}
+
+
+def notify():
+    _written.set()
+
+
+def backoff(attempts: int) -> timedelta:
+    """Delay before the next attempt of an event that failed ``attempts`` times"""
+    return timedelta(seconds=min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE ** attempts))
+
+
+# Sinks
+class LogSink:
+    """Writes each event to the application log, without the guest details
+    in its payload"""
+
+    name = "log"
+
+    async def deliver(self, events: List[dict]):
+        for event in events:
+            logger.info("Outbox %s #%s: booking %s", event["topic"], event["id"], event["payload"].get("id"))
+
+
+class FileSink:
+    """Appends events to an NDJSON file, standing in for a mail or
+    channel-manager API"""
+
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _append(self, events: List[dict]):
+        with open(self.path, "a", encoding="utf-8") as out:
+            for event in events:
+                out.write(json.dumps({"id": event["id"], "topic": event["topic"], "payload": event["payload"]}) + "\n")
+
+    async def deliver(self, events: List[dict]):
+        await asyncio.to_thread(self._append, events)
+
+
+class MemorySink:
+    """Keeps delivered events in a list, for tests and benchmarks"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.events: List[dict] = []
+
+    async def deliver(self, events: List[dict]):
+        self.events.extend(events)
+
+
+def sinks_from_env() -> list:
+    """Sinks named in OUTBOX_SINKS: ``log``, ``memory`` or ``file:<path>``, comma-separated"""
+    sinks = []
+    for spec in os.environ.get("OUTBOX_SINKS", "log").split(","):
+        spec = spec.strip()
+        if spec == "log":
+            sinks.append(LogSink())
+        elif spec == "memory":
+            sinks.append(MemorySink())
+        elif spec.startswith("file:"):
+            sinks.append(FileSink(spec[len("file:"):]))
+        elif spec:
+            raise ValueError(f"Unknown outbox sink {spec!r}")
+    return sinks
+
+
+class OutboxWorker:
+    """Drains the outbox of a storage backend into its sinks"""
+
+    def __init__(self, storage, sinks: list, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.storage = storage
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._task: Optional[asyncio.Task] = None
+
+    async def drain(self) -> int:
+        """Deliver claimable events until none are left; returns how many were handled"""
+        handled = 0
+        while True:
+            events = await self.storage.claim_outbox(self.batch_size, datetime.utcnow() + OUTBOX_LEASE)
+            if not events:
+                return handled
+            await self.deliver(events)
+            handled += len(events)
+
+    async def deliver(self, events: List[dict]):
+        try:
+            for sink in self.sinks:
+                await sink.deliver(events)
+        except Exception as exc:
+            logger.warning("Outbox delivery of %d events failed: %r", len(events), exc)
+            await self.retry(events, repr(exc))
+            return
+        await self.storage.ack_outbox([event["id"] for event in events])
+        for event in events:
+            OUTBOX_EVENTS.inc((event["topic"], "delivered"))
+
+    async def retry(self, events: List[dict], error: str):
+        now = datetime.utcnow()
+        retry_at: Dict[Optional[datetime], list] = {}
+        for event in events:
+            # ``attempts`` already counts the attempt that just failed
+            exhausted = event["attempts"] >= self.max_attempts
+            when = None if exhausted else now + backoff(event["attempts"])
+            retry_at.setdefault(when, []).append(event["id"])
+            OUTBOX_EVENTS.inc((event["topic"], "failed" if exhausted else "retried"))
+        for when, ids in retry_at.items():
+            await self.storage.nack_outbox(ids, error, when)
+
+    async def _run(self):
+        while True:
+            # Cleared before draining so a write during the drain is not missed
+            _written.clear()
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Outbox worker failed to drain the outbox")
+            try:
+                await asyncio.wait_for(_written.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+async def run_worker():
+    from server import build_storage
+
+    storage = build_storage()
+    await storage.startup()
+    worker = OutboxWorker(storage, sinks_from_env())
+    try:
+        await worker._run()
+    finally:
+        await storage.shutdown()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Per-night rate calendar and quote engine.
+
+A room type's nightly rate starts at its catalog ``price`` and is adjusted
+by rate rules, each a multiplier (``1.2`` is a 20% uplift, ``0.9`` a 10%
+discount):
+
+- ``night`` rules apply to the nights in [start, end) that fall on one of
+  ``weekdays`` (Monday is 0), either bound being optional: weekend and
+  peak-season uplifts. Several matching rules multiply.
+- ``occupancy`` rules apply to the nights on which at least
+  ``minOccupancy`` of the units are booked, held or blocked; the highest
+  threshold reached counts.
+- ``stay`` rules apply to the total of a stay of at least ``minNights``
+  nights; the longest threshold reached counts.
+
+Rules with a ``roomType`` apply to that room type, the others to all.
+
+A stay is priced for the nights it occupies in inventory: the UTC dates
+from its check-in date up to its check-out date (``stay_dates``), so
+night rules match the nights the availability calendar shows it on.
+Clients send the guest's calendar dates at midnight UTC; a local midnight
+converted to UTC would land on the previous date east of Greenwich.
+
+``night`` rules are folded into a grid of nightly rates per room type,
+cached by ``RateCalendar`` for ``RATE_GRID_DAYS`` from yesterday. A quote
+for a batch of stays is then the difference of two prefix sums of the
+grid per stay, computed for the whole batch with NumPy. Occupancy is only
+looked up when a room type has occupancy rules.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from availability import night_span, stay_dates
+
+NIGHT = "night"
+STAY = "stay"
+OCCUPANCY = "occupancy"
+
+RATE_RULE_FIELDS = [
+    "id", "roomType", "kind", "adjustment", "start", "end", "weekdays",
+    "minNights", "minOccupancy", "description", "createdAt",
+]
+
+# Nights covered by each cached grid; stays outside it are priced from a grid built for them
+RATE_GRID_DAYS = int(os.environ.get("RATE_GRID_DAYS", "760"))
+# Seconds before cached grids are rebuilt even without a local change, so
+# rule edits made through another worker still show up
+RATE_GRID_TTL = float(os.environ.get("RATE_GRID_TTL", "300"))
+
+
+class UnknownRoomType(KeyError):
+    """A stay names a room type that is not in the catalog"""
+
+
+def weekdays_of(dates: np.ndarray) -> np.ndarray:
+    # 1970-01-01 was a Thursday
+    return (dates.astype("int64") + 3) % 7
+
+
+def night_multipliers(rules: Sequence[dict], start: date, days: int) -> np.ndarray:
+    """Product of the ``night`` rules for each of ``days`` nights from ``start``"""
+    dates = np.arange(days) + np.datetime64(start, "D")
+    multipliers = np.ones(days)
+    for rule in rules:
+        mask = np.ones(days, dtype=bool)
+        if rule.get("start"):
+            mask &= dates >= np.datetime64(rule["start"], "D")
+        if rule.get("end"):
+            mask &= dates < np.datetime64(rule["end"], "D")
+        if rule.get("weekdays"):
+            mask &= np.isin(weekdays_of(dates), rule["weekdays"])
+        multipliers[mask] *= rule["adjustment"]
+    return multipliers
+
+
+class Steps(NamedTuple):
+    """Multiplier of the highest threshold reached, for threshold rules"""
+    thresholds: np.ndarray
+    adjustments: np.ndarray
+
+    @classmethod
+    def from_rules(cls, rules: Sequence[dict], key: str) -> "Steps":
+        ordered = sorted(rules, key=lambda rule: rule[key])
+        return cls(np.array([rule[key] for rule in ordered], dtype=float),
+                   np.array([rule["adjustment"] for rule in ordered], dtype=float))
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        if not len(self.thresholds):
+            return np.ones(len(values))
+        index = np.searchsorted(self.thresholds, values, side="right") - 1
+        return np.where(index >= 0, self.adjustments[np.maximum(index, 0)], 1.0)
+
+
+class RateGrid:
+    """Nightly rates of one room type for ``days`` nights from ``start``"""
+
+    __slots__ = ("room_type", "total_units", "start", "rates", "stay", "occupancy")
+
+    def __init__(self, room: dict, rules: Sequence[dict], start: date, days: int):
+        self.room_type = room["id"]
+        self.total_units = room["available"]
+        self.start = start
+        self.rates = room["price"] * night_multipliers([r for r in rules if r["kind"] == NIGHT], start, days)
+        self.stay = Steps.from_rules([r for r in rules if r["kind"] == STAY], "minNights")
+        self.occupancy = Steps.from_rules([r for r in rules if r["kind"] == OCCUPANCY], "minOccupancy")
+
+    @property
+    def uses_occupancy(self) -> bool:
+        return len(self.occupancy.thresholds) > 0
+
+    def covers(self, first: int, last: int) -> bool:
+        return first >= 0 and last <= len(self.rates)
+
+    def nightly(self, first: int, last: int, occupancy: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rates of the nights [first, last) of the grid; ``occupancy`` gives
+        the booked share of units on each of those nights"""
+        rates = self.rates[first:last]
+        if occupancy is not None and self.uses_occupancy:
+            rates = rates * self.occupancy(occupancy)
+        return rates
+
+    def totals(self, first: np.ndarray, nights: np.ndarray, rates: np.ndarray, offset: int) -> np.ndarray:
+        """Totals of the stays starting on grid nights ``first``, from the
+        nightly ``rates`` of the grid nights from ``offset`` on"""
+        cumulative = np.concatenate(([0.0], np.cumsum(rates)))
+        totals = cumulative[first + nights - offset] - cumulative[first - offset]
+        return np.round(totals * self.stay(nights), 2)
+
+
+def applies_to(rule: dict, room_type: str) -> bool:
+    return rule.get("roomType") in (None, room_type)
+
+
+class RateTable(NamedTuple):
+    rooms: Dict[str, dict]
+    rules: List[dict]
+    grids: Dict[str, RateGrid]
+
+
+class RateCalendar:
+    """Rate grids of every room type, shared by every request in the process"""
+
+    def __init__(self, ttl: float = RATE_GRID_TTL, days: int = RATE_GRID_DAYS):
+        self.ttl = ttl
+        self.days = days
+        self._entry: Optional[Tuple[float, RateTable]] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._entry = None
+
+    def _fresh(self) -> Optional[RateTable]:
+        entry = self._entry
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    async def load(self, storage) -> RateTable:
+        loaded_at = time.monotonic()
+        rooms = {room["id"]: room for room in await storage.list_rooms()}
+        rules = await storage.list_rate_rules()
+        start = datetime.utcnow().date() - timedelta(days=1)
+        grids = {
+            room_type: RateGrid(room, [r for r in rules if applies_to(r, room_type)], start, self.days)
+            for room_type, room in rooms.items()
+        }
+        table = RateTable(rooms, rules, grids)
+        self._entry = (loaded_at, table)
+        return table
+
+    async def get(self, storage) -> RateTable:
+        cached = self._fresh()
+        if cached:
+            return cached
+        async with self._lock:
+            return self._fresh() or await self.load(storage)
+
+
+rate_calendar = RateCalendar()
+
+
+def charged_nights(check_in: datetime, check_out: datetime) -> int:
+    """Nights charged for a stay, as stored on bookings: the nights it
+    occupies in inventory (``stay_dates``)"""
+    first, end = stay_dates(check_in, check_out)
+    return (end - first).days
+
+
+async def quote_stays(storage, stays: Sequence[Tuple[str, datetime, datetime]],
+                      breakdown: bool = False, held: Sequence[Tuple[str, datetime, datetime]] = ()) -> List[dict]:
+    """Price a batch of (roomType, checkIn, checkOut) stays with naive UTC
+    datetimes. Each quote has the stay's ``nights`` and ``total``, and its
+    ``nightly`` rates with ``breakdown``.
+
+    ``held`` are stays the caller already holds a unit for, in the same
+    form; occupancy rules do not count them, so a guest's own hold does
+    not raise their price."""
+    table = await rate_calendar.get(storage)
+    by_room_type: Dict[str, List[int]] = {}
+    for index, (room_type, _, _) in enumerate(stays):
+        if room_type not in table.grids:
+            raise UnknownRoomType(room_type)
+        by_room_type.setdefault(room_type, []).append(index)
+
+    quotes: List[Optional[dict]] = [None] * len(stays)
+    for room_type, indexes in by_room_type.items():
+        grid = table.grids[room_type]
+        first_dates = [stays[i][1].date() for i in indexes]
+        nights = np.array([max(charged_nights(stays[i][1], stays[i][2]), 0) for i in indexes])
+        window_start = min(first_dates)
+        first = np.array([(night - grid.start).days for night in first_dates])
+        low, high = int(first.min()), int((first + nights).max())
+        if not grid.covers(low, high):
+            # Outside the cached horizon: price from a grid of just this window
+            grid = RateGrid(table.rooms[room_type], [r for r in table.rules if applies_to(r, room_type)],
+                            window_start, high - low)
+            first -= low
+            low, high = 0, high - low
+        occupancy = None
+        if grid.uses_occupancy and high > low:
+            occupancy = await occupancy_share(storage, grid, low, high, held)
+        rates = grid.nightly(low, high, occupancy)
+        totals = grid.totals(first, nights, rates, low)
+        for position, index in enumerate(indexes):
+            room_type, check_in, check_out = stays[index]
+            quote = {
+                "roomType": room_type, "checkIn": check_in, "checkOut": check_out,
+                "nights": int(nights[position]), "total": float(totals[position]),
+            }
+            if breakdown:
+                start = first[position] - low
+                quote["nightly"] = np.round(rates[start:start + nights[position]], 2).tolist()
+            quotes[index] = quote
+    return quotes
+
+
+async def occupancy_share(storage, grid: RateGrid, first: int, last: int,
+                          held: Sequence[Tuple[str, datetime, datetime]] = ()) -> np.ndarray:
+    """Share of the room type's units booked, held or blocked on grid nights
+    [first, last), less one unit on the nights of each ``held`` stay"""
+    start = grid.start + timedelta(days=first)
+    end = grid.start + timedelta(days=last)
+    calendar = await storage.availability_calendar({grid.room_type: grid.total_units}, start, end)
+    occupied = grid.total_units - np.array(calendar["rooms"][grid.room_type]["available"])
+    for room_type, check_in, check_out in held:
+        if room_type == grid.room_type:
+            own_first, own_last = night_span(check_in, check_out, start, last - first)
+            occupied[own_first:own_last] -= 1
+    occupied = np.maximum(occupied, 0)
+    # Units over units rather than 1 - available / units, which lands just
+    # below thresholds such as 0.2 for 1 of 5 units
+    return occupied / max(grid.total_units, 1)
@@ -0,0 +1,136 @@
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from metrics import DB_READ_SESSIONS, DB_REPLICA_LAG
+
+logger = logging.getLogger(__name__)
+
+# Replicas further behind than this many seconds stop receiving reads; also
+# how long reads of something this process just wrote stay on the primary
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "5"))
+
+# Key for reads that are not scoped to a room type, such as admin listings
+ANY_WRITE = "*"
+
+
+def replica_urls_from_env() -> List[str]:
+    """Comma-separated MYSQL_REPLICA_URLS, in the same form as MYSQL_URL"""
+    return [url.strip() for url in os.environ.get("MYSQL_REPLICA_URLS", "").split(",") if url.strip()]
+
+
+async def replica_lag(conn) -> Optional[float]:
+    """Seconds a MySQL replica is behind its source, or ``None`` when
+    replication is broken. Servers that are not replicas report no lag."""
+    if conn.dialect.name != "mysql":
+        return 0.0
+    # SHOW REPLICA STATUS needs MySQL 8.0.22+; older servers only know the old name
+    for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                              ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+        try:
+            row = (await conn.exec_driver_sql(statement)).mappings().first()
+        except DBAPIError:
+            continue
+        if row is None:
+            return 0.0
+        lag = row.get(column)
+        return None if lag is None else float(lag)
+    return None
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.name = make_url(str(engine.url)).render_as_string(hide_password=True)
+        self.sessions = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        # Unknown until the first check, and unused until then
+        self.lag: Optional[float] = None
+
+
+class ReplicaRouter:
+    """Picks the engine for read-only units of work.
+
+    Reads go round-robin to replicas whose last measured lag is within
+    ``max_lag``, and to the primary when none is. A replica that is within
+    the bound may still miss a commit this process made less than
+    ``max_lag`` seconds ago, so reads keyed by something written that
+    recently stay on the primary: every session reads its own writes.
+    """
+
+    def __init__(self, primary: async_sessionmaker, replica_engines: List[AsyncEngine],
+                 max_lag: float = DB_REPLICA_MAX_LAG, check_interval: float = DB_REPLICA_CHECK_INTERVAL):
+        self.primary = primary
+        self.replicas = [Replica(engine) for engine in replica_engines]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._written_at: Dict[str, float] = {}
+        self._turn = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def note_write(self, *keys: str):
+        """Record a local commit touching ``keys`` (room types, or ``rooms``)"""
+        now = time.monotonic()
+        for key in keys + (ANY_WRITE,):
+            self._written_at[key] = now
+
+    def _recently_written(self, keys) -> bool:
+        horizon = time.monotonic() - self.max_lag
+        return any(self._written_at.get(key, float("-inf")) > horizon for key in keys)
+
+    def healthy(self) -> List[Replica]:
+        return [r for r in self.replicas if r.lag is not None and r.lag <= self.max_lag]
+
+    def read_sessions(self, *keys: str) -> async_sessionmaker:
+        """Session factory for a read touching ``keys``; no keys means the
+        read depends on every write"""
+        healthy = self.healthy()
+        if not healthy or self._recently_written(keys or (ANY_WRITE,)):
+            DB_READ_SESSIONS.inc(("primary",))
+            return self.primary
+        self._turn += 1
+        DB_READ_SESSIONS.inc(("replica",))
+        return healthy[self._turn % len(healthy)].sessions
+
+    async def check(self):
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    replica.lag = await replica_lag(conn)
+            except Exception:
+                logger.exception("Replica lag check failed for %s", replica.name)
+                replica.lag = None
+            if replica.lag is None or replica.lag > self.max_lag:
+                logger.warning("Replica %s is not serving reads (lag %s)", replica.name, replica.lag)
+            DB_REPLICA_LAG.set((replica.name,), -1 if replica.lag is None else replica.lag)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    async def start(self):
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def status(self) -> dict:
+        return {
+            "maxLagSeconds": self.max_lag,
+            "replicas": [
+                {"name": r.name, "lagSeconds": r.lag, "servingReads": r in self.healthy()}
+                for r in self.replicas
+            ],
+        }
@@ -1,22 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
+from datetime import date, datetime, timedelta
+import logging
 from models import (
     BookingCreate, BookingResponse,
+    HoldCreate, HoldResponse,
+    RateRuleCreate, RateRuleResponse, QuoteRequest, QuoteResponse,
     BlockedBookingCreate, BlockedBookingResponse,
+    BlockedBookingBulkCreate, BlockedBookingBulkResponse,
     AdminLogin, AdminToken
 )
-from database import Room, Booking, BlockedBooking
-import os
-import jwt
-from datetime import timedelta
+from availability import to_naive_utc
+from catalog import room_catalog, etag_matches, ROOM_CATALOG_CACHE_CONTROL
+from serialization import JSONBytesResponse
+from listings import (
+    listing_filters, decode_cursor, next_cursor, export_lines,
+    BOOKINGS, BLOCKED_BOOKINGS, BOOKINGS_ARCHIVE, BLOCKED_BOOKINGS_ARCHIVE, LISTING_FIELDS
+)
+from storage import InvalidBlock, NoAvailability, StorageBackend, TooManyHolds, get_storage
+from idempotency import run_once
+from holds import HOLD_MAX_PER_CLIENT, HOLD_TTL, new_hold_id, new_release_token, release_token_hash
+from admission import client_address
+from archive import archive_cutoff, archive_past_stays
+from pricing import NIGHT, OCCUPANCY, STAY, UnknownRoomType, charged_nights, quote_stays
+from analytics import ANALYTICS_MAX_DAYS, analytics_report
+from broadcast import (
+    ADMIN_TOPICS, AVAILABILITY, BLOCK_CREATED, BLOCK_DELETED, SSE_RETRY_MS, TOPICS,
+    broadcaster, publish_availability, publish_change
+)
+from outbox import BOOKING_CANCELLED, BOOKING_CREATED
+from auth import (
+    STREAM_TOKEN_TTL, check_admin_credentials, create_jwt_token, create_stream_token, verify_admin_token,
+    verify_stream_token
+)
 
 router = APIRouter()
-
-# JWT Secret
-JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
-JWT_ALGORITHM = "HS256"
+logger = logging.getLogger(__name__)
 
 # Initial room data
 INITIAL_ROOMS = [
@@ -52,218 +72,276 @@ INITIAL_ROOMS = [
     }
 ]
 
-# Admin credentials
-ADMIN_USERNAME = "admin"
-ADMIN_PASSWORD = "admin123"
+# Longest window the availability calendar serves in one request
+CALENDAR_MAX_NIGHTS = 366
 
-def create_jwt_token(username: str) -> str:
-    payload = {
-        "username": username,
-        "exp": datetime.utcnow() + timedelta(hours=24)
-    }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+# Listing helpers
+LISTING_PAGE_SIZE = 100
+LISTING_MAX_PAGE_SIZE = 1000
 
-def verify_jwt_token(token: str) -> dict:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-async def verify_admin_token(authorization: Optional[str] = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = verify_jwt_token(token)
-        return payload
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+async def listing_response(storage: StorageBackend, kind: str, filters, cursor: Optional[str],
+                           limit: int) -> JSONBytesResponse:
+    """Encode a listing page in one pass; the cursor for the following page
+    goes in the X-Next-Cursor header"""
+    after = decode_cursor(cursor, storage.parse_id) if cursor else None
+    records = await storage.list_page(kind, filters, after, limit)
+    response = JSONBytesResponse(records)
+    cursor = next_cursor(records, limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    return response
 
-# Get DB session
-from server import SessionLocal
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def export_response(batches: AsyncIterator[List[dict]], kind: str, fmt: str, name: str) -> StreamingResponse:
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_lines(batches, LISTING_FIELDS[kind], fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
 
 # Initialize rooms
-def initialize_rooms(db: Session):
-    rooms_count = db.query(Room).count()
-    if rooms_count == 0:
-        for room_data in INITIAL_ROOMS:
-            room = Room(**room_data)
-            db.add(room)
-        db.commit()
-        print(f"Initialized {len(INITIAL_ROOMS)} rooms in database")
+async def initialize_rooms(storage: StorageBackend):
+    if not await storage.list_rooms():
+        await storage.add_rooms(INITIAL_ROOMS)
+        logger.info("Initialized %d rooms in database", len(INITIAL_ROOMS))
 
 # Admin Authentication
 @router.post("/admin/login", response_model=AdminToken)
 async def admin_login(credentials: AdminLogin):
-    if credentials.username == ADMIN_USERNAME and credentials.password == ADMIN_PASSWORD:
+    if await check_admin_credentials(credentials.username, credentials.password):
         token = create_jwt_token(credentials.username)
         return AdminToken(token=token, message="Login successful")
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 # Room Routes
 @router.get("/rooms", response_model=List[dict])
-async def get_rooms(db: Session = Depends(get_db)):
-    initialize_rooms(db)
-    rooms = db.query(Room).all()
-    return [
-        {
-            "id": room.id,
-            "type": room.type,
-            "available": room.available,
-            "price": room.price,
-            "description": room.description,
-            "amenities": room.amenities,
-            "image": room.image,
-            "maxGuests": room.maxGuests
-        }
-        for room in rooms
-    ]
+async def get_rooms(
+    if_none_match: Optional[str] = Header(None),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Room catalog, served from the in-process cache"""
+    body, etag = await room_catalog.get(storage)
+    headers = {"ETag": etag, "Cache-Control": ROOM_CATALOG_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/rooms/availability")
 async def check_room_availability(
     roomType: str, 
     checkIn: str, 
     checkOut: str,
-    db: Session = Depends(get_db)
+    storage: StorageBackend = Depends(get_storage)
 ):
     """Check room availability for specific dates"""
-    check_in_date = datetime.fromisoformat(checkIn.replace('Z', '+00:00'))
-    check_out_date = datetime.fromisoformat(checkOut.replace('Z', '+00:00'))
+    check_in_date = to_naive_utc(datetime.fromisoformat(checkIn.replace('Z', '+00:00')))
+    check_out_date = to_naive_utc(datetime.fromisoformat(checkOut.replace('Z', '+00:00')))
+    if check_out_date <= check_in_date:
+        raise HTTPException(status_code=400, detail="Check-out must be after check-in")
     
     # Get room info
-    room = db.query(Room).filter(Room.id == roomType).first()
+    room = await storage.get_room(roomType)
     if not room:
         raise HTTPException(status_code=404, detail="Room type not found")
     
-    total_units = room.available
-    
-    # Count blocked units for these dates
-    blocked_bookings = db.query(BlockedBooking).filter(
-        BlockedBooking.roomType == roomType,
-        (
-            (BlockedBooking.checkIn <= check_in_date) & (BlockedBooking.checkOut > check_in_date) |
-            (BlockedBooking.checkIn < check_out_date) & (BlockedBooking.checkOut >= check_out_date) |
-            (BlockedBooking.checkIn >= check_in_date) & (BlockedBooking.checkOut <= check_out_date)
-        )
-    ).all()
+    # Count blocked units and confirmed bookings for these dates
+    return await storage.check_availability(roomType, room["available"], check_in_date, check_out_date)
+
+@router.get("/rooms/availability/calendar")
+async def get_availability_calendar(
+    start: date,
+    end: date,
+    roomTypes: Optional[List[str]] = Query(None),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Per-night availability of several room types over [start, end)"""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if (end - start).days > CALENDAR_MAX_NIGHTS:
+        raise HTTPException(status_code=400, detail=f"Window is limited to {CALENDAR_MAX_NIGHTS} nights")
     
-    # Get unique blocked units
-    blocked_units = set([b.roomUnit for b in blocked_bookings])
-    available_count = total_units - len(blocked_units)
+    rooms = {room["id"]: room["available"] for room in await storage.list_rooms()}
+    if roomTypes:
+        if not set(roomTypes) <= rooms.keys():
+            raise HTTPException(status_code=404, detail="Room type not found")
+        rooms = {room_type: rooms[room_type] for room_type in roomTypes}
     
-    return {
-        "roomType": roomType,
-        "totalUnits": total_units,
-        "blockedUnits": len(blocked_units),
-        "availableUnits": max(0, available_count)
-    }
+    return await storage.availability_calendar(rooms, start, end)
 
 # Booking Routes
 @router.post("/bookings", response_model=BookingResponse)
-async def create_booking(booking: BookingCreate, db: Session = Depends(get_db)):
-    # Check availability first
-    availability = await check_room_availability(
-        booking.roomType,
-        booking.checkIn.isoformat(),
-        booking.checkOut.isoformat(),
-        db
-    )
-    
-    if availability["availableUnits"] <= 0:
-        raise HTTPException(status_code=400, detail="No rooms available for selected dates")
+async def create_booking(
+    booking: BookingCreate,
+    idempotency_key: Optional[str] = Header(None),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Book a room.
+
+    Clients that retry should send the same Idempotency-Key header with each
+    attempt: the booking is made once and its response replayed to retries.
+    """
+    if idempotency_key is None:
+        return await book_room(booking, storage)
+    return await run_once(storage, "bookings", idempotency_key, booking, lambda: book_room(booking, storage))
+
+async def book_room(booking: BookingCreate, storage: StorageBackend) -> BookingResponse:
+    check_in = to_naive_utc(booking.checkIn)
+    check_out = to_naive_utc(booking.checkOut)
+    if check_out <= check_in:
+        raise HTTPException(status_code=400, detail="Check-out must be after check-in")
     
     # Get room details
-    room = db.query(Room).filter(Room.id == booking.roomType).first()
+    room = await storage.get_room(booking.roomType)
     if not room:
         raise HTTPException(status_code=404, detail="Room type not found")
     
-    # Calculate nights and total price
-    nights = (booking.checkOut - booking.checkIn).days
-    total_price = nights * room.price
+    # Calculate nights and total price from the rate calendar
+    nights = charged_nights(check_in, check_out)
+    stay = (booking.roomType, check_in, check_out)
+    # A hold on this stay is the guest's own unit: it must not count as
+    # occupancy that raises their price
+    hold = await storage.get_hold(booking.holdId) if booking.holdId else None
+    held = [stay] if hold and (hold["roomType"], hold["checkIn"], hold["checkOut"]) == stay else []
+    quote, = await quote_stays(storage, [stay], held=held)
+    total_price = quote["total"]
     
-    # Create booking
-    new_booking = Booking(
-        roomType=booking.roomType,
-        roomName=room.type,
-        checkIn=booking.checkIn,
-        checkOut=booking.checkOut,
-        guests=booking.guests,
-        fullName=booking.fullName,
-        email=booking.email,
-        phone=booking.phone,
-        nights=nights,
-        totalPrice=total_price,
-        status="confirmed"
-    )
+    try:
+        new_booking = await storage.create_booking({
+            "roomType": booking.roomType,
+            "roomName": room["type"],
+            "checkIn": check_in,
+            "checkOut": check_out,
+            "guests": booking.guests,
+            "fullName": booking.fullName,
+            "email": booking.email,
+            "phone": booking.phone,
+            "nights": nights,
+            "totalPrice": total_price,
+            "status": "confirmed"
+        }, room["available"], hold_id=booking.holdId)
+    except NoAvailability:
+        raise HTTPException(status_code=400, detail="No rooms available for selected dates")
+    
+    publish_change(BOOKING_CREATED, new_booking)
+    return BookingResponse(**new_booking)
+
+# Quote Routes
+@router.post("/quotes", response_model=QuoteResponse, response_model_exclude_none=True)
+async def quote(request: QuoteRequest, storage: StorageBackend = Depends(get_storage)):
+    """Price a batch of stays with the per-night rate calendar, as a booking would be charged"""
+    stays = []
+    for stay in request.stays:
+        check_in = to_naive_utc(stay.checkIn)
+        check_out = to_naive_utc(stay.checkOut)
+        if check_out <= check_in:
+            raise HTTPException(status_code=400, detail="Check-out must be after check-in")
+        stays.append((stay.roomType, check_in, check_out))
     
-    db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
+    try:
+        quotes = await quote_stays(storage, stays, request.breakdown)
+    except UnknownRoomType:
+        raise HTTPException(status_code=404, detail="Room type not found")
+    return QuoteResponse(quotes=quotes)
+
+# Hold Routes
+@router.post("/holds", response_model=HoldResponse)
+async def create_hold(hold: HoldCreate, request: Request, storage: StorageBackend = Depends(get_storage)):
+    """Reserve a unit for a stay for a few minutes while the guest checks out.
+
+    Pass the returned id as ``holdId`` when booking the same room type and
+    dates; the hold lapses on its own at ``expiresAt``. A client may have
+    ``HOLD_MAX_PER_CLIENT`` active holds at once.
+    """
+    check_in = to_naive_utc(hold.checkIn)
+    check_out = to_naive_utc(hold.checkOut)
+    if check_out <= check_in:
+        raise HTTPException(status_code=400, detail="Check-out must be after check-in")
     
-    return BookingResponse(
-        id=str(new_booking.id),
-        roomType=new_booking.roomType,
-        roomName=new_booking.roomName,
-        checkIn=new_booking.checkIn,
-        checkOut=new_booking.checkOut,
-        guests=new_booking.guests,
-        fullName=new_booking.fullName,
-        email=new_booking.email,
-        phone=new_booking.phone,
-        nights=new_booking.nights,
-        totalPrice=new_booking.totalPrice,
-        status=new_booking.status,
-        createdAt=new_booking.createdAt
-    )
+    room = await storage.get_room(hold.roomType)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room type not found")
+    
+    ttl = timedelta(minutes=hold.minutes) if hold.minutes else HOLD_TTL
+    release_token = new_release_token()
+    try:
+        new_hold = await storage.create_hold({
+            "id": new_hold_id(),
+            "roomType": hold.roomType,
+            "checkIn": check_in,
+            "checkOut": check_out,
+            "expiresAt": datetime.utcnow() + ttl,
+            "client": client_address(request.scope),
+            "releaseTokenHash": release_token_hash(release_token)
+        }, room["available"], HOLD_MAX_PER_CLIENT)
+    except NoAvailability:
+        raise HTTPException(status_code=400, detail="No rooms available for selected dates")
+    except TooManyHolds:
+        raise HTTPException(status_code=429, detail="Too many active holds; book or release one first")
+    
+    publish_availability(hold.roomType, check_in, check_out)
+    return HoldResponse(**new_hold, releaseToken=release_token)
+
+@router.delete("/holds/{hold_id}")
+async def release_hold(
+    hold_id: str,
+    x_release_token: str = Header(...),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Give a held unit back before the hold expires; takes the hold's
+    release token in X-Release-Token"""
+    released = await storage.release_hold(hold_id, release_token_hash(x_release_token))
+    if released is None:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    
+    publish_availability(released["roomType"], released["checkIn"], released["checkOut"])
+    return {"message": "Hold released"}
 
 @router.get("/bookings", response_model=List[BookingResponse])
-async def get_bookings(admin: dict = Depends(verify_admin_token), db: Session = Depends(get_db)):
-    """Get all bookings (admin only)"""
-    bookings = db.query(Booking).all()
-    return [
-        BookingResponse(
-            id=str(b.id),
-            roomType=b.roomType,
-            roomName=b.roomName,
-            checkIn=b.checkIn,
-            checkOut=b.checkOut,
-            guests=b.guests,
-            fullName=b.fullName,
-            email=b.email,
-            phone=b.phone,
-            nights=b.nights,
-            totalPrice=b.totalPrice,
-            status=b.status,
-            createdAt=b.createdAt
-        )
-        for b in bookings
-    ]
+async def get_bookings(
+    roomType: Optional[str] = None,
+    status: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Page through bookings, newest first (admin only). Stays that ended
+    before the archive cutoff are listed under /admin/archive/bookings.
+
+    The cursor for the following page is returned in the X-Next-Cursor header.
+    """
+    filters = listing_filters(roomType, status, dateFrom, dateTo)
+    return await listing_response(storage, BOOKINGS, filters, cursor, limit)
+
+@router.get("/bookings/export")
+async def export_bookings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    roomType: Optional[str] = None,
+    status: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Stream every matching booking as NDJSON or CSV (admin only)"""
+    filters = listing_filters(roomType, status, dateFrom, dateTo)
+    return export_response(storage.export(BOOKINGS, filters), BOOKINGS, format, "bookings")
 
 @router.delete("/bookings/{booking_id}")
 async def cancel_booking(
-    booking_id: int, 
+    booking_id: str, 
     admin: dict = Depends(verify_admin_token),
-    db: Session = Depends(get_db)
+    storage: StorageBackend = Depends(get_storage)
 ):
     """Cancel a booking (admin only)"""
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    if not booking:
+    record_id = storage.parse_id(booking_id)
+    cancelled = await storage.delete(BOOKINGS, record_id) if record_id is not None else None
+    if cancelled is None:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    db.delete(booking)
-    db.commit()
-    
+    publish_change(BOOKING_CANCELLED, cancelled)
     return {"message": "Booking cancelled successfully"}
 
 # Blocked Bookings Routes (Admin Only)
@@ -271,66 +349,288 @@ async def cancel_booking(
 async def create_blocked_booking(
     blocked: BlockedBookingCreate,
     admin: dict = Depends(verify_admin_token),
-    db: Session = Depends(get_db)
+    storage: StorageBackend = Depends(get_storage)
 ):
-    """Block a room unit for offline booking"""
-    new_blocked = BlockedBooking(
-        roomId=blocked.roomId,
-        roomType=blocked.roomType,
-        roomName=blocked.roomName,
-        roomUnit=blocked.roomUnit,
-        checkIn=blocked.checkIn,
-        checkOut=blocked.checkOut,
-        reason=blocked.reason
-    )
-    
-    db.add(new_blocked)
-    db.commit()
-    db.refresh(new_blocked)
+    """Block a room unit for offline booking, validated like one item of a
+    bulk request"""
+    rooms = {room["id"]: room["available"] for room in await storage.list_rooms()}
+    try:
+        new_blocked = await storage.create_block({
+            "roomId": blocked.roomId,
+            "roomType": blocked.roomType,
+            "roomName": blocked.roomName,
+            "roomUnit": blocked.roomUnit,
+            "checkIn": to_naive_utc(blocked.checkIn),
+            "checkOut": to_naive_utc(blocked.checkOut),
+            "reason": blocked.reason
+        }, rooms)
+    except InvalidBlock as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     
-    return BlockedBookingResponse(
-        id=str(new_blocked.id),
-        roomId=new_blocked.roomId,
-        roomType=new_blocked.roomType,
-        roomName=new_blocked.roomName,
-        roomUnit=new_blocked.roomUnit,
-        checkIn=new_blocked.checkIn,
-        checkOut=new_blocked.checkOut,
-        reason=new_blocked.reason,
-        createdAt=new_blocked.createdAt
-    )
+    publish_change(BLOCK_CREATED, new_blocked)
+    return BlockedBookingResponse(**new_blocked)
 
-@router.get("/admin/blocked-bookings", response_model=List[BlockedBookingResponse])
-async def get_blocked_bookings(admin: dict = Depends(verify_admin_token), db: Session = Depends(get_db)):
-    """Get all blocked bookings"""
-    blocked = db.query(BlockedBooking).all()
-    return [
-        BlockedBookingResponse(
-            id=str(b.id),
-            roomId=b.roomId,
-            roomType=b.roomType,
-            roomName=b.roomName,
-            roomUnit=b.roomUnit,
-            checkIn=b.checkIn,
-            checkOut=b.checkOut,
-            reason=b.reason,
-            createdAt=b.createdAt
-        )
-        for b in blocked
+@router.post("/admin/blocked-bookings/bulk", response_model=BlockedBookingBulkResponse)
+async def create_blocked_bookings(
+    bulk: BlockedBookingBulkCreate,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Block many units/date ranges at once.
+
+    Items are validated against each other and against existing blocks and
+    bookings, then every valid one is inserted in one write. With ``atomic``
+    nothing is inserted unless every item is valid.
+    """
+    rooms = {room["id"]: room["available"] for room in await storage.list_rooms()}
+    blocks = [
+        {
+            "roomId": blocked.roomId,
+            "roomType": blocked.roomType,
+            "roomName": blocked.roomName,
+            "roomUnit": blocked.roomUnit,
+            "checkIn": to_naive_utc(blocked.checkIn),
+            "checkOut": to_naive_utc(blocked.checkOut),
+            "reason": blocked.reason
+        }
+        for blocked in bulk.blocks
     ]
+    results = await storage.create_blocks(blocks, rooms, atomic=bulk.atomic)
+    for result in results:
+        if result["status"] == "created":
+            publish_change(BLOCK_CREATED, {**blocks[result["index"]], "id": result["id"]})
+    created = sum(result["status"] == "created" for result in results)
+    return BlockedBookingBulkResponse(created=created, rejected=len(results) - created, results=results)
+
+@router.get("/admin/blocked-bookings", response_model=List[BlockedBookingResponse])
+async def get_blocked_bookings(
+    roomType: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Page through blocked bookings, newest first.
+
+    The cursor for the following page is returned in the X-Next-Cursor header.
+    """
+    filters = listing_filters(roomType, None, dateFrom, dateTo)
+    return await listing_response(storage, BLOCKED_BOOKINGS, filters, cursor, limit)
+
+@router.get("/admin/blocked-bookings/export")
+async def export_blocked_bookings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    roomType: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Stream every matching blocked booking as NDJSON or CSV"""
+    filters = listing_filters(roomType, None, dateFrom, dateTo)
+    return export_response(storage.export(BLOCKED_BOOKINGS, filters), BLOCKED_BOOKINGS, format, "blocked-bookings")
 
 @router.delete("/admin/blocked-bookings/{block_id}")
 async def delete_blocked_booking(
-    block_id: int,
+    block_id: str,
     admin: dict = Depends(verify_admin_token),
-    db: Session = Depends(get_db)
+    storage: StorageBackend = Depends(get_storage)
 ):
     """Unblock a room unit"""
-    blocked = db.query(BlockedBooking).filter(BlockedBooking.id == block_id).first()
-    if not blocked:
+    record_id = storage.parse_id(block_id)
+    unblocked = await storage.delete(BLOCKED_BOOKINGS, record_id) if record_id is not None else None
+    if unblocked is None:
         raise HTTPException(status_code=404, detail="Blocked booking not found")
     
-    db.delete(blocked)
-    db.commit()
-    
+    publish_change(BLOCK_DELETED, unblocked)
     return {"message": "Room unblocked successfully"}
+
+# Archived past stays (admin only)
+@router.post("/admin/archive")
+async def archive_now(
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Archive stays that ended before the cutoff now instead of waiting for the next run"""
+    before = archive_cutoff()
+    moved = await archive_past_stays(storage, before)
+    return {"before": before, "archived": moved}
+
+@router.get("/admin/archive/bookings", response_model=List[BookingResponse])
+async def get_archived_bookings(
+    roomType: Optional[str] = None,
+    status: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Page through archived bookings, newest first.
+
+    The cursor for the following page is returned in the X-Next-Cursor header.
+    """
+    filters = listing_filters(roomType, status, dateFrom, dateTo)
+    return await listing_response(storage, BOOKINGS_ARCHIVE, filters, cursor, limit)
+
+@router.get("/admin/archive/bookings/export")
+async def export_archived_bookings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    roomType: Optional[str] = None,
+    status: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Stream every matching archived booking as NDJSON or CSV"""
+    filters = listing_filters(roomType, status, dateFrom, dateTo)
+    return export_response(
+        storage.export(BOOKINGS_ARCHIVE, filters), BOOKINGS_ARCHIVE, format, "bookings-archive"
+    )
+
+@router.get("/admin/archive/blocked-bookings", response_model=List[BlockedBookingResponse])
+async def get_archived_blocked_bookings(
+    roomType: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Page through archived blocked bookings, newest first.
+
+    The cursor for the following page is returned in the X-Next-Cursor header.
+    """
+    filters = listing_filters(roomType, None, dateFrom, dateTo)
+    return await listing_response(storage, BLOCKED_BOOKINGS_ARCHIVE, filters, cursor, limit)
+
+@router.get("/admin/archive/blocked-bookings/export")
+async def export_archived_blocked_bookings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    roomType: Optional[str] = None,
+    dateFrom: Optional[datetime] = None,
+    dateTo: Optional[datetime] = None,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Stream every matching archived blocked booking as NDJSON or CSV"""
+    filters = listing_filters(roomType, None, dateFrom, dateTo)
+    return export_response(
+        storage.export(BLOCKED_BOOKINGS_ARCHIVE, filters), BLOCKED_BOOKINGS_ARCHIVE, format, "blocked-bookings-archive"
+    )
+
+# Rate Rules (admin only)
+@router.get("/admin/rate-rules", response_model=List[RateRuleResponse])
+async def get_rate_rules(
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Every rate rule, oldest first"""
+    return await storage.list_rate_rules()
+
+@router.post("/admin/rate-rules", response_model=RateRuleResponse)
+async def create_rate_rule(
+    rule: RateRuleCreate,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Add a weekday/season (night), length-of-stay (stay) or occupancy rate rule"""
+    if rule.roomType and not await storage.get_room(rule.roomType):
+        raise HTTPException(status_code=404, detail="Room type not found")
+    if rule.kind == STAY and rule.minNights is None:
+        raise HTTPException(status_code=400, detail="Stay rules need minNights")
+    if rule.kind == OCCUPANCY and rule.minOccupancy is None:
+        raise HTTPException(status_code=400, detail="Occupancy rules need minOccupancy")
+    if rule.kind == NIGHT and rule.start and rule.end and rule.end <= rule.start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    
+    return await storage.add_rate_rule(rule.model_dump())
+
+@router.delete("/admin/rate-rules/{rule_id}")
+async def delete_rate_rule(
+    rule_id: str,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Remove a rate rule"""
+    record_id = storage.parse_id(rule_id)
+    if record_id is None or not await storage.delete_rate_rule(record_id):
+        raise HTTPException(status_code=404, detail="Rate rule not found")
+    
+    return {"message": "Rate rule deleted"}
+
+# Analytics (admin only)
+@router.get("/admin/analytics")
+async def get_analytics(
+    start: date,
+    end: date,
+    roomTypes: Optional[List[str]] = Query(None),
+    nightly: bool = False,
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Occupancy, ADR, RevPAR, lead time and cancellation rate per room type
+    over the nights [start, end), with per-night series when ``nightly``"""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if (end - start).days > ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {ANALYTICS_MAX_DAYS} nights")
+    
+    rooms = {room["id"]: room["available"] for room in await storage.list_rooms()}
+    if roomTypes:
+        if not set(roomTypes) <= rooms.keys():
+            raise HTTPException(status_code=404, detail="Room type not found")
+        rooms = {room_type: rooms[room_type] for room_type in roomTypes}
+    
+    rows = await storage.rollup_rows(list(rooms), start, end)
+    return JSONBytesResponse(analytics_report(rows, rooms, start, end, nightly))
+
+@router.post("/admin/analytics/rebuild")
+async def rebuild_analytics(
+    admin: dict = Depends(verify_admin_token),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """Recompute the daily rollups from every live and archived stay"""
+    return {"rows": await storage.rebuild_rollups()}
+
+# Live events
+@router.post("/events/token")
+async def issue_stream_token(admin: dict = Depends(verify_admin_token)):
+    """Token for opening an admin event stream, see ``stream_events``"""
+    return {"token": create_stream_token(admin["username"]), "expiresIn": STREAM_TOKEN_TTL}
+
+@router.get("/events")
+async def stream_events(
+    topics: List[str] = Query([AVAILABILITY]),
+    roomTypes: Optional[List[str]] = Query(None),
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Server-Sent Events for availability (public) and booking changes
+    (admin), see ``broadcast``. Admin topics take the admin token in the
+    Authorization header or, since browsers' EventSource cannot send
+    headers, a stream token from ``POST /api/events/token`` as ``token``.
+    Query strings end up in access logs, so only that short-lived,
+    stream-only token is accepted there."""
+    if not set(topics) <= set(TOPICS):
+        raise HTTPException(status_code=400, detail=f"Topics are {', '.join(TOPICS)}")
+    if ADMIN_TOPICS & set(topics):
+        if token:
+            verify_stream_token(token)
+        else:
+            await verify_admin_token(authorization)
+    if broadcaster.full:
+        raise HTTPException(status_code=503, detail="Too many open event streams",
+                            headers={"Retry-After": str(max(1, SSE_RETRY_MS // 1000))})
+
+    return StreamingResponse(
+        broadcaster.stream(topics, roomTypes or (), last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
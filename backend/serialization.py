@@ -0,0 +1,41 @@
+from typing import Any, Iterable, List
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is pinned, stdlib is the fallback
+    orjson = None
+    import json
+    from datetime import date, datetime
+
+    def _default(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode to JSON bytes, formatting datetimes the way Pydantic does"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+class JSONBytesResponse(Response):
+    """JSON response encoded in one pass, with no response_model validation"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_to_dicts(rows: Iterable, fields: List[str]) -> List[dict]:
+    """Plain dicts from column rows, with ids as strings like the response models"""
+    out = []
+    for row in rows:
+        data = dict(zip(fields, row))
+        data["id"] = str(data["id"])
+        out.append(data)
+    return out
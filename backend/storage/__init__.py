@@ -0,0 +1,42 @@
+"""Storage backends behind the API routes.
+
+``STORAGE_BACKEND`` picks one per deployment: ``mysql`` (any SQLAlchemy
+URL in ``MYSQL_URL``, with optional read replicas in
+``MYSQL_REPLICA_URLS``), ``mongodb`` (``MONGO_URL``/``DB_NAME``) or
+``memory``. Routes get it through the ``get_storage`` dependency.
+"""
+from typing import Optional
+import os
+
+from storage.base import InvalidBlock, NoAvailability, StorageBackend, TooManyHolds
+
+STORAGE_BACKENDS = ("mysql", "mongodb", "memory")
+
+_storage: Optional[StorageBackend] = None
+
+
+def create_storage(backend: str, session_factory=None, replica_router=None) -> StorageBackend:
+    """Build the configured backend; drivers are imported only when selected"""
+    if backend == "mysql":
+        from storage.sql import SQLStorage
+        return SQLStorage(session_factory, replica_router)
+    if backend == "mongodb":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from storage.mongo import MongoStorage
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        return MongoStorage(client[os.environ.get("DB_NAME", "edenrest")])
+    if backend == "memory":
+        from storage.memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected one of {', '.join(STORAGE_BACKENDS)}")
+
+
+def set_storage(backend: StorageBackend):
+    global _storage
+    _storage = backend
+
+
+def get_storage() -> StorageBackend:
+    if _storage is None:
+        raise RuntimeError("No storage backend configured")
+    return _storage
@@ -0,0 +1,297 @@
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from availability import (
+    AvailabilityIndex, RoomTypeOccupancy, availability_calendar, calendar_window, max_concurrent
+)
+from listings import ListingFilters
+
+
+class NoAvailability(Exception):
+    """The room type has no unit free for every night of the stay"""
+
+
+class TooManyHolds(Exception):
+    """The client already has as many active holds as it may"""
+
+
+class InvalidBlock(Exception):
+    """A block ``validate_blocks`` refused; the message says why"""
+
+
+def lockable_blocks(blocks: List[dict], rooms: Dict[str, int]) -> List[dict]:
+    """Blocks worth locking nights for: known room type and a non-empty stay"""
+    return [b for b in blocks if b["roomType"] in rooms and b["checkOut"] > b["checkIn"]]
+
+
+def validate_blocks(blocks: List[dict], rooms: Dict[str, int],
+                    occupancy: Dict[str, RoomTypeOccupancy]) -> List[Optional[str]]:
+    """Error for each block of a batch, or ``None`` if it can be inserted.
+
+    Blocks are checked in order against the existing occupancy of their
+    room type (loaded from the earliest check-in of the batch) and against
+    the blocks accepted before them: a unit cannot be blocked twice for
+    the same night, and blocking must not leave fewer units than the
+    bookings already confirmed for the stay.
+    """
+    accepted: Dict[str, List[dict]] = {}
+    errors = []
+    for block in blocks:
+        room_type, unit = block["roomType"], block["roomUnit"]
+        check_in, check_out = block["checkIn"], block["checkOut"]
+        total = rooms.get(room_type)
+        if total is None:
+            errors.append("Room type not found")
+            continue
+        if check_out <= check_in:
+            errors.append("Check-out must be after check-in")
+            continue
+        if not unit.isdigit() or not 1 <= int(unit) <= total:
+            errors.append(f"Unknown unit {unit}")
+            continue
+        existing = occupancy[room_type].blocks.overlapping(check_in, check_out)
+        batch = [b for b in accepted.get(room_type, []) if b["checkIn"] < check_out and b["checkOut"] > check_in]
+        if any(b[2] == unit for b in existing) or any(b["roomUnit"] == unit for b in batch):
+            errors.append(f"Unit {unit} is already blocked for these dates")
+            continue
+        units = {b[2] for b in existing} | {b["roomUnit"] for b in batch} | {unit}
+        bookings = occupancy[room_type].bookings.overlapping(check_in, check_out)
+        if len(units) + max_concurrent(bookings, check_in, check_out) > total:
+            errors.append("Blocking this unit would displace confirmed bookings")
+            continue
+        accepted.setdefault(room_type, []).append(block)
+        errors.append(None)
+    return errors
+
+
+def block_results(errors: List[Optional[str]], ids: Optional[List[str]]) -> List[dict]:
+    """Per-item results of a bulk block.
+
+    ``ids`` lists the new ids in the order of the valid items, or is
+    ``None`` when an atomic batch was refused and nothing was inserted.
+    """
+    ids = iter(ids) if ids is not None else None
+    results = []
+    for index, error in enumerate(errors):
+        if error is not None:
+            results.append({"index": index, "status": "rejected", "error": error})
+        elif ids is None:
+            results.append({"index": index, "status": "skipped", "error": "Batch was not applied"})
+        else:
+            results.append({"index": index, "status": "created", "id": next(ids)})
+    return results
+
+
+def refused(errors: List[Optional[str]], atomic: bool) -> bool:
+    """Whether a validated batch inserts nothing"""
+    return all(errors) or (atomic and any(errors))
+
+
+class StorageBackend(ABC):
+    """Everything the API routes read and write: the room catalog, bookings
+    and per-unit blocks.
+
+    Listing and export methods take a ``kind`` (``listings.BOOKINGS`` or
+    ``listings.BLOCKED_BOOKINGS``, or their ``listings.ARCHIVE_KINDS``) and
+    return plain dicts with the fields in ``listings.LISTING_FIELDS``, ids
+    as strings and naive UTC datetimes. Archived records are past stays and
+    never count against availability.
+    """
+
+    name = ""
+
+    def __init__(self):
+        self.availability = AvailabilityIndex()
+
+    async def startup(self):
+        """Prepare the store (schema, indexes) before serving traffic"""
+
+    async def shutdown(self):
+        """Release connections"""
+
+    # Room catalog
+    @abstractmethod
+    async def list_rooms(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def get_room(self, room_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def add_rooms(self, rooms: List[dict]):
+        ...
+
+    # Rate rules (see pricing.py)
+    @abstractmethod
+    async def list_rate_rules(self) -> List[dict]:
+        """Every rate rule, with the fields in ``pricing.RATE_RULE_FIELDS``"""
+
+    @abstractmethod
+    async def add_rate_rule(self, rule: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def delete_rate_rule(self, rule_id) -> bool:
+        """Delete a rate rule by native id (see ``parse_id``); ``False`` if it did not exist"""
+
+    # Availability
+    @abstractmethod
+    async def load_occupancy(self, room_type: str, since: datetime) -> Tuple[list, list]:
+        """Booking (checkIn, checkOut) and block (checkIn, checkOut, roomUnit)
+        intervals of a room type still open after ``since``. Active holds
+        are returned as bookings."""
+
+    @abstractmethod
+    async def stays_in_window(self, room_types: List[str], window_start: datetime,
+                              window_end: datetime) -> Iterable[tuple]:
+        """Bookings, active holds and blocks overlapping a window, as
+        (roomType, roomUnit, checkIn, checkOut) with a ``None`` roomUnit for
+        bookings and holds"""
+
+    async def check_availability(self, room_type: str, total_units: int,
+                                 check_in: datetime, check_out: datetime) -> dict:
+        return await self.availability.check(self.load_occupancy, room_type, total_units, check_in, check_out)
+
+    async def availability_calendar(self, rooms: dict, start: date, end: date) -> dict:
+        window_start, window_end = calendar_window(start, end)
+        stays = await self.stays_in_window(list(rooms), window_start, window_end)
+        return availability_calendar(rooms, stays, start, end)
+
+    # Bookings and blocks
+    @abstractmethod
+    async def create_booking(self, booking: dict, total_units: int, hold_id: Optional[str] = None) -> dict:
+        """Store a booking if a unit is free for the whole stay, atomically
+        with respect to every other booking, hold and block of its room type.
+
+        An unexpired hold ``hold_id`` for the same room type and dates is
+        consumed instead of checking availability. Without one, raises
+        ``NoAvailability`` when no unit is free.
+        """
+
+    @abstractmethod
+    async def create_hold(self, hold: dict, total_units: int, max_per_client: int) -> dict:
+        """Store a hold (with its ``id``, ``expiresAt``, ``client`` and
+        ``releaseTokenHash``) under the same rules as a booking; raises
+        ``NoAvailability``, or ``TooManyHolds`` when its client already has
+        ``max_per_client`` active holds. The count is taken under the stay's
+        night locks, so a client's concurrent holds on other stays can
+        overshoot it by the few requests admission control lets through."""
+
+    @abstractmethod
+    async def get_hold(self, hold_id: str) -> Optional[dict]:
+        """An unexpired hold's roomType, checkIn and checkOut; ``None`` if
+        it does not exist or has expired"""
+
+    @abstractmethod
+    async def release_hold(self, hold_id: str, release_token_hash: str) -> Optional[dict]:
+        """Delete a hold if ``release_token_hash`` is its token's; returns
+        its roomType, checkIn and checkOut, or ``None`` if there was no
+        such hold"""
+
+    @abstractmethod
+    async def expire_holds(self, now: datetime) -> List[str]:
+        """Delete holds that expired by ``now``; returns their room types"""
+
+    @abstractmethod
+    async def create_block(self, block: dict, rooms: Dict[str, int]) -> dict:
+        """Validate one block like a batch of one (``validate_blocks``) under
+        the night locks of its stay, and insert it. Raises ``InvalidBlock``."""
+
+    @abstractmethod
+    async def create_blocks(self, blocks: List[dict], rooms: Dict[str, int], atomic: bool = False) -> List[dict]:
+        """Validate a batch of blocks together (``validate_blocks``) under the
+        night locks of every stay, and insert the valid ones in one write.
+
+        With ``atomic`` nothing is inserted unless every block is valid.
+        Returns ``block_results`` for the batch.
+        """
+
+    @abstractmethod
+    def parse_id(self, value: str):
+        """Native id for ``value``, or ``None`` if this backend never issues it"""
+
+    @abstractmethod
+    async def delete(self, kind: str, record_id) -> Optional[dict]:
+        """Delete a booking or block by native id; returns it as listed, or
+        ``None`` if it did not exist"""
+
+    @abstractmethod
+    async def list_page(self, kind: str, filters: ListingFilters,
+                        after: Optional[tuple], limit: int) -> List[dict]:
+        """Newest-first page of records strictly after the (createdAt, id) ``after``"""
+
+    @abstractmethod
+    def export(self, kind: str, filters: ListingFilters) -> AsyncIterator[List[dict]]:
+        """Every matching record, newest first, in batches"""
+
+    @abstractmethod
+    async def import_records(self, kind: str, records: List[dict]):
+        """Insert records as they are, without availability checks (seeding,
+        copying data between backends)"""
+
+    @abstractmethod
+    async def archive_stays(self, kind: str, before: datetime, limit: int) -> int:
+        """Move up to ``limit`` bookings or blocks whose stay ended by
+        ``before`` to the archive kind, keeping their ids, in one write;
+        returns how many moved"""
+
+    # Analytics (see analytics.py). Writing or deleting a booking or block
+    # updates the daily rollups of its nights along with it.
+    @abstractmethod
+    async def rollup_rows(self, room_types: List[str], start: date, end: date) -> List[tuple]:
+        """Daily rollups of the room types for the nights in [start, end), as
+        (roomType, night, *analytics.ROLLUP_FIELDS) tuples; nights without
+        bookings or blocks may be missing"""
+
+    @abstractmethod
+    async def rebuild_rollups(self) -> int:
+        """Recompute the rollups from the live and archived stays, keeping
+        the cancellation counts; returns the rows written"""
+
+    # Idempotency keys
+    @abstractmethod
+    async def claim_idempotency_key(self, key: str, fingerprint: str,
+                                    locked_until: datetime, expires_at: datetime) -> Optional[dict]:
+        """Take ``key`` for a request about to run.
+
+        Returns ``None`` when the caller now owns the key: it was unused,
+        expired, or held by a request still unfinished at its
+        ``lockedUntil``. Otherwise returns the stored record, with
+        ``fingerprint``, ``statusCode`` (``None`` while the first request is
+        running) and ``response``.
+        """
+
+    @abstractmethod
+    async def complete_idempotency_key(self, key: str, status_code: int, response):
+        """Store the outcome of a claimed key for replay"""
+
+    @abstractmethod
+    async def release_idempotency_key(self, key: str):
+        """Drop a claim whose request failed, so a retry runs it again"""
+
+    @abstractmethod
+    async def purge_idempotency_keys(self, now: datetime) -> int:
+        """Delete keys that expired before ``now``; returns how many"""
+
+    # Outbox (see outbox.py). create_booking and deleting a booking write
+    # their event along with the change.
+    @abstractmethod
+    async def claim_outbox(self, limit: int, lease_until: datetime) -> List[dict]:
+        """Oldest pending events that are due, hidden from other workers until
+        ``lease_until``, as dicts with ``id`` (a string), ``topic``,
+        ``payload`` and ``attempts`` (counting this one)"""
+
+    @abstractmethod
+    async def ack_outbox(self, ids: List[str]):
+        """Remove delivered events"""
+
+    @abstractmethod
+    async def nack_outbox(self, ids: List[str], error: str, retry_at: Optional[datetime]):
+        """Record a failed delivery; retry at ``retry_at``, or never when it is ``None``"""
+
+    @abstractmethod
+    async def outbox_status(self) -> dict:
+        """Number of ``pending`` and ``failed`` events"""
+
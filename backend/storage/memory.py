@@ -0,0 +1,375 @@
+from contextlib import AsyncExitStack
+from datetime import date, datetime
+from itertools import count
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import copy
+
+from analytics import (
+    ROLLUP_FIELDS, RollupBuilder, RollupDeltas, cancellation_deltas, stay_deltas
+)
+from availability import ACTIVE_BOOKING_STATUSES, RoomTypeOccupancy
+from catalog import room_catalog
+from listings import (
+    ARCHIVE_KINDS, BOOKINGS, BOOKINGS_ARCHIVE, BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE, EXPORT_BATCH_SIZE,
+    LISTING_FIELDS, ListingFilters
+)
+from pricing import RATE_RULE_FIELDS, rate_calendar
+from outbox import BOOKING_CANCELLED, BOOKING_CREATED, notify as notify_outbox, outbox_event
+from storage.base import (
+    InvalidBlock, NoAvailability, StorageBackend, TooManyHolds, block_results, lockable_blocks, refused,
+    validate_blocks
+)
+
+
+def matches(record: dict, filters: ListingFilters) -> bool:
+    return (
+        (not filters.roomType or record["roomType"] == filters.roomType)
+        and (not filters.status or record.get("status") == filters.status)
+        and (not filters.dateFrom or record["checkOut"] > filters.dateFrom)
+        and (not filters.dateTo or record["checkIn"] < filters.dateTo)
+    )
+
+
+class MemoryStorage(StorageBackend):
+    """Process-local store for tests, demos and benchmarks.
+
+    Nothing survives a restart and every worker process has its own data.
+    Reservations are serialized per room type with an asyncio lock.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.rooms: Dict[str, dict] = {}
+        self.records: Dict[str, Dict[int, dict]] = {
+            BOOKINGS: {}, BLOCKED_BOOKINGS: {}, BOOKINGS_ARCHIVE: {}, BLOCKED_BOOKINGS_ARCHIVE: {}
+        }
+        self._ids = {kind: count(1) for kind in self.records}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.idempotency_keys: Dict[str, dict] = {}
+        self.holds: Dict[str, dict] = {}
+        self.rate_rules: Dict[int, dict] = {}
+        self._rate_rule_ids = count(1)
+        self.outbox: Dict[int, dict] = {}
+        self._outbox_ids = count(1)
+        self.rollups: Dict[Tuple[str, date], Dict[str, float]] = {}
+
+    def _store(self, kind: str, record: dict) -> dict:
+        record = {**record, "id": next(self._ids[kind])}
+        record.setdefault("createdAt", datetime.utcnow())
+        self.records[kind][record["id"]] = record
+        return self._public(kind, record)
+
+    def _add_outbox_event(self, topic: str, data: dict):
+        event_id = next(self._outbox_ids)
+        self.outbox[event_id] = {
+            **outbox_event(topic, data), "id": event_id, "status": "pending", "attempts": 0,
+            "availableAt": datetime.utcnow(), "lastError": None,
+        }
+        notify_outbox()
+
+    def _apply_rollups(self, deltas: RollupDeltas):
+        for key, row in deltas.items():
+            rollup = self.rollups.setdefault(key, dict.fromkeys(ROLLUP_FIELDS, 0))
+            for field, amount in row.items():
+                rollup[field] += amount
+
+    def _public(self, kind: str, record: dict) -> dict:
+        data = {field: record.get(field) for field in LISTING_FIELDS[kind]}
+        data["id"] = str(data["id"])
+        return data
+
+    async def list_rooms(self) -> List[dict]:
+        return copy.deepcopy(list(self.rooms.values()))
+
+    async def get_room(self, room_id: str) -> Optional[dict]:
+        room = self.rooms.get(room_id)
+        return copy.deepcopy(room) if room else None
+
+    async def add_rooms(self, rooms: List[dict]):
+        for room in rooms:
+            self.rooms[room["id"]] = copy.deepcopy(room)
+        room_catalog.invalidate()
+        rate_calendar.invalidate()
+
+    def _public_rule(self, rule: dict) -> dict:
+        data = {field: copy.deepcopy(rule.get(field)) for field in RATE_RULE_FIELDS}
+        data["id"] = str(data["id"])
+        return data
+
+    async def list_rate_rules(self) -> List[dict]:
+        return [self._public_rule(rule) for rule in self.rate_rules.values()]
+
+    async def add_rate_rule(self, rule: dict) -> dict:
+        rule = {**copy.deepcopy(rule), "id": next(self._rate_rule_ids), "createdAt": datetime.utcnow()}
+        self.rate_rules[rule["id"]] = rule
+        rate_calendar.invalidate()
+        return self._public_rule(rule)
+
+    async def delete_rate_rule(self, rule_id: int) -> bool:
+        if self.rate_rules.pop(rule_id, None) is None:
+            return False
+        rate_calendar.invalidate()
+        return True
+
+    def _active_holds(self) -> List[dict]:
+        now = datetime.utcnow()
+        return [hold for hold in self.holds.values() if hold["expiresAt"] > now]
+
+    async def load_occupancy(self, room_type: str, since: datetime) -> Tuple[list, list]:
+        bookings = [
+            (b["checkIn"], b["checkOut"]) for b in self.records[BOOKINGS].values()
+            if b["roomType"] == room_type and b["status"] in ACTIVE_BOOKING_STATUSES and b["checkOut"] > since
+        ] + [
+            (h["checkIn"], h["checkOut"]) for h in self._active_holds()
+            if h["roomType"] == room_type and h["checkOut"] > since
+        ]
+        blocks = [
+            (b["checkIn"], b["checkOut"], b["roomUnit"]) for b in self.records[BLOCKED_BOOKINGS].values()
+            if b["roomType"] == room_type and b["checkOut"] > since
+        ]
+        return bookings, blocks
+
+    async def stays_in_window(self, room_types: List[str], window_start: datetime, window_end: datetime):
+        stays = []
+        for kind in (BOOKINGS, BLOCKED_BOOKINGS):
+            for record in self.records[kind].values():
+                if (record["roomType"] in room_types
+                        and record["checkIn"] < window_end and record["checkOut"] > window_start
+                        and (kind == BLOCKED_BOOKINGS or record["status"] in ACTIVE_BOOKING_STATUSES)):
+                    unit = record["roomUnit"] if kind == BLOCKED_BOOKINGS else None
+                    stays.append((record["roomType"], unit, record["checkIn"], record["checkOut"]))
+        for hold in self._active_holds():
+            if hold["roomType"] in room_types and hold["checkIn"] < window_end and hold["checkOut"] > window_start:
+                stays.append((hold["roomType"], None, hold["checkIn"], hold["checkOut"]))
+        return stays
+
+    def _take_hold(self, hold_id: str, booking: dict) -> bool:
+        hold = self.holds.get(hold_id)
+        if hold is None or hold["expiresAt"] <= datetime.utcnow() or any(
+                hold[field] != booking[field] for field in ("roomType", "checkIn", "checkOut")):
+            return False
+        del self.holds[hold_id]
+        return True
+
+    async def create_booking(self, booking: dict, total_units: int, hold_id: Optional[str] = None) -> dict:
+        room_type = booking["roomType"]
+        async with self._locks.setdefault(room_type, asyncio.Lock()):
+            if hold_id is None or not self._take_hold(hold_id, booking):
+                availability = await self.availability.check(
+                    self.load_occupancy, room_type, total_units, booking["checkIn"], booking["checkOut"], consistent=True
+                )
+                if availability["availableUnits"] <= 0:
+                    raise NoAvailability(room_type)
+            created = self._store(BOOKINGS, booking)
+            self._add_outbox_event(BOOKING_CREATED, created)
+            self._apply_rollups(stay_deltas(BOOKINGS, [created]))
+            self.availability.invalidate(room_type)
+        return created
+
+    async def create_hold(self, hold: dict, total_units: int, max_per_client: int) -> dict:
+        room_type = hold["roomType"]
+        async with self._locks.setdefault(room_type, asyncio.Lock()):
+            now = datetime.utcnow()
+            active = sum(h["client"] == hold["client"] and h["expiresAt"] > now for h in self.holds.values())
+            if active >= max_per_client:
+                raise TooManyHolds(hold["client"])
+            availability = await self.availability.check(
+                self.load_occupancy, room_type, total_units, hold["checkIn"], hold["checkOut"], consistent=True
+            )
+            if availability["availableUnits"] <= 0:
+                raise NoAvailability(room_type)
+            self.holds[hold["id"]] = dict(hold)
+            self.availability.invalidate(room_type)
+        return dict(hold)
+
+    async def get_hold(self, hold_id: str) -> Optional[dict]:
+        hold = self.holds.get(hold_id)
+        if hold is None or hold["expiresAt"] <= datetime.utcnow():
+            return None
+        return {field: hold[field] for field in ("roomType", "checkIn", "checkOut")}
+
+    async def release_hold(self, hold_id: str, release_token_hash: str) -> Optional[dict]:
+        hold = self.holds.get(hold_id)
+        if hold is None or hold["releaseTokenHash"] != release_token_hash:
+            return None
+        del self.holds[hold_id]
+        self.availability.invalidate(hold["roomType"])
+        return {field: hold[field] for field in ("roomType", "checkIn", "checkOut")}
+
+    async def expire_holds(self, now: datetime) -> List[str]:
+        expired = [hold_id for hold_id, hold in self.holds.items() if hold["expiresAt"] <= now]
+        room_types = sorted({self.holds.pop(hold_id)["roomType"] for hold_id in expired})
+        if room_types:
+            self.availability.invalidate(*room_types)
+        return room_types
+
+    async def create_block(self, block: dict, rooms: Dict[str, int]) -> dict:
+        lockable = lockable_blocks([block], rooms)
+        async with AsyncExitStack() as stack:
+            occupancy = {}
+            for b in lockable:
+                await stack.enter_async_context(self._locks.setdefault(b["roomType"], asyncio.Lock()))
+                occupancy[b["roomType"]] = RoomTypeOccupancy(
+                    b["checkIn"], *await self.load_occupancy(b["roomType"], b["checkIn"])
+                )
+            error = validate_blocks([block], rooms, occupancy)[0]
+            if error is not None:
+                raise InvalidBlock(error)
+            created = self._store(BLOCKED_BOOKINGS, block)
+            self._apply_rollups(stay_deltas(BLOCKED_BOOKINGS, [created]))
+            self.availability.invalidate(block["roomType"])
+        return created
+
+    async def create_blocks(self, blocks: List[dict], rooms: Dict[str, int], atomic: bool = False) -> List[dict]:
+        lockable = lockable_blocks(blocks, rooms)
+        room_types = sorted({b["roomType"] for b in lockable})
+        async with AsyncExitStack() as stack:
+            for room_type in room_types:
+                await stack.enter_async_context(self._locks.setdefault(room_type, asyncio.Lock()))
+            occupancy = {}
+            for room_type in room_types:
+                since = min(b["checkIn"] for b in lockable if b["roomType"] == room_type)
+                occupancy[room_type] = RoomTypeOccupancy(since, *await self.load_occupancy(room_type, since))
+            errors = validate_blocks(blocks, rooms, occupancy)
+            if refused(errors, atomic):
+                return block_results(errors, None)
+            created = [self._store(BLOCKED_BOOKINGS, b) for b, error in zip(blocks, errors) if error is None]
+            self._apply_rollups(stay_deltas(BLOCKED_BOOKINGS, created))
+            ids = [record["id"] for record in created]
+            self.availability.invalidate(*room_types)
+        return block_results(errors, ids)
+
+    def parse_id(self, value: str) -> Optional[int]:
+        return int(value) if value.isdigit() else None
+
+    async def delete(self, kind: str, record_id: int) -> Optional[dict]:
+        record = self.records[kind].pop(record_id, None)
+        if record is None:
+            return None
+        deleted = self._public(kind, record)
+        if kind == BOOKINGS:
+            self._add_outbox_event(BOOKING_CANCELLED, deleted)
+            self._apply_rollups(cancellation_deltas(record))
+        else:
+            self._apply_rollups(stay_deltas(kind, [record], sign=-1))
+        self.availability.invalidate(record["roomType"])
+        return deleted
+
+    def _sorted(self, kind: str, filters: ListingFilters, after: Optional[tuple] = None) -> List[dict]:
+        records = [
+            record for record in self.records[kind].values()
+            if matches(record, filters) and (not after or (record["createdAt"], record["id"]) < after)
+        ]
+        records.sort(key=lambda record: (record["createdAt"], record["id"]), reverse=True)
+        return records
+
+    async def list_page(self, kind: str, filters: ListingFilters, after: Optional[tuple], limit: int) -> List[dict]:
+        return [self._public(kind, record) for record in self._sorted(kind, filters, after)[:limit]]
+
+    async def export(self, kind: str, filters: ListingFilters) -> AsyncIterator[List[dict]]:
+        records = self._sorted(kind, filters)
+        for offset in range(0, len(records), EXPORT_BATCH_SIZE):
+            yield [self._public(kind, record) for record in records[offset:offset + EXPORT_BATCH_SIZE]]
+
+    async def import_records(self, kind: str, records: List[dict]):
+        created = [self._store(kind, record) for record in records]
+        self._apply_rollups(stay_deltas(kind, created))
+        self.availability.invalidate(*{record["roomType"] for record in records})
+
+    async def archive_stays(self, kind: str, before: datetime, limit: int) -> int:
+        records, archive = self.records[kind], self.records[ARCHIVE_KINDS[kind]]
+        ended = [record_id for record_id, record in records.items() if record["checkOut"] <= before][:limit]
+        for record_id in ended:
+            archive[record_id] = {**records.pop(record_id), "archivedAt": datetime.utcnow()}
+        return len(ended)
+
+    async def rollup_rows(self, room_types: List[str], start: date, end: date) -> List[tuple]:
+        return [
+            (room_type, night, *[row[field] for field in ROLLUP_FIELDS])
+            for (room_type, night), row in self.rollups.items()
+            if room_type in room_types and start <= night < end
+        ]
+
+    async def rebuild_rollups(self) -> int:
+        builder = RollupBuilder()
+        for (room_type, night), row in self.rollups.items():
+            if row["cancellations"]:
+                builder.add_cancellations(room_type, night, row["cancellations"])
+        bookings = [
+            record for kind in (BOOKINGS, BOOKINGS_ARCHIVE) for record in self.records[kind].values()
+            if record["status"] in ACTIVE_BOOKING_STATUSES
+        ]
+        if bookings:
+            builder.add_bookings(*zip(*[
+                (b["roomType"], b["checkIn"], b["checkOut"], b["totalPrice"], b["createdAt"]) for b in bookings
+            ]))
+        blocks = [
+            record for kind in (BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE) for record in self.records[kind].values()
+        ]
+        if blocks:
+            builder.add_blocks(*zip(*[(b["roomType"], b["checkIn"], b["checkOut"]) for b in blocks]))
+        rows = builder.rows()
+        self.rollups = {(row["roomType"], row["night"]): {field: row[field] for field in ROLLUP_FIELDS} for row in rows}
+        return len(rows)
+
+    async def claim_idempotency_key(self, key: str, fingerprint: str,
+                                    locked_until: datetime, expires_at: datetime) -> Optional[dict]:
+        now = datetime.utcnow()
+        record = self.idempotency_keys.get(key)
+        if record is None or record["expiresAt"] <= now or (
+                record["statusCode"] is None and record["lockedUntil"] <= now):
+            self.idempotency_keys[key] = {
+                "fingerprint": fingerprint, "statusCode": None, "response": None,
+                "lockedUntil": locked_until, "expiresAt": expires_at,
+            }
+            return None
+        return {field: record[field] for field in ("fingerprint", "statusCode", "response")}
+
+    async def complete_idempotency_key(self, key: str, status_code: int, response):
+        record = self.idempotency_keys.get(key)
+        if record is not None:
+            record.update(statusCode=status_code, response=copy.deepcopy(response))
+
+    async def release_idempotency_key(self, key: str):
+        record = self.idempotency_keys.get(key)
+        if record is not None and record["statusCode"] is None:
+            del self.idempotency_keys[key]
+
+    async def purge_idempotency_keys(self, now: datetime) -> int:
+        expired = [key for key, record in self.idempotency_keys.items() if record["expiresAt"] <= now]
+        for key in expired:
+            del self.idempotency_keys[key]
+        return len(expired)
+
+    async def claim_outbox(self, limit: int, lease_until: datetime) -> List[dict]:
+        now = datetime.utcnow()
+        due = [e for e in self.outbox.values() if e["status"] == "pending" and e["availableAt"] <= now][:limit]
+        for event in due:
+            event["availableAt"] = lease_until
+            event["attempts"] += 1
+        return [
+            {"id": str(e["id"]), "topic": e["topic"], "payload": copy.deepcopy(e["payload"]), "attempts": e["attempts"]}
+            for e in due
+        ]
+
+    async def ack_outbox(self, ids: List[str]):
+        for event_id in ids:
+            self.outbox.pop(int(event_id), None)
+
+    async def nack_outbox(self, ids: List[str], error: str, retry_at: Optional[datetime]):
+        for event_id in ids:
+            event = self.outbox.get(int(event_id))
+            if event is None:
+                continue
+            event["lastError"] = error
+            if retry_at is None:
+                event["status"] = "failed"
+            else:
+                event["availableAt"] = retry_at
+
+    async def outbox_status(self) -> dict:
+        statuses = [event["status"] for event in self.outbox.values()]
+        return {"pending": statuses.count("pending"), "failed": statuses.count("failed")}
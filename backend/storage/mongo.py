@@ -0,0 +1,631 @@
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import time
+import uuid
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from analytics import (
+    ROLLUP_BATCH_SIZE, ROLLUP_FIELDS, RollupBuilder, RollupDeltas, cancellation_deltas, stay_deltas
+)
+from availability import ACTIVE_BOOKING_STATUSES, RoomTypeOccupancy, max_concurrent, to_naive_utc
+from catalog import room_catalog
+from inventory import nights_by_room_type, stay_nights
+from listings import (
+    ARCHIVE_KINDS, BOOKINGS, BOOKINGS_ARCHIVE, BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE, EXPORT_BATCH_SIZE,
+    LISTING_FIELDS, ListingFilters
+)
+from pricing import RATE_RULE_FIELDS, rate_calendar
+from outbox import BOOKING_CANCELLED, BOOKING_CREATED, notify as notify_outbox, outbox_event
+from storage.base import (
+    InvalidBlock, NoAvailability, StorageBackend, TooManyHolds, block_results, lockable_blocks, refused,
+    validate_blocks
+)
+
+# Night locks left behind by a crashed worker are taken over after this long
+NIGHT_LOCK_TTL = timedelta(seconds=30)
+# Give up on a reservation that cannot get its night locks within this many seconds
+NIGHT_LOCK_WAIT = 10.0
+# How long a rollup rebuild may hold (and wait for) one room type's night locks
+ROLLUP_REBUILD_LOCK_TTL = timedelta(minutes=5)
+
+LISTING_ORDER = [("createdAt", DESCENDING), ("_id", DESCENDING)]
+
+STAY_KINDS = (BOOKINGS, BOOKINGS_ARCHIVE, BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE)
+ONE_DAY_MS = 86_400_000
+
+# Created at startup; create_index is a no-op for indexes that already exist
+INDEXES = {
+    "rooms": [([("id", ASCENDING)], {"unique": True})],
+    BOOKINGS: [
+        ([("roomType", ASCENDING), ("checkIn", ASCENDING), ("checkOut", ASCENDING)], {}),
+        (LISTING_ORDER, {}),
+        ([("checkOut", ASCENDING)], {}),
+    ],
+    BLOCKED_BOOKINGS: [
+        ([("roomType", ASCENDING), ("checkIn", ASCENDING), ("checkOut", ASCENDING)], {}),
+        (LISTING_ORDER, {}),
+        ([("checkOut", ASCENDING)], {}),
+    ],
+    BOOKINGS_ARCHIVE: [([("roomType", ASCENDING), ("checkIn", ASCENDING)], {}), (LISTING_ORDER, {})],
+    BLOCKED_BOOKINGS_ARCHIVE: [([("roomType", ASCENDING), ("checkIn", ASCENDING)], {}), (LISTING_ORDER, {})],
+    # Lets the server drop locks of crashed workers on its own
+    "inventory_locks": [([("expiresAt", ASCENDING)], {"expireAfterSeconds": 0})],
+    # Expired keys are removed by the server; purge_idempotency_keys only
+    # catches up between its TTL monitor passes
+    "idempotency_keys": [([("expiresAt", ASCENDING)], {"expireAfterSeconds": 0})],
+    "outbox": [([("status", ASCENDING), ("availableAt", ASCENDING)], {})],
+    "daily_rollups": [([("roomType", ASCENDING), ("night", ASCENDING)], {"unique": True})],
+    # The TTL index is only a backstop: expired holds stop counting at once
+    # and the sweeper deletes them long before the server's TTL monitor
+    "inventory_holds": [
+        ([("roomType", ASCENDING), ("checkIn", ASCENDING), ("checkOut", ASCENDING)], {}),
+        ([("expiresAt", ASCENDING)], {"expireAfterSeconds": 0}),
+        ([("client", ASCENDING)], {}),
+    ],
+}
+
+
+def listing_filter(filters: ListingFilters, after: Optional[tuple] = None) -> dict:
+    query = {}
+    if filters.roomType:
+        query["roomType"] = filters.roomType
+    if filters.status:
+        query["status"] = filters.status
+    if filters.dateFrom:
+        query["checkOut"] = {"$gt": filters.dateFrom}
+    if filters.dateTo:
+        query["checkIn"] = {"$lt": filters.dateTo}
+    if after:
+        created_at, record_id = after
+        query["$or"] = [
+            {"createdAt": {"$lt": created_at}},
+            {"createdAt": created_at, "_id": {"$lt": record_id}},
+        ]
+    return query
+
+
+def overlapping(room_type: str, check_in: datetime, check_out: datetime) -> dict:
+    return {"roomType": room_type, "checkIn": {"$lt": check_out}, "checkOut": {"$gt": check_in}}
+
+
+def listing_projection(kind: str) -> dict:
+    return {field: 1 for field in LISTING_FIELDS[kind] if field != "id"}
+
+
+def from_document(kind: str, doc: dict) -> dict:
+    data = {field: doc.get(field) for field in LISTING_FIELDS[kind]}
+    data["id"] = str(doc["_id"])
+    return data
+
+
+def midnight(night: date) -> datetime:
+    # BSON has no date type; nights are stored as midnight datetimes
+    return datetime.combine(night, datetime.min.time())
+
+
+def rule_from_document(doc: dict) -> dict:
+    data = {field: doc.get(field) for field in RATE_RULE_FIELDS}
+    data["id"] = str(doc["_id"])
+    for field in ("start", "end"):
+        if data[field] is not None:
+            data[field] = data[field].date()
+    return data
+
+
+class MongoStorage(StorageBackend):
+    """Motor backend.
+
+    Standalone servers have no multi-document transactions, so a reservation
+    serializes with its competitors through one lock document per (room type,
+    night) in ``inventory_locks``, taken in night order like the SQL backend's
+    lock rows. For the same reason outbox events and rollup updates are
+    written right after the booking change rather than with it: a crash in
+    between loses the event or skews the rollups (until
+    ``rebuild_rollups``), never the booking. Rollups are updated while the
+    stay's night locks are still held, so a rebuild holding them sees
+    every write either whole or not at all.
+    """
+
+    name = "mongodb"
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    async def startup(self):
+        for collection, indexes in INDEXES.items():
+            for keys, options in indexes:
+                await self.db[collection].create_index(keys, **options)
+
+    async def shutdown(self):
+        self.db.client.close()
+
+    async def list_rooms(self) -> List[dict]:
+        return await self.db.rooms.find({}, {"_id": 0}).sort("id", ASCENDING).to_list(None)
+
+    async def get_room(self, room_id: str) -> Optional[dict]:
+        return await self.db.rooms.find_one({"id": room_id}, {"_id": 0})
+
+    async def add_rooms(self, rooms: List[dict]):
+        # insert_many adds _id to the dicts it is given
+        await self.db.rooms.insert_many([dict(room) for room in rooms])
+        room_catalog.invalidate()
+        rate_calendar.invalidate()
+
+    async def list_rate_rules(self) -> List[dict]:
+        return [rule_from_document(doc) async for doc in self.db.rate_rules.find().sort("_id", ASCENDING)]
+
+    async def add_rate_rule(self, rule: dict) -> dict:
+        # BSON has no date type; rule dates are stored as midnight datetimes
+        doc = {
+            **rule, "createdAt": datetime.utcnow(),
+            **{field: datetime.combine(rule[field], datetime.min.time())
+               for field in ("start", "end") if rule.get(field)},
+        }
+        await self.db.rate_rules.insert_one(doc)
+        rate_calendar.invalidate()
+        return rule_from_document(doc)
+
+    async def delete_rate_rule(self, rule_id: ObjectId) -> bool:
+        result = await self.db.rate_rules.delete_one({"_id": rule_id})
+        rate_calendar.invalidate()
+        return result.deleted_count > 0
+
+    async def load_occupancy(self, room_type: str, since: datetime) -> Tuple[list, list]:
+        bookings = await self.db.bookings.find(
+            {"roomType": room_type, "status": {"$in": list(ACTIVE_BOOKING_STATUSES)}, "checkOut": {"$gt": since}},
+            {"_id": 0, "checkIn": 1, "checkOut": 1},
+        ).to_list(None)
+        bookings += await self.db.inventory_holds.find(
+            {"roomType": room_type, "checkOut": {"$gt": since}, "expiresAt": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "checkIn": 1, "checkOut": 1},
+        ).to_list(None)
+        blocks = await self.db.blocked_bookings.find(
+            {"roomType": room_type, "checkOut": {"$gt": since}},
+            {"_id": 0, "checkIn": 1, "checkOut": 1, "roomUnit": 1},
+        ).to_list(None)
+        return (
+            [(b["checkIn"], b["checkOut"]) for b in bookings],
+            [(b["checkIn"], b["checkOut"], b["roomUnit"]) for b in blocks],
+        )
+
+    async def stays_in_window(self, room_types: List[str], window_start: datetime, window_end: datetime):
+        overlap = {
+            "roomType": {"$in": room_types},
+            "checkIn": {"$lt": window_end},
+            "checkOut": {"$gt": window_start},
+        }
+        projection = {"_id": 0, "roomType": 1, "roomUnit": 1, "checkIn": 1, "checkOut": 1}
+        bookings = await self.db.bookings.find(
+            {**overlap, "status": {"$in": list(ACTIVE_BOOKING_STATUSES)}}, projection
+        ).to_list(None)
+        blocks = await self.db.blocked_bookings.find(overlap, projection).to_list(None)
+        holds = await self.db.inventory_holds.find(
+            {**overlap, "expiresAt": {"$gt": datetime.utcnow()}}, projection
+        ).to_list(None)
+        return [
+            (s["roomType"], s.get("roomUnit"), s["checkIn"], s["checkOut"])
+            for s in bookings + blocks + holds
+        ]
+
+    async def stay_occupancy(self, room_type: str, check_in: datetime, check_out: datetime) -> Tuple[int, int]:
+        """(blocked units, booked units) for one stay, read straight from the
+        collections: distinct blocked units are counted by the server, and
+        only the bookings and active holds overlapping the stay come back"""
+        blocked = await self.db.blocked_bookings.aggregate([
+            {"$match": overlapping(room_type, check_in, check_out)},
+            {"$group": {"_id": None, "units": {"$addToSet": "$roomUnit"}}},
+            {"$project": {"_id": 0, "count": {"$size": "$units"}}},
+        ]).to_list(1)
+        bookings = await self.db.bookings.find(
+            {**overlapping(room_type, check_in, check_out), "status": {"$in": list(ACTIVE_BOOKING_STATUSES)}},
+            {"_id": 0, "checkIn": 1, "checkOut": 1},
+        ).to_list(None)
+        bookings += await self.db.inventory_holds.find(
+            {**overlapping(room_type, check_in, check_out), "expiresAt": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "checkIn": 1, "checkOut": 1},
+        ).to_list(None)
+        booked = max_concurrent(((b["checkIn"], b["checkOut"]) for b in bookings), check_in, check_out)
+        return (blocked[0]["count"] if blocked else 0), booked
+
+    async def check_availability(self, room_type: str, total_units: int,
+                                 check_in: datetime, check_out: datetime, consistent: bool = False) -> dict:
+        """Served from the availability index, except for consistent checks
+        and stays starting before its horizon, which aggregate in MongoDB"""
+        check_in, check_out = to_naive_utc(check_in), to_naive_utc(check_out)
+        occupancy = None if consistent else await self.availability.occupancy(self.load_occupancy, room_type)
+        if occupancy is not None and occupancy.covers(check_in):
+            blocked, booked = occupancy.occupied(check_in, check_out)
+        else:
+            blocked, booked = await self.stay_occupancy(room_type, check_in, check_out)
+        return {
+            "roomType": room_type,
+            "totalUnits": total_units,
+            "blockedUnits": blocked,
+            "bookedUnits": booked,
+            "availableUnits": max(0, total_units - blocked - booked),
+        }
+
+    def lock_stay(self, room_type: str, check_in: datetime, check_out: datetime):
+        """Hold the lock document of every night of a stay for the block's duration"""
+        return self.lock_nights({room_type: stay_nights(check_in, check_out)})
+
+    @asynccontextmanager
+    async def lock_nights(self, nights: Dict[str, list], ttl: timedelta = NIGHT_LOCK_TTL):
+        """Hold the lock documents of the given nights of each room type,
+        taken in (room type, night) order. Each is taken over if still held
+        after ``ttl``, and waiting for them all gives up after ``ttl`` or
+        ``NIGHT_LOCK_WAIT``, whichever is longer.
+
+        Lock documents carry a token of this acquisition, so releasing them
+        never deletes a lock another worker took over in the meantime."""
+        owner = uuid.uuid4().hex
+        held = []
+        deadline = time.monotonic() + max(NIGHT_LOCK_WAIT, ttl.total_seconds())
+        lock_ids = sorted(
+            (room_type, night) for room_type, room_nights in nights.items() for night in room_nights
+        )
+        try:
+            for room_type, night in lock_ids:
+                lock_id = f"{room_type}|{night.isoformat()}"
+                while True:
+                    now = datetime.utcnow()
+                    try:
+                        await self.db.inventory_locks.insert_one({"_id": lock_id, "owner": owner, "expiresAt": now + ttl})
+                        break
+                    except DuplicateKeyError:
+                        # Take over a lock whose holder died
+                        await self.db.inventory_locks.delete_one({"_id": lock_id, "expiresAt": {"$lt": now}})
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"Timed out waiting for {lock_id}")
+                        await asyncio.sleep(0.02)
+                held.append(lock_id)
+            yield
+        finally:
+            if held:
+                await self.db.inventory_locks.delete_many({"_id": {"$in": held}, "owner": owner})
+
+    async def create_booking(self, booking: dict, total_units: int, hold_id: Optional[str] = None) -> dict:
+        room_type, check_in, check_out = booking["roomType"], booking["checkIn"], booking["checkOut"]
+        async with self.lock_stay(room_type, check_in, check_out):
+            # Without transactions the hold is swapped for the booking under
+            # the night locks, so no competitor sees the unit free in between;
+            # the hold already counted, so there is nothing to check
+            held = hold_id is not None and await self.db.inventory_holds.find_one_and_delete({
+                "_id": hold_id, "roomType": room_type, "checkIn": check_in, "checkOut": check_out,
+                "expiresAt": {"$gt": datetime.utcnow()},
+            }, {"_id": 1}) is not None
+            if not held:
+                availability = await self.check_availability(room_type, total_units, check_in, check_out, consistent=True)
+                if availability["availableUnits"] <= 0:
+                    raise NoAvailability(room_type)
+            doc = {**booking, "createdAt": datetime.utcnow()}
+            await self.db.bookings.insert_one(doc)
+            self.availability.invalidate(room_type)
+            created = from_document(BOOKINGS, doc)
+            await self._apply_rollups(stay_deltas(BOOKINGS, [created]))
+        await self._add_outbox_event(BOOKING_CREATED, created)
+        return created
+
+    async def create_hold(self, hold: dict, total_units: int, max_per_client: int) -> dict:
+        room_type, check_in, check_out = hold["roomType"], hold["checkIn"], hold["checkOut"]
+        async with self.lock_stay(room_type, check_in, check_out):
+            active = await self.db.inventory_holds.count_documents(
+                {"client": hold["client"], "expiresAt": {"$gt": datetime.utcnow()}}
+            )
+            if active >= max_per_client:
+                raise TooManyHolds(hold["client"])
+            availability = await self.check_availability(room_type, total_units, check_in, check_out, consistent=True)
+            if availability["availableUnits"] <= 0:
+                raise NoAvailability(room_type)
+            doc = {**hold, "_id": hold["id"], "createdAt": datetime.utcnow()}
+            del doc["id"]
+            await self.db.inventory_holds.insert_one(doc)
+            self.availability.invalidate(room_type)
+        return dict(hold)
+
+    async def get_hold(self, hold_id: str) -> Optional[dict]:
+        return await self.db.inventory_holds.find_one(
+            {"_id": hold_id, "expiresAt": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "roomType": 1, "checkIn": 1, "checkOut": 1},
+        )
+
+    async def release_hold(self, hold_id: str, release_token_hash: str) -> Optional[dict]:
+        doc = await self.db.inventory_holds.find_one_and_delete(
+            {"_id": hold_id, "releaseTokenHash": release_token_hash},
+            {"_id": 0, "roomType": 1, "checkIn": 1, "checkOut": 1},
+        )
+        if doc is None:
+            return None
+        self.availability.invalidate(doc["roomType"])
+        return doc
+
+    async def expire_holds(self, now: datetime) -> List[str]:
+        expired = {"expiresAt": {"$lte": now}}
+        room_types = await self.db.inventory_holds.distinct("roomType", expired)
+        if not room_types:
+            return []
+        await self.db.inventory_holds.delete_many(expired)
+        self.availability.invalidate(*room_types)
+        return room_types
+
+    async def create_block(self, block: dict, rooms: Dict[str, int]) -> dict:
+        lockable = lockable_blocks([block], rooms)
+        async with self.lock_nights(nights_by_room_type(lockable)):
+            occupancy = {}
+            for b in lockable:
+                occupancy[b["roomType"]] = RoomTypeOccupancy(
+                    b["checkIn"], *await self.load_occupancy(b["roomType"], b["checkIn"])
+                )
+            error = validate_blocks([block], rooms, occupancy)[0]
+            if error is not None:
+                raise InvalidBlock(error)
+            doc = {**block, "createdAt": datetime.utcnow()}
+            await self.db.blocked_bookings.insert_one(doc)
+            self.availability.invalidate(block["roomType"])
+            await self._apply_rollups(stay_deltas(BLOCKED_BOOKINGS, [doc]))
+        return from_document(BLOCKED_BOOKINGS, doc)
+
+    async def create_blocks(self, blocks: List[dict], rooms: Dict[str, int], atomic: bool = False) -> List[dict]:
+        lockable = lockable_blocks(blocks, rooms)
+        nights = nights_by_room_type(lockable)
+        async with self.lock_nights(nights):
+            occupancy = {}
+            for room_type in nights:
+                since = min(b["checkIn"] for b in lockable if b["roomType"] == room_type)
+                occupancy[room_type] = RoomTypeOccupancy(since, *await self.load_occupancy(room_type, since))
+            errors = validate_blocks(blocks, rooms, occupancy)
+            if refused(errors, atomic):
+                return block_results(errors, None)
+            created_at = datetime.utcnow()
+            docs = [{**b, "createdAt": created_at} for b, error in zip(blocks, errors) if error is None]
+            result = await self.db.blocked_bookings.insert_many(docs)
+            self.availability.invalidate(*nights)
+            await self._apply_rollups(stay_deltas(BLOCKED_BOOKINGS, docs))
+        return block_results(errors, [str(inserted_id) for inserted_id in result.inserted_ids])
+
+    async def _add_outbox_event(self, topic: str, data: dict):
+        await self.db.outbox.insert_one({
+            **outbox_event(topic, data), "status": "pending", "attempts": 0,
+            "availableAt": datetime.utcnow(), "lastError": None, "createdAt": datetime.utcnow(),
+        })
+        notify_outbox()
+
+    async def _apply_rollups(self, deltas: RollupDeltas):
+        if not deltas:
+            return
+        await self.db.daily_rollups.bulk_write([
+            UpdateOne({"roomType": room_type, "night": midnight(night)}, {"$inc": row}, upsert=True)
+            for (room_type, night), row in sorted(deltas.items())
+        ], ordered=False)
+
+    def parse_id(self, value: str) -> Optional[ObjectId]:
+        return ObjectId(value) if ObjectId.is_valid(value) else None
+
+    async def delete(self, kind: str, record_id: ObjectId) -> Optional[dict]:
+        stay = await self.db[kind].find_one({"_id": record_id}, {"roomType": 1, "checkIn": 1, "checkOut": 1})
+        if stay is None:
+            return None
+        async with self.lock_stay(stay["roomType"], stay["checkIn"], stay["checkOut"]):
+            doc = await self.db[kind].find_one_and_delete({"_id": record_id})
+            if doc is None:
+                return None
+            self.availability.invalidate(doc["roomType"])
+            if kind == BOOKINGS:
+                await self._apply_rollups(cancellation_deltas(doc))
+            else:
+                await self._apply_rollups(stay_deltas(kind, [doc], sign=-1))
+        deleted = from_document(kind, doc)
+        if kind == BOOKINGS:
+            await self._add_outbox_event(BOOKING_CANCELLED, deleted)
+        return deleted
+
+    async def list_page(self, kind: str, filters: ListingFilters, after: Optional[tuple], limit: int) -> List[dict]:
+        cursor = self.db[kind].find(listing_filter(filters, after), listing_projection(kind))
+        docs = await cursor.sort(LISTING_ORDER).limit(limit).to_list(None)
+        return [from_document(kind, doc) for doc in docs]
+
+    async def export(self, kind: str, filters: ListingFilters) -> AsyncIterator[List[dict]]:
+        """Stream one server batch at a time rather than the whole result"""
+        cursor = (
+            self.db[kind].find(listing_filter(filters), listing_projection(kind))
+            .sort(LISTING_ORDER)
+            .batch_size(EXPORT_BATCH_SIZE)
+        )
+        try:
+            while True:
+                docs = await cursor.to_list(EXPORT_BATCH_SIZE)
+                if not docs:
+                    break
+                yield [from_document(kind, doc) for doc in docs]
+        finally:
+            await cursor.close()
+
+    async def import_records(self, kind: str, records: List[dict]):
+        docs = [{**record, "createdAt": record.get("createdAt") or datetime.utcnow()} for record in records]
+        async with self.lock_nights(nights_by_room_type(docs)):
+            await self.db[kind].insert_many(docs)
+            await self._apply_rollups(stay_deltas(kind, docs))
+        self.availability.invalidate(*{record["roomType"] for record in records})
+
+    async def archive_stays(self, kind: str, before: datetime, limit: int) -> int:
+        """Copy, then delete. A crash in between leaves the records in both
+        collections until the next run, which skips the copies it already made."""
+        docs = await self.db[kind].find({"checkOut": {"$lte": before}}).limit(limit).to_list(None)
+        if not docs:
+            return 0
+        archived_at = datetime.utcnow()
+        try:
+            await self.db[ARCHIVE_KINDS[kind]].insert_many(
+                [{**doc, "archivedAt": archived_at} for doc in docs], ordered=False
+            )
+        except BulkWriteError as exc:
+            if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                raise
+        await self.db[kind].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        return len(docs)
+
+    async def rollup_rows(self, room_types: List[str], start: date, end: date) -> List[tuple]:
+        cursor = self.db.daily_rollups.find(
+            {"roomType": {"$in": room_types}, "night": {"$gte": midnight(start), "$lt": midnight(end)}}, {"_id": 0}
+        )
+        return [
+            (doc["roomType"], doc["night"].date(), *[doc.get(field, 0) for field in ROLLUP_FIELDS])
+            async for doc in cursor
+        ]
+
+    async def _stream(self, kind: str, query: dict, fields: List[str]) -> AsyncIterator[List[tuple]]:
+        cursor = self.db[kind].find(query, {field: 1 for field in fields}).batch_size(ROLLUP_BATCH_SIZE)
+        try:
+            while True:
+                docs = await cursor.to_list(ROLLUP_BATCH_SIZE)
+                if not docs:
+                    break
+                yield [tuple(doc.get(field) for field in fields) for doc in docs]
+        finally:
+            await cursor.close()
+
+    async def rebuild_rollups(self) -> int:
+        """Recompute the rollups one room type at a time, holding the night
+        locks of every night its stays and rollup rows cover. Writers update
+        rollups under those locks, so none of their updates is lost; they
+        wait for the room type's rebuild instead (and give up after
+        ``NIGHT_LOCK_WAIT``)."""
+        room_types = set(await self.db.daily_rollups.distinct("roomType"))
+        for kind in STAY_KINDS:
+            room_types.update(await self.db[kind].distinct("roomType"))
+        written = 0
+        for room_type in sorted(room_types):
+            window = await self._rollup_window(room_type)
+            nights = stay_nights(*window) if window else []
+            if not nights:
+                continue
+            async with self.lock_nights({room_type: nights}, ROLLUP_REBUILD_LOCK_TTL):
+                written += await self._rebuild_room_type(room_type, nights[0], nights[-1])
+        return written
+
+    async def _rollup_window(self, room_type: str) -> Optional[Tuple[datetime, datetime]]:
+        """From the earliest check-in to the latest check-out (or rollup
+        night) of a room type"""
+        bounds = []
+        for kind, first, last in [(kind, "$checkIn", "$checkOut") for kind in STAY_KINDS] + [
+            ("daily_rollups", "$night", {"$add": ["$night", ONE_DAY_MS]}),
+        ]:
+            async for doc in self.db[kind].aggregate([
+                {"$match": {"roomType": room_type}},
+                {"$group": {"_id": None, "first": {"$min": first}, "last": {"$max": last}}},
+            ]):
+                bounds += [doc["first"], doc["last"]]
+        return (min(bounds), max(bounds)) if bounds else None
+
+    async def _rebuild_room_type(self, room_type: str, first: date, last: date) -> int:
+        """Rewrite a room type's rollup rows on nights [first, last] from its
+        stays, streamed in batches of columns into a ``RollupBuilder``"""
+        rows_in_window = {"roomType": room_type, "night": {"$gte": midnight(first), "$lte": midnight(last)}}
+        builder = RollupBuilder()
+        async for doc in self.db.daily_rollups.find({**rows_in_window, "cancellations": {"$gt": 0}}):
+            builder.add_cancellations(room_type, doc["night"].date(), doc["cancellations"])
+        # Archiving copies stays before deleting them, so a stay may turn up
+        # in both collections; live ones are read first and count once
+        for kinds, query, fields, add in (
+            ((BOOKINGS, BOOKINGS_ARCHIVE), {"status": {"$in": list(ACTIVE_BOOKING_STATUSES)}},
+             ["roomType", "checkIn", "checkOut", "totalPrice", "createdAt"], builder.add_bookings),
+            ((BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE), {}, ["roomType", "checkIn", "checkOut"], builder.add_blocks),
+        ):
+            seen = set()
+            for kind in kinds:
+                async for batch in self._stream(kind, {**query, "roomType": room_type}, ["_id", *fields]):
+                    rows = [row[1:] for row in batch if row[0] not in seen]
+                    seen.update(row[0] for row in batch)
+                    if rows:
+                        add(*zip(*rows))
+        # Nights outside the window are not locked; only stays written since
+        # the window was measured have rows there, and those are current
+        rows = [row for row in builder.rows() if first <= row["night"] <= last]
+        await self.db.daily_rollups.delete_many(rows_in_window)
+        for offset in range(0, len(rows), ROLLUP_BATCH_SIZE):
+            await self.db.daily_rollups.insert_many([
+                {**row, "night": midnight(row["night"])} for row in rows[offset:offset + ROLLUP_BATCH_SIZE]
+            ])
+        return len(rows)
+
+    async def claim_idempotency_key(self, key: str, fingerprint: str,
+                                    locked_until: datetime, expires_at: datetime) -> Optional[dict]:
+        claim = {"fingerprint": fingerprint, "statusCode": None, "response": None,
+                 "lockedUntil": locked_until, "expiresAt": expires_at}
+        while True:
+            try:
+                await self.db.idempotency_keys.insert_one({"_id": key, **claim})
+                return None
+            except DuplicateKeyError:
+                pass
+            # Take over an expired or abandoned key; the filter lets only one attempt win
+            now = datetime.utcnow()
+            taken = await self.db.idempotency_keys.find_one_and_update(
+                {"_id": key, "$or": [
+                    {"expiresAt": {"$lte": now}},
+                    {"statusCode": None, "lockedUntil": {"$lte": now}},
+                ]},
+                {"$set": claim},
+                projection={"_id": 1},
+            )
+            if taken is not None:
+                return None
+            record = await self.db.idempotency_keys.find_one(
+                {"_id": key}, {"_id": 0, "fingerprint": 1, "statusCode": 1, "response": 1}
+            )
+            # Expired and removed between the two calls: try inserting again
+            if record is not None:
+                return record
+
+    async def complete_idempotency_key(self, key: str, status_code: int, response):
+        await self.db.idempotency_keys.update_one(
+            {"_id": key}, {"$set": {"statusCode": status_code, "response": response}}
+        )
+
+    async def release_idempotency_key(self, key: str):
+        await self.db.idempotency_keys.delete_one({"_id": key, "statusCode": None})
+
+    async def purge_idempotency_keys(self, now: datetime) -> int:
+        result = await self.db.idempotency_keys.delete_many({"expiresAt": {"$lte": now}})
+        return result.deleted_count
+
+    async def claim_outbox(self, limit: int, lease_until: datetime) -> List[dict]:
+        # One atomic update per event, so concurrent workers never share one
+        events = []
+        while len(events) < limit:
+            doc = await self.db.outbox.find_one_and_update(
+                {"status": "pending", "availableAt": {"$lte": datetime.utcnow()}},
+                {"$set": {"availableAt": lease_until}, "$inc": {"attempts": 1}},
+                projection={"topic": 1, "payload": 1, "attempts": 1},
+                sort=[("_id", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is None:
+                break
+            events.append({"id": str(doc["_id"]), "topic": doc["topic"], "payload": doc["payload"],
+                           "attempts": doc["attempts"]})
+        return events
+
+    async def ack_outbox(self, ids: List[str]):
+        await self.db.outbox.delete_many({"_id": {"$in": [ObjectId(i) for i in ids]}})
+
+    async def nack_outbox(self, ids: List[str], error: str, retry_at: Optional[datetime]):
+        update = {"lastError": error}
+        if retry_at is None:
+            update["status"] = "failed"
+        else:
+            update["availableAt"] = retry_at
+        await self.db.outbox.update_many({"_id": {"$in": [ObjectId(i) for i in ids]}}, {"$set": update})
+
+    async def outbox_status(self) -> dict:
+        counts = {
+            doc["_id"]: doc["count"]
+            async for doc in self.db.outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        }
+        return {"pending": counts.get("pending", 0), "failed": counts.get("failed", 0)}
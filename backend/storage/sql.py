@@ -0,0 +1,637 @@
+from datetime import date, datetime
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    String, and_, delete, event, func, insert, literal, or_, select, tuple_, union_all, update
+)
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from analytics import ROLLUP_FIELDS, RollupDeltas, cancellation_deltas, rollup_params, stay_deltas
+from availability import ACTIVE_BOOKING_STATUSES, AvailabilityIndex, RoomTypeOccupancy
+from catalog import room_catalog
+from db_pool import DB_POOL_WARM, warm_pool
+from database import (
+    Room, Booking, BookingArchive, BlockedBooking, BlockedBookingArchive, DailyRollup, IdempotencyKey, InventoryHold,
+    OutboxEvent, RateRule
+)
+from inventory import ensure_inventory_nights, lock_nights, lock_stay, nights_by_room_type, with_lock_retry
+from listings import (
+    ARCHIVE_KINDS, BOOKINGS, BOOKINGS_ARCHIVE, BLOCKED_BOOKINGS, BLOCKED_BOOKINGS_ARCHIVE, EXPORT_BATCH_SIZE,
+    LISTING_FIELDS, ListingFilters
+)
+from migrations import ensure_schema, rebuild_daily_rollups
+from pricing import RATE_RULE_FIELDS, rate_calendar
+from outbox import BOOKING_CANCELLED, BOOKING_CREATED, notify as notify_outbox, outbox_event
+from serialization import rows_to_dicts
+from replicas import ReplicaRouter
+from storage.base import (
+    InvalidBlock, NoAvailability, StorageBackend, TooManyHolds, block_results, lockable_blocks, refused,
+    validate_blocks
+)
+
+MODELS = {
+    BOOKINGS: Booking,
+    BLOCKED_BOOKINGS: BlockedBooking,
+    BOOKINGS_ARCHIVE: BookingArchive,
+    BLOCKED_BOOKINGS_ARCHIVE: BlockedBookingArchive,
+}
+
+# Replica routing key for reads of the room catalog
+ROOMS = "rooms"
+
+ROOM_FIELDS = ["id", "type", "available", "price", "description", "amenities", "image", "maxGuests"]
+
+# Shared by every SQL backend in the process so the session events below
+# can invalidate it
+availability_index = AvailabilityIndex()
+
+
+async def load_occupancy(db: AsyncSession, room_type: str, since: datetime) -> Tuple[list, list]:
+    """Fetch booking and block intervals of a room type still open after
+    ``since``; active holds come back with the bookings"""
+    bookings = (await db.execute(union_all(
+        select(Booking.checkIn, Booking.checkOut).where(
+            Booking.roomType == room_type,
+            Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+            Booking.checkOut > since,
+        ),
+        select(InventoryHold.checkIn, InventoryHold.checkOut).where(
+            InventoryHold.roomType == room_type,
+            InventoryHold.checkOut > since,
+            InventoryHold.expiresAt > datetime.utcnow(),
+        ),
+    ))).all()
+    blocks = (await db.execute(
+        select(BlockedBooking.checkIn, BlockedBooking.checkOut, BlockedBooking.roomUnit).where(
+            BlockedBooking.roomType == room_type,
+            BlockedBooking.checkOut > since,
+        )
+    )).all()
+    return [tuple(row) for row in bookings], [tuple(row) for row in blocks]
+
+
+def listing_query(model, fields: List[str], filters: ListingFilters):
+    """Newest-first select of ``fields`` from a booking table with the admin filters applied.
+
+    Selecting columns rather than entities skips building ORM objects.
+    """
+    columns = [getattr(model, field) for field in fields]
+    query = select(*columns).order_by(model.createdAt.desc(), model.id.desc())
+    if filters.roomType:
+        query = query.where(model.roomType == filters.roomType)
+    if filters.status:
+        query = query.where(model.status == filters.status)
+    if filters.dateFrom:
+        query = query.where(model.checkOut > filters.dateFrom)
+    if filters.dateTo:
+        query = query.where(model.checkIn < filters.dateTo)
+    return query
+
+
+def after_cursor(query, model, after: Optional[tuple]):
+    """Restrict a newest-first listing to rows strictly after (createdAt, id)"""
+    if not after:
+        return query
+    created_at, row_id = after
+    return query.where(or_(
+        model.createdAt < created_at,
+        and_(model.createdAt == created_at, model.id < row_id),
+    ))
+
+
+def to_dict(obj, fields: List[str]) -> dict:
+    return rows_to_dicts([[getattr(obj, field) for field in fields]], fields)[0]
+
+
+def new_outbox_event(topic: str, data: dict) -> OutboxEvent:
+    return OutboxEvent(**outbox_event(topic, data), availableAt=datetime.utcnow())
+
+
+def rollup_upsert(dialect: str):
+    """Inserts a rollup row, or adds to the one already there; a Core
+    statement on the table, so it runs as an executemany"""
+    table = DailyRollup.__table__
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({field: table.c[field] + stmt.inserted[field] for field in ROLLUP_FIELDS})
+    stmt = sqlite.insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.roomType, table.c.night],
+        set_={field: table.c[field] + stmt.excluded[field] for field in ROLLUP_FIELDS},
+    )
+
+
+ROLLUP_UPSERTS = {dialect: rollup_upsert(dialect) for dialect in ("mysql", "sqlite")}
+
+
+async def apply_rollups(db: AsyncSession, deltas: RollupDeltas):
+    """Add rollup deltas in the session's transaction, in primary key order.
+
+    ``ensure_inventory_nights`` usually created the rows along with the lock
+    rows of the stay's nights. A rebuild keeps only non-empty rows, though,
+    and booking through a hold takes no locks, so missing rows are inserted.
+    """
+    if not deltas:
+        return
+    await db.execute(ROLLUP_UPSERTS[db.bind.dialect.name], rollup_params(deltas))
+
+
+async def add_booking(db: AsyncSession, booking: dict) -> Booking:
+    """Insert a booking with its outbox event and rollups and commit them together"""
+    new_booking = Booking(**booking)
+    db.add(new_booking)
+    # The event commits with the booking or not at all
+    await db.flush()
+    db.add(new_outbox_event(BOOKING_CREATED, {**booking, "id": str(new_booking.id)}))
+    await apply_rollups(db, stay_deltas(BOOKINGS, [booking]))
+    await db.commit()
+    return new_booking
+
+
+class SQLStorage(StorageBackend):
+    """SQLAlchemy backend (MySQL in production, SQLite for local runs)"""
+
+    name = "mysql"
+
+    def __init__(self, session_factory: async_sessionmaker, replica_router: Optional[ReplicaRouter] = None):
+        self.session_factory = session_factory
+        self.replica_router = replica_router
+        self.availability = availability_index
+
+    @property
+    def engine(self):
+        return self.session_factory.kw["bind"]
+
+    def write_session(self) -> AsyncSession:
+        """Session on the primary; its commits keep later reads of what it
+        wrote on the primary too"""
+        if self.replica_router is None:
+            return self.session_factory()
+        return self.session_factory(info={"replica_router": self.replica_router})
+
+    def read_session(self, *keys: str) -> AsyncSession:
+        """Session for a read-only unit of work over ``keys`` (room types or
+        ``ROOMS``; none for reads spanning everything)"""
+        if self.replica_router is None:
+            return self.session_factory()
+        return self.replica_router.read_sessions(*keys)()
+
+    def _written(self, *room_types: str):
+        """Bookkeeping for Core writes, which skip the session events below"""
+        self.availability.invalidate(*room_types)
+        if self.replica_router is not None:
+            self.replica_router.note_write(*room_types)
+
+    async def startup(self):
+        # Migrates only when the schema is behind, which is once per deployment
+        async with self.engine.begin() as conn:
+            await conn.run_sync(ensure_schema)
+        await warm_pool(self.engine, DB_POOL_WARM)
+        if self.replica_router is not None:
+            await self.replica_router.start()
+
+    async def shutdown(self):
+        if self.replica_router is not None:
+            await self.replica_router.stop()
+        await self.engine.dispose()
+
+    async def list_rooms(self) -> List[dict]:
+        async with self.read_session(ROOMS) as db:
+            rooms = (await db.scalars(select(Room).order_by(Room.id))).all()
+        return [{field: getattr(room, field) for field in ROOM_FIELDS} for room in rooms]
+
+    async def get_room(self, room_id: str) -> Optional[dict]:
+        async with self.read_session(ROOMS) as db:
+            room = await db.get(Room, room_id)
+        if room is None:
+            return None
+        return {field: getattr(room, field) for field in ROOM_FIELDS}
+
+    async def add_rooms(self, rooms: List[dict]):
+        async with self.write_session() as db:
+            db.add_all(Room(**room) for room in rooms)
+            await db.commit()
+
+    async def list_rate_rules(self) -> List[dict]:
+        async with self.read_session(ROOMS) as db:
+            rules = (await db.scalars(select(RateRule).order_by(RateRule.id))).all()
+        return [to_dict(rule, RATE_RULE_FIELDS) for rule in rules]
+
+    async def add_rate_rule(self, rule: dict) -> dict:
+        async with self.write_session() as db:
+            new_rule = RateRule(**rule)
+            db.add(new_rule)
+            await db.commit()
+            return to_dict(new_rule, RATE_RULE_FIELDS)
+
+    async def delete_rate_rule(self, rule_id: int) -> bool:
+        async with self.write_session() as db:
+            rule = await db.get(RateRule, rule_id)
+            if not rule:
+                return False
+            await db.delete(rule)
+            await db.commit()
+            return True
+
+    async def load_occupancy(self, room_type: str, since: datetime) -> Tuple[list, list]:
+        async with self.read_session(room_type) as db:
+            return await load_occupancy(db, room_type, since)
+
+    async def check_availability(self, room_type: str, total_units: int,
+                                 check_in: datetime, check_out: datetime) -> dict:
+        # One session for however many loads the index needs
+        async with self.read_session(room_type) as db:
+            return await self.availability.check(
+                partial(load_occupancy, db), room_type, total_units, check_in, check_out
+            )
+
+    async def stays_in_window(self, room_types: List[str], window_start: datetime, window_end: datetime):
+        # Bookings, holds and blocks come back from one UNION ALL query
+        stays = union_all(
+            select(Booking.roomType, literal(None, String).label("roomUnit"), Booking.checkIn, Booking.checkOut).where(
+                Booking.roomType.in_(room_types),
+                Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+                Booking.checkIn < window_end,
+                Booking.checkOut > window_start,
+            ),
+            select(BlockedBooking.roomType, BlockedBooking.roomUnit, BlockedBooking.checkIn, BlockedBooking.checkOut).where(
+                BlockedBooking.roomType.in_(room_types),
+                BlockedBooking.checkIn < window_end,
+                BlockedBooking.checkOut > window_start,
+            ),
+            select(InventoryHold.roomType, literal(None, String).label("roomUnit"), InventoryHold.checkIn, InventoryHold.checkOut).where(
+                InventoryHold.roomType.in_(room_types),
+                InventoryHold.checkIn < window_end,
+                InventoryHold.checkOut > window_start,
+                InventoryHold.expiresAt > datetime.utcnow(),
+            ),
+        )
+        async with self.read_session(*room_types) as db:
+            return (await db.execute(stays)).all()
+
+    async def create_booking(self, booking: dict, total_units: int, hold_id: Optional[str] = None) -> dict:
+        room_type, check_in, check_out = booking["roomType"], booking["checkIn"], booking["checkOut"]
+        async with self.write_session() as db:
+            if hold_id is not None:
+                # The hold already counts against availability, so swapping it
+                # for the booking in one transaction needs no night locks
+                consumed = await db.execute(delete(InventoryHold).where(
+                    InventoryHold.id == hold_id,
+                    InventoryHold.roomType == room_type,
+                    InventoryHold.checkIn == check_in,
+                    InventoryHold.checkOut == check_out,
+                    InventoryHold.expiresAt > datetime.utcnow(),
+                ))
+                if consumed.rowcount == 1:
+                    new_booking = await add_booking(db, booking)
+                    await db.refresh(new_booking)
+                    return to_dict(new_booking, LISTING_FIELDS[BOOKINGS])
+                # Expired or not this stay's: book the regular way
+                await db.rollback()
+
+            async def reserve():
+                # Serialize with reservations competing for the same nights, then
+                # check availability against committed rows
+                await lock_stay(db, room_type, check_in, check_out)
+                availability = await self.availability.check(
+                    partial(load_occupancy, db), room_type, total_units, check_in, check_out, consistent=True
+                )
+                if availability["availableUnits"] <= 0:
+                    await db.rollback()
+                    raise NoAvailability(room_type)
+                return await add_booking(db, booking)
+
+            new_booking = await with_lock_retry(db, reserve)
+            await db.refresh(new_booking)
+            return to_dict(new_booking, LISTING_FIELDS[BOOKINGS])
+
+    async def create_hold(self, hold: dict, total_units: int, max_per_client: int) -> dict:
+        room_type, check_in, check_out = hold["roomType"], hold["checkIn"], hold["checkOut"]
+        async with self.write_session() as db:
+            async def reserve():
+                await lock_stay(db, room_type, check_in, check_out)
+                active = await db.scalar(select(func.count()).select_from(InventoryHold).where(
+                    InventoryHold.client == hold["client"], InventoryHold.expiresAt > datetime.utcnow()
+                ))
+                if active >= max_per_client:
+                    await db.rollback()
+                    raise TooManyHolds(hold["client"])
+                availability = await self.availability.check(
+                    partial(load_occupancy, db), room_type, total_units, check_in, check_out, consistent=True
+                )
+                if availability["availableUnits"] <= 0:
+                    await db.rollback()
+                    raise NoAvailability(room_type)
+                db.add(InventoryHold(**hold))
+                await db.commit()
+
+            await with_lock_retry(db, reserve)
+        return dict(hold)
+
+    async def get_hold(self, hold_id: str) -> Optional[dict]:
+        # From the primary: the hold was usually placed moments ago
+        async with self.write_session() as db:
+            hold = await db.get(InventoryHold, hold_id)
+            if hold is None or hold.expiresAt <= datetime.utcnow():
+                return None
+            return {field: getattr(hold, field) for field in ("roomType", "checkIn", "checkOut")}
+
+    async def release_hold(self, hold_id: str, release_token_hash: str) -> Optional[dict]:
+        async with self.write_session() as db:
+            hold = await db.get(InventoryHold, hold_id)
+            if hold is None or hold.releaseTokenHash != release_token_hash:
+                return None
+            released = {field: getattr(hold, field) for field in ("roomType", "checkIn", "checkOut")}
+            await db.delete(hold)
+            await db.commit()
+            return released
+
+    async def expire_holds(self, now: datetime) -> List[str]:
+        expired = InventoryHold.expiresAt <= now
+        async with self.write_session() as db:
+            room_types = list((await db.scalars(select(InventoryHold.roomType).where(expired).distinct())).all())
+            if not room_types:
+                return []
+            await db.execute(delete(InventoryHold).where(expired))
+            await db.commit()
+        self._written(*room_types)
+        return room_types
+
+    async def create_block(self, block: dict, rooms: Dict[str, int]) -> dict:
+        lockable = lockable_blocks([block], rooms)
+        async with self.write_session() as db:
+            async def reserve():
+                # Take the same night locks as bookings so a block cannot slip in
+                # between a booking's availability check and its commit
+                await lock_nights(db, nights_by_room_type(lockable))
+                occupancy = {}
+                for b in lockable:
+                    occupancy[b["roomType"]] = RoomTypeOccupancy(
+                        b["checkIn"], *await load_occupancy(db, b["roomType"], b["checkIn"])
+                    )
+                error = validate_blocks([block], rooms, occupancy)[0]
+                if error is not None:
+                    await db.rollback()
+                    raise InvalidBlock(error)
+                new_blocked = BlockedBooking(**block)
+                db.add(new_blocked)
+                await apply_rollups(db, stay_deltas(BLOCKED_BOOKINGS, [block]))
+                await db.commit()
+                return new_blocked
+
+            new_blocked = await with_lock_retry(db, reserve)
+            await db.refresh(new_blocked)
+            return to_dict(new_blocked, LISTING_FIELDS[BLOCKED_BOOKINGS])
+
+    async def create_blocks(self, blocks: List[dict], rooms: Dict[str, int], atomic: bool = False) -> List[dict]:
+        lockable = lockable_blocks(blocks, rooms)
+        nights = nights_by_room_type(lockable)
+        async with self.write_session() as db:
+            async def reserve():
+                await lock_nights(db, nights)
+                occupancy = {}
+                for room_type in nights:
+                    since = min(b["checkIn"] for b in lockable if b["roomType"] == room_type)
+                    occupancy[room_type] = RoomTypeOccupancy(since, *await load_occupancy(db, room_type, since))
+                errors = validate_blocks(blocks, rooms, occupancy)
+                if refused(errors, atomic):
+                    await db.rollback()
+                    return errors, None
+                valid = [b for b, error in zip(blocks, errors) if error is None]
+                # One multi-row INSERT; Core statements skip the session's
+                # flush events, so the index is invalidated below
+                await db.execute(insert(BlockedBooking).values(valid))
+                # No two valid blocks share a unit and night, and nothing else
+                # can insert one while the nights are locked, so the stay
+                # identifies each new row
+                key = (BlockedBooking.roomType, BlockedBooking.roomUnit, BlockedBooking.checkIn, BlockedBooking.checkOut)
+                rows = await db.execute(
+                    select(BlockedBooking.id, *key)
+                    .where(tuple_(*key).in_([(b["roomType"], b["roomUnit"], b["checkIn"], b["checkOut"]) for b in valid]))
+                )
+                ids = {tuple(row[1:]): row[0] for row in rows}
+                await apply_rollups(db, stay_deltas(BLOCKED_BOOKINGS, valid))
+                await db.commit()
+                return errors, [str(ids[(b["roomType"], b["roomUnit"], b["checkIn"], b["checkOut"])]) for b in valid]
+
+            errors, ids = await with_lock_retry(db, reserve)
+        if ids:
+            self._written(*nights)
+        return block_results(errors, ids)
+
+    def parse_id(self, value: str) -> Optional[int]:
+        return int(value) if value.isdigit() else None
+
+    async def delete(self, kind: str, record_id: int) -> Optional[dict]:
+        async with self.write_session() as db:
+            record = await db.get(MODELS[kind], record_id)
+            if not record:
+                return None
+            await db.delete(record)
+            data = to_dict(record, LISTING_FIELDS[kind])
+            if kind == BOOKINGS:
+                db.add(new_outbox_event(BOOKING_CANCELLED, data))
+                await apply_rollups(db, cancellation_deltas(data))
+            else:
+                await apply_rollups(db, stay_deltas(kind, [data], sign=-1))
+            await db.commit()
+            return data
+
+    async def list_page(self, kind: str, filters: ListingFilters, after: Optional[tuple], limit: int) -> List[dict]:
+        model, fields = MODELS[kind], LISTING_FIELDS[kind]
+        query = after_cursor(listing_query(model, fields, filters), model, after).limit(limit)
+        async with self.read_session() as db:
+            return rows_to_dicts((await db.execute(query)).all(), fields)
+
+    async def export(self, kind: str, filters: ListingFilters) -> AsyncIterator[List[dict]]:
+        """Stream straight off a server-side cursor.
+
+        Opens its own session: request-scoped sessions are closed before a
+        streaming response body is sent.
+        """
+        fields = LISTING_FIELDS[kind]
+        query = listing_query(MODELS[kind], fields, filters)
+        async with self.read_session() as db:
+            result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for partition in result.partitions():
+                yield rows_to_dicts(partition, fields)
+
+    async def import_records(self, kind: str, records: List[dict]):
+        async with self.write_session() as db:
+            await ensure_inventory_nights(db, nights_by_room_type(records))
+            await db.execute(insert(MODELS[kind]), records)
+            await apply_rollups(db, stay_deltas(kind, records))
+            await db.commit()
+        self._written(*{record["roomType"] for record in records})
+
+    async def archive_stays(self, kind: str, before: datetime, limit: int) -> int:
+        model, archive = MODELS[kind], MODELS[ARCHIVE_KINDS[kind]]
+        columns = [column.name for column in model.__table__.columns]
+        async with self.write_session() as db:
+            # Skipping locked rows lets several workers archive side by side
+            ids = list((await db.scalars(
+                select(model.id).where(model.checkOut <= before).limit(limit).with_for_update(skip_locked=True)
+            )).all())
+            if not ids:
+                return 0
+            await db.execute(insert(archive).from_select(
+                columns, select(*[model.__table__.c[name] for name in columns]).where(model.id.in_(ids))
+            ))
+            await db.execute(delete(model).where(model.id.in_(ids)))
+            await db.commit()
+        # No availability bookkeeping: the index only loads stays still open
+        return len(ids)
+
+    async def rollup_rows(self, room_types: List[str], start: date, end: date) -> List[tuple]:
+        columns = [getattr(DailyRollup, field) for field in ROLLUP_FIELDS]
+        query = select(DailyRollup.roomType, DailyRollup.night, *columns).where(
+            DailyRollup.roomType.in_(room_types), DailyRollup.night >= start, DailyRollup.night < end
+        )
+        async with self.read_session() as db:
+            return [tuple(row) for row in (await db.execute(query)).all()]
+
+    async def rebuild_rollups(self) -> int:
+        async with self.engine.begin() as conn:
+            return await conn.run_sync(rebuild_daily_rollups)
+
+    async def claim_idempotency_key(self, key: str, fingerprint: str,
+                                    locked_until: datetime, expires_at: datetime) -> Optional[dict]:
+        claim = {"fingerprint": fingerprint, "statusCode": None, "response": None,
+                 "lockedUntil": locked_until, "expiresAt": expires_at}
+        async with self.write_session() as db:
+            while True:
+                try:
+                    await db.execute(insert(IdempotencyKey).values(key=key, **claim))
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()
+                # The key exists: take it over if it expired or its request was
+                # abandoned. The conditional UPDATE lets only one attempt win.
+                now = datetime.utcnow()
+                taken = await db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key, or_(
+                        IdempotencyKey.expiresAt <= now,
+                        and_(IdempotencyKey.statusCode.is_(None), IdempotencyKey.lockedUntil <= now),
+                    ))
+                    .values(createdAt=now, **claim)
+                )
+                await db.commit()
+                if taken.rowcount:
+                    return None
+                row = (await db.execute(
+                    select(IdempotencyKey.fingerprint, IdempotencyKey.statusCode, IdempotencyKey.response)
+                    .where(IdempotencyKey.key == key)
+                )).first()
+                await db.commit()
+                # Purged between the two statements: try inserting again
+                if row is not None:
+                    return {"fingerprint": row.fingerprint, "statusCode": row.statusCode, "response": row.response}
+
+    async def complete_idempotency_key(self, key: str, status_code: int, response):
+        async with self.write_session() as db:
+            await db.execute(
+                update(IdempotencyKey).where(IdempotencyKey.key == key)
+                .values(statusCode=status_code, response=response)
+            )
+            await db.commit()
+
+    async def release_idempotency_key(self, key: str):
+        async with self.write_session() as db:
+            await db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.statusCode.is_(None))
+            )
+            await db.commit()
+
+    async def purge_idempotency_keys(self, now: datetime) -> int:
+        async with self.write_session() as db:
+            result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expiresAt <= now))
+            await db.commit()
+            return result.rowcount
+
+    async def claim_outbox(self, limit: int, lease_until: datetime) -> List[dict]:
+        async with self.write_session() as db:
+            # SKIP LOCKED lets several workers claim disjoint batches
+            rows = (await db.execute(
+                select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.payload, OutboxEvent.attempts)
+                .where(OutboxEvent.status == "pending", OutboxEvent.availableAt <= datetime.utcnow())
+                .order_by(OutboxEvent.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not rows:
+                return []
+            await db.execute(
+                update(OutboxEvent).where(OutboxEvent.id.in_([row.id for row in rows]))
+                .values(availableAt=lease_until, attempts=OutboxEvent.attempts + 1)
+            )
+            await db.commit()
+        return [
+            {"id": str(row.id), "topic": row.topic, "payload": row.payload, "attempts": row.attempts + 1}
+            for row in rows
+        ]
+
+    async def ack_outbox(self, ids: List[str]):
+        async with self.write_session() as db:
+            await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([int(i) for i in ids])))
+            await db.commit()
+
+    async def nack_outbox(self, ids: List[str], error: str, retry_at: Optional[datetime]):
+        values = {"lastError": error}
+        if retry_at is None:
+            values["status"] = "failed"
+        else:
+            values["availableAt"] = retry_at
+        async with self.write_session() as db:
+            await db.execute(update(OutboxEvent).where(OutboxEvent.id.in_([int(i) for i in ids])).values(**values))
+            await db.commit()
+
+    async def outbox_status(self) -> dict:
+        async with self.read_session() as db:
+            counts = dict((await db.execute(
+                select(OutboxEvent.status, func.count()).group_by(OutboxEvent.status)
+            )).all())
+        return {"pending": counts.get("pending", 0), "failed": counts.get("failed", 0)}
+
+
+# Invalidate room types whose bookings or blocks were written in a session
+# once that session commits, and keep reads of them on the primary while
+# replicas may still be catching up
+@event.listens_for(Session, "after_flush")
+def _collect_touched_room_types(session, flush_context):
+    touched = session.info.setdefault("touched_room_types", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Booking, BlockedBooking, InventoryHold)):
+            touched.add(obj.roomType)
+        elif isinstance(obj, (Room, RateRule)):
+            session.info["rooms_touched"] = True
+        elif isinstance(obj, OutboxEvent):
+            session.info["outbox_written"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_caches(session):
+    touched = session.info.pop("touched_room_types", None)
+    if touched:
+        availability_index.invalidate(*touched)
+    rooms_touched = session.info.pop("rooms_touched", False)
+    if rooms_touched:
+        room_catalog.invalidate()
+        rate_calendar.invalidate()
+    if session.info.pop("outbox_written", False):
+        notify_outbox()
+    router = session.info.get("replica_router")
+    if router is not None and (touched or rooms_touched):
+        router.note_write(*(touched or ()), *((ROOMS,) if rooms_touched else ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_touched_room_types(session):
+    session.info.pop("touched_room_types", None)
+    session.info.pop("rooms_touched", None)
+    session.info.pop("outbox_written", None)
@@ -14,6 +14,28 @@ const getAuthHeaders = () => {
   return token ? { Authorization: `Bearer ${token}` } : {};
 };
 
+// Stays are sent as the picked calendar dates at midnight UTC, which is
+// how the server keys nights; a local midnight's toISOString() can fall on
+// the previous date
+export const toStayDate = (date) => (
+  new Date(Date.UTC(date.getFullYear(), date.getMonth(), date.getDate())).toISOString()
+);
+
+// Helper to collect every page of a cursor-paginated admin listing
+const getAllPages = async (url, params = {}) => {
+  const rows = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(url, {
+      headers: getAuthHeaders(),
+      params: cursor ? { ...params, cursor } : params
+    });
+    rows.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return rows;
+};
+
 // Admin Authentication
 export const adminLogin = async (username, password) => {
   try {
@@ -51,8 +73,8 @@ export const checkRoomAvailability = async (roomType, checkIn, checkOut) => {
     const response = await axios.get(`${API}/rooms/availability`, {
       params: {
         roomType,
-        checkIn: checkIn.toISOString(),
-        checkOut: checkOut.toISOString()
+        checkIn: toStayDate(checkIn),
+        checkOut: toStayDate(checkOut)
       }
     });
     return response.data;
@@ -62,31 +84,107 @@ export const checkRoomAvailability = async (roomType, checkIn, checkOut) => {
   }
 };
 
+export const getAvailabilityCalendar = async (roomTypes, start, end) => {
+  try {
+    const response = await axios.get(`${API}/rooms/availability/calendar`, {
+      params: { roomTypes, start, end },
+      paramsSerializer: { indexes: null }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching availability calendar:', error);
+    throw error;
+  }
+};
+
 // Bookings API
-export const createBooking = async (bookingData) => {
+const BOOKING_RETRIES = 3;
+
+// A fresh key for each distinct booking attempt; retries of it reuse the key
+export const newIdempotencyKey = () => (
+  window.crypto?.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+);
+
+// Retries that never got a response reuse the Idempotency-Key, so the server
+// books once and replays the original confirmation to later attempts
+export const createBooking = async (bookingData, idempotencyKey = newIdempotencyKey()) => {
+  const payload = {
+    roomType: bookingData.roomType,
+    checkIn: bookingData.checkIn,
+    checkOut: bookingData.checkOut,
+    guests: bookingData.guests,
+    fullName: bookingData.fullName,
+    email: bookingData.email,
+    phone: bookingData.phone,
+    holdId: bookingData.holdId
+  };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await axios.post(`${API}/bookings`, payload, {
+        headers: { 'Idempotency-Key': idempotencyKey }
+      });
+      return response.data;
+    } catch (error) {
+      // 409: the first attempt is still being processed; 429/503: the
+      // server shed the request under load and says when to come back
+      const status = error.response?.status;
+      const retryable = !error.response || [409, 429, 503].includes(status);
+      if (retryable && attempt < BOOKING_RETRIES) {
+        const retryAfter = Number(error.response?.headers?.['retry-after']) * 1000;
+        await new Promise((resolve) => setTimeout(resolve, retryAfter || 500 * 2 ** attempt));
+        continue;
+      }
+      console.error('Error creating booking:', error);
+      throw error.response?.data || error.message;
+    }
+  }
+};
+
+// Prices a stay with the per-night rate calendar, as the booking will be charged
+export const getQuote = async (roomType, checkIn, checkOut) => {
   try {
-    const response = await axios.post(`${API}/bookings`, {
-      roomType: bookingData.roomType,
-      checkIn: bookingData.checkIn,
-      checkOut: bookingData.checkOut,
-      guests: bookingData.guests,
-      fullName: bookingData.fullName,
-      email: bookingData.email,
-      phone: bookingData.phone
+    const response = await axios.post(`${API}/quotes`, {
+      stays: [{ roomType, checkIn: toStayDate(checkIn), checkOut: toStayDate(checkOut) }]
+    });
+    return response.data.quotes[0];
+  } catch (error) {
+    console.error('Error getting quote:', error);
+    throw error;
+  }
+};
+
+// Holds a unit for a few minutes while the guest fills in their details
+export const createHold = async (roomType, checkIn, checkOut) => {
+  try {
+    const response = await axios.post(`${API}/holds`, {
+      roomType,
+      checkIn: toStayDate(checkIn),
+      checkOut: toStayDate(checkOut)
     });
     return response.data;
   } catch (error) {
-    console.error('Error creating booking:', error);
+    console.error('Error placing hold:', error);
     throw error.response?.data || error.message;
   }
 };
 
-export const getBookings = async () => {
+// Best effort: a hold that is not released lapses on its own. Releasing
+// takes the token the hold was placed with, not just its id
+export const releaseHold = async (hold) => {
   try {
-    const response = await axios.get(`${API}/bookings`, {
-      headers: getAuthHeaders()
+    await axios.delete(`${API}/holds/${hold.id}`, {
+      headers: { 'X-Release-Token': hold.releaseToken }
     });
-    return response.data;
+  } catch (error) {
+    // Already booked or expired
+  }
+};
+
+export const getBookings = async (filters = {}) => {
+  try {
+    return await getAllPages(`${API}/bookings`, { limit: 1000, ...filters });
   } catch (error) {
     console.error('Error fetching bookings:', error);
     throw error;
@@ -136,12 +234,25 @@ export const createBlockedBooking = async (blockedData) => {
   }
 };
 
-export const getBlockedBookings = async () => {
+// Block many units/date ranges in one request; returns per-item results
+export const createBlockedBookings = async (blocks, atomic = false) => {
   try {
-    const response = await axios.get(`${API}/admin/blocked-bookings`, {
+    const response = await axios.post(`${API}/admin/blocked-bookings/bulk`, {
+      blocks,
+      atomic
+    }, {
       headers: getAuthHeaders()
     });
     return response.data;
+  } catch (error) {
+    console.error('Error creating blocked bookings:', error);
+    throw error.response?.data || error.message;
+  }
+};
+
+export const getBlockedBookings = async (filters = {}) => {
+  try {
+    return await getAllPages(`${API}/admin/blocked-bookings`, { limit: 1000, ...filters });
   } catch (error) {
     console.error('Error fetching blocked bookings:', error);
     throw error;
@@ -159,3 +270,74 @@ export const deleteBlockedBooking = async (blockId) => {
     throw error;
   }
 };
+
+// Analytics API (Admin only)
+export const getAnalytics = async (start, end, { roomTypes, nightly = false } = {}) => {
+  try {
+    const response = await axios.get(`${API}/admin/analytics`, {
+      params: { start, end, roomTypes, nightly },
+      paramsSerializer: { indexes: null },
+      headers: getAuthHeaders()
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching analytics:', error);
+    throw error;
+  }
+};
+
+// Live events (Server-Sent Events)
+// Calls onEvent(type, data) for each pushed change, and onResync() when
+// events were missed and whatever they would have updated should be
+// reloaded. EventSource reconnects on its own, resuming from the last event.
+// Returns a function that closes the stream.
+export const subscribeToEvents = (topics, { roomTypes = [], onEvent, onResync } = {}) => {
+  const admin = topics.includes('bookings');
+  const eventTypes = admin
+    ? ['availability', 'booking.created', 'booking.cancelled', 'block.created', 'block.deleted']
+    : ['availability'];
+  let source = null;
+  let closed = false;
+
+  const open = async () => {
+    const params = new URLSearchParams();
+    topics.forEach((topic) => params.append('topics', topic));
+    roomTypes.forEach((roomType) => params.append('roomTypes', roomType));
+    // EventSource cannot send headers, so admin topics pass a short-lived
+    // stream token in the URL; the admin token never goes there
+    if (admin && getAuthToken()) {
+      try {
+        const response = await axios.post(`${API}/events/token`, {}, { headers: getAuthHeaders() });
+        params.append('token', response.data.token);
+      } catch (error) {
+        console.error('Error fetching stream token:', error);
+      }
+    }
+    if (closed) {
+      return;
+    }
+    source = new EventSource(`${API}/events?${params}`);
+    eventTypes.forEach((type) => {
+      source.addEventListener(type, (event) => onEvent?.(type, JSON.parse(event.data)));
+    });
+    source.addEventListener('resync', () => onResync?.());
+    // A reconnect after the stream token expired is refused and the
+    // browser gives up; open a new stream and reload what was missed
+    source.addEventListener('error', () => {
+      if (admin && !closed && source.readyState === EventSource.CLOSED) {
+        setTimeout(() => {
+          if (!closed) {
+            open();
+            onResync?.();
+          }
+        }, 3000);
+      }
+    });
+  };
+
+  open();
+  return () => {
+    closed = true;
+    source?.close();
+  };
+};
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, DialogFooter } from './ui/dialog';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -10,7 +10,22 @@ import { Calendar as CalendarIcon, AlertCircle } from 'lucide-react';
 import { format } from 'date-fns';
 import { useToast } from '../hooks/use-toast';
 import { Alert, AlertDescription } from './ui/alert';
-import { checkRoomAvailability, createBooking, getRooms } from '../api';
+import { checkRoomAvailability, createBooking, createHold, getAvailabilityCalendar, getQuote, getRooms, newIdempotencyKey, releaseHold, subscribeToEvents, toStayDate } from '../api';
+
+// Nights of sold-out availability fetched ahead for the date pickers
+const CALENDAR_DAYS = 90;
+// Pushed changes arriving within this many ms are answered with one re-check
+const RECHECK_DELAY = 250;
+
+const stayKey = (roomType, checkIn, checkOut) => `${roomType}|${checkIn.toISOString()}|${checkOut.toISOString()}`;
+
+// Whether a pushed availability change touches a stay (no dates: any night may have changed)
+const touchesStay = (change, checkIn, checkOut) => (
+  !change.checkIn || (
+    new Date(`${change.checkIn}Z`) < new Date(toStayDate(checkOut))
+    && new Date(`${change.checkOut}Z`) > new Date(toStayDate(checkIn))
+  )
+);
 
 const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
   const { toast } = useToast();
@@ -27,6 +42,19 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
   const [availableCount, setAvailableCount] = useState(null);
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [isCheckingAvailability, setIsCheckingAvailability] = useState(false);
+  const [soldOutNights, setSoldOutNights] = useState(new Set());
+  const [hold, setHold] = useState(null);
+  const [quote, setQuote] = useState(null);
+  // Submitting the same details again after a failure reuses the key, so a
+  // booking that did go through is not made twice
+  const pendingBooking = useRef(null);
+  // Bumped when pushed events say the stay's availability or the calendar changed
+  const [availabilityVersion, setAvailabilityVersion] = useState(0);
+  const [calendarVersion, setCalendarVersion] = useState(0);
+  // The stay our own hold is on; a re-check counts that unit as still ours
+  const heldStay = useRef(null);
+  const currentStay = useRef(null);
+  currentStay.current = formData.checkIn && formData.checkOut ? [formData.checkIn, formData.checkOut] : null;
 
   // Load rooms on mount
   React.useEffect(() => {
@@ -47,6 +75,67 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
     }
   }, [selectedRoom]);
 
+  // Load sold-out nights for the selected room in one request
+  React.useEffect(() => {
+    const loadCalendar = async () => {
+      if (!formData.roomType) {
+        setSoldOutNights(new Set());
+        return;
+      }
+      const start = new Date();
+      const end = new Date(start.getTime() + CALENDAR_DAYS * 24 * 60 * 60 * 1000);
+      try {
+        const calendar = await getAvailabilityCalendar(
+          [formData.roomType],
+          format(start, 'yyyy-MM-dd'),
+          format(end, 'yyyy-MM-dd')
+        );
+        const available = calendar.rooms[formData.roomType].available;
+        setSoldOutNights(new Set(calendar.nights.filter((night, i) => available[i] === 0)));
+      } catch (error) {
+        setSoldOutNights(new Set());
+      }
+    };
+    loadCalendar();
+  }, [formData.roomType, calendarVersion]);
+
+  // Re-check when other guests book, hold or release the room type, instead of polling
+  React.useEffect(() => {
+    if (!open || !formData.roomType) {
+      return undefined;
+    }
+    let timer = null;
+    let recheckStay = false;
+    const schedule = (stayChanged) => {
+      recheckStay = recheckStay || stayChanged;
+      if (timer) {
+        return;
+      }
+      timer = setTimeout(() => {
+        timer = null;
+        setCalendarVersion((version) => version + 1);
+        if (recheckStay) {
+          setAvailabilityVersion((version) => version + 1);
+        }
+        recheckStay = false;
+      }, RECHECK_DELAY);
+    };
+    const close = subscribeToEvents(['availability'], {
+      roomTypes: [formData.roomType],
+      onEvent: (type, change) => {
+        const stay = currentStay.current;
+        schedule(!!stay && touchesStay(change, stay[0], stay[1]));
+      },
+      onResync: () => schedule(true)
+    });
+    return () => {
+      clearTimeout(timer);
+      close();
+    };
+  }, [open, formData.roomType]);
+
+  const isSoldOut = (date) => soldOutNights.has(format(date, 'yyyy-MM-dd'));
+
   // Check availability when dates change
   React.useEffect(() => {
     const checkAvailability = async () => {
@@ -54,7 +143,10 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
         setIsCheckingAvailability(true);
         try {
           const result = await checkRoomAvailability(formData.roomType, formData.checkIn, formData.checkOut);
-          setAvailableCount(result.availableUnits);
+          const held = heldStay.current;
+          const ownHold = held?.key === stayKey(formData.roomType, formData.checkIn, formData.checkOut)
+            && !(held.expiresAt && held.expiresAt <= Date.now());
+          setAvailableCount(result.availableUnits + (ownHold ? 1 : 0));
         } catch (error) {
           console.error('Error checking availability:', error);
           setAvailableCount(null);
@@ -66,8 +158,61 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
       }
     };
     checkAvailability();
+  }, [formData.roomType, formData.checkIn, formData.checkOut, availabilityVersion]);
+
+  // Price the stay night by night (weekend, season and length-of-stay rates)
+  React.useEffect(() => {
+    if (!formData.roomType || !formData.checkIn || !formData.checkOut) {
+      setQuote(null);
+      return;
+    }
+    let stale = false;
+    getQuote(formData.roomType, formData.checkIn, formData.checkOut)
+      .then((result) => { if (!stale) setQuote(result); })
+      .catch(() => { if (!stale) setQuote(null); });
+    return () => { stale = true; };
   }, [formData.roomType, formData.checkIn, formData.checkOut]);
 
+  // Hold a unit while the dialog is open on an available stay, so it is not
+  // sold while the guest types; released when the stay changes or the dialog closes
+  const canHold = open && availableCount > 0;
+  React.useEffect(() => {
+    if (!canHold) {
+      return undefined;
+    }
+    let placed = null;
+    let stale = false;
+    // Set before the request: the hold's own event may arrive before its response
+    const held = { key: stayKey(formData.roomType, formData.checkIn, formData.checkOut), expiresAt: null };
+    heldStay.current = held;
+    createHold(formData.roomType, formData.checkIn, formData.checkOut)
+      .then((newHold) => {
+        if (stale) {
+          releaseHold(newHold);
+        } else {
+          placed = newHold;
+          held.expiresAt = new Date(`${newHold.expiresAt}Z`).getTime();
+          setHold(newHold);
+        }
+      })
+      .catch(() => {
+        if (heldStay.current === held) {
+          heldStay.current = null;
+        }
+        setHold(null);
+      });
+    return () => {
+      stale = true;
+      if (heldStay.current === held) {
+        heldStay.current = null;
+      }
+      if (placed) {
+        releaseHold(placed);
+      }
+      setHold(null);
+    };
+  }, [canHold, formData.roomType, formData.checkIn, formData.checkOut]);
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -92,15 +237,22 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
 
     setIsSubmitting(true);
     try {
-      const booking = await createBooking({
+      const bookingData = {
         roomType: formData.roomType,
-        checkIn: formData.checkIn.toISOString(),
-        checkOut: formData.checkOut.toISOString(),
+        checkIn: toStayDate(formData.checkIn),
+        checkOut: toStayDate(formData.checkOut),
         guests: formData.guests,
         fullName: formData.fullName,
         email: formData.email,
-        phone: formData.phone
-      });
+        phone: formData.phone,
+        holdId: hold?.id
+      };
+      const details = JSON.stringify(bookingData);
+      if (pendingBooking.current?.details !== details) {
+        pendingBooking.current = { details, key: newIdempotencyKey() };
+      }
+      const booking = await createBooking(bookingData, pendingBooking.current.key);
+      pendingBooking.current = null;
 
       toast({
         title: "Booking Confirmed!",
@@ -176,7 +328,7 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
                       mode="single"
                       selected={formData.checkIn}
                       onSelect={(date) => setFormData({...formData, checkIn: date})}
-                      disabled={(date) => date < new Date()}
+                      disabled={(date) => date < new Date() || isSoldOut(date)}
                       initialFocus
                     />
                   </PopoverContent>
@@ -223,6 +375,7 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
                     ? "No rooms available for selected dates. Please choose different dates."
                     : `${availableCount} room${availableCount > 1 ? 's' : ''} available for selected dates`
                   }
+                  {hold && availableCount > 0 && ` — held for you until ${format(new Date(`${hold.expiresAt}Z`), 'HH:mm')}`}
                 </AlertDescription>
               </Alert>
             )}
@@ -284,9 +437,9 @@ const BookingDialog = ({ open, onOpenChange, selectedRoom }) => {
                 <p><span className="font-medium">Room:</span> {selectedRoomData.type}</p>
                 <p><span className="font-medium">Check-in:</span> {format(formData.checkIn, 'PPP')}</p>
                 <p><span className="font-medium">Check-out:</span> {format(formData.checkOut, 'PPP')}</p>
-                <p><span className="font-medium">Nights:</span> {Math.ceil((formData.checkOut - formData.checkIn) / (1000 * 60 * 60 * 24))}</p>
+                <p><span className="font-medium">Nights:</span> {quote ? quote.nights : Math.ceil((formData.checkOut - formData.checkIn) / (1000 * 60 * 60 * 24))}</p>
                 <p className="text-lg font-bold text-green-700 pt-2">
-                  Total: ${Math.ceil((formData.checkOut - formData.checkIn) / (1000 * 60 * 60 * 24)) * selectedRoomData.price}
+                  Total: ${quote ? quote.total : Math.ceil((formData.checkOut - formData.checkIn) / (1000 * 60 * 60 * 24)) * selectedRoomData.price}
                 </p>
               </div>
             </div>
@@ -14,13 +14,22 @@ import {
   getRooms,
   getBlockedBookings,
   createBlockedBooking,
+  createBlockedBookings,
   deleteBlockedBooking,
   getBookings,
   cancelBooking,
   adminLogout,
-  isAdminAuthenticated
+  isAdminAuthenticated,
+  subscribeToEvents,
+  toStayDate
 } from '../api';
 
+// Newest first, as listed; a record already shown (our own write) is not added twice
+const addRecord = (record) => (records) => (
+  records.some(r => r.id === record.id) ? records : [record, ...records]
+);
+const removeRecord = (id) => (records) => records.filter(r => r.id !== id);
+
 const AdminDashboard = () => {
   const navigate = useNavigate();
   const { toast } = useToast();
@@ -45,6 +54,28 @@ const AdminDashboard = () => {
     loadData();
   }, [navigate]);
 
+  // Bookings and blocks made or removed elsewhere show up as they happen
+  useEffect(() => {
+    if (!isAdminAuthenticated()) {
+      return undefined;
+    }
+    return subscribeToEvents(['bookings'], {
+      onEvent: (type, record) => {
+        if (type === 'booking.created') {
+          setCustomerBookings(addRecord(record));
+        } else if (type === 'booking.cancelled') {
+          setCustomerBookings(removeRecord(record.id));
+        } else if (type === 'block.created') {
+          setBlockedBookings(addRecord(record));
+        } else if (type === 'block.deleted') {
+          setBlockedBookings(removeRecord(record.id));
+        }
+      },
+      // Missed events: reload the lists
+      onResync: () => loadData()
+    });
+  }, []);
+
   const loadData = async () => {
     try {
       const [roomsData, blockedData, bookingsData] = await Promise.all([
@@ -89,34 +120,50 @@ const AdminDashboard = () => {
     }
 
     const selectedRoom = rooms.find(r => r.id === blockForm.roomType);
-    const roomId = `${blockForm.roomType}-unit-${blockForm.roomUnit}`;
+    const makeBlock = (unit) => ({
+      roomId: `${blockForm.roomType}-unit-${unit}`,
+      roomType: blockForm.roomType,
+      roomName: selectedRoom.type,
+      roomUnit: unit,
+      checkIn: toStayDate(blockForm.checkIn),
+      checkOut: toStayDate(blockForm.checkOut),
+      reason: 'Offline booking'
+    });
     
     setIsLoading(true);
     try {
-      await createBlockedBooking({
-        roomId,
-        roomType: blockForm.roomType,
-        roomName: selectedRoom.type,
-        roomUnit: blockForm.roomUnit,
-        checkIn: blockForm.checkIn.toISOString(),
-        checkOut: blockForm.checkOut.toISOString(),
-        reason: 'Offline booking'
-      });
+      if (blockForm.roomUnit === 'all') {
+        // One request for every unit of the room type
+        const units = Array.from({ length: selectedRoom.available }, (_, i) => (i + 1).toString());
+        const blocks = units.map(makeBlock);
+        const result = await createBlockedBookings(blocks);
+        result.results
+          .filter(r => r.status === 'created')
+          .forEach(r => setBlockedBookings(addRecord({ ...blocks[r.index], id: r.id })));
+        const errors = [...new Set(result.results.filter(r => r.error).map(r => r.error))];
+        toast({
+          title: result.rejected ? "Rooms Partially Blocked" : "Rooms Blocked",
+          description: `${selectedRoom.type}: ${result.created} of ${units.length} units blocked` +
+            (errors.length ? ` (${errors.join('; ')})` : ''),
+          variant: result.created ? undefined : "destructive"
+        });
+      } else {
+        const blocked = await createBlockedBooking(makeBlock(blockForm.roomUnit));
+        setBlockedBookings(addRecord(blocked));
 
-      toast({
-        title: "Room Blocked",
-        description: `${selectedRoom.type} (Unit ${blockForm.roomUnit}) blocked successfully`,
-      });
+        toast({
+          title: "Room Blocked",
+          description: `${selectedRoom.type} (Unit ${blockForm.roomUnit}) blocked successfully`,
+        });
+      }
 
-      // Reset form and reload data
+      // Reset form; the lists were updated above
       setBlockForm({
         roomType: '',
         roomUnit: '1',
         checkIn: null,
         checkOut: null
       });
-      
-      await loadData();
     } catch (error) {
       toast({
         title: "Error",
@@ -131,11 +178,11 @@ const AdminDashboard = () => {
   const handleUnblock = async (blockId) => {
     try {
       await deleteBlockedBooking(blockId);
+      setBlockedBookings(removeRecord(blockId));
       toast({
         title: "Room Unblocked",
         description: "Room is now available for booking",
       });
-      await loadData();
     } catch (error) {
       toast({
         title: "Error",
@@ -152,11 +199,11 @@ const AdminDashboard = () => {
 
     try {
       await cancelBooking(bookingId);
+      setCustomerBookings(removeRecord(bookingId));
       toast({
         title: "Booking Cancelled",
         description: "The booking has been cancelled successfully",
       });
-      await loadData();
     } catch (error) {
       toast({
         title: "Error",
@@ -316,6 +363,7 @@ const AdminDashboard = () => {
                         <SelectValue />
                       </SelectTrigger>
                       <SelectContent>
+                        <SelectItem value="all">All units</SelectItem>
                         {roomUnits.map((unit) => (
                           <SelectItem key={unit} value={unit.toString()}>
                             Unit {unit}
@@ -0,0 +1,473 @@
+"""Load-test and micro-benchmark suite for the booking API.
+
+Runs the FastAPI app in-process against a throwaway SQLite database (or the
+backend picked with ``--backend``) seeded with realistic volumes and drives mixed scenarios through the ASGI
+interface, with no HTTP server or client library involved. Each scenario
+reports p50/p95/p99 latency, throughput and database queries per request.
+
+    python tests/bench_api.py                          # defaults: 100k bookings, 20k blocks
+    python tests/bench_api.py --bookings 10000 --blocks 2000 --save tests/baselines/small.json
+    python tests/bench_api.py --compare tests/baselines/small.json
+    python tests/bench_api.py --backend memory --compare tests/baselines/small.json
+
+``--compare`` exits non-zero when a scenario's p95 latency or queries per
+request regress by more than ``--tolerance`` against the saved baseline.
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+ROOM_TYPES = {"double-1": ("Double Room", 5), "single-1": ("Single Room", 4), "villa-1": ("Villa", 2)}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class ASGIClient:
+    """Minimal in-process client speaking ASGI to the app"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, path, params=None, json_body=None, headers=None, client="127.0.0.1"):
+        body = json.dumps(json_body).encode() if json_body is not None else b""
+        raw_headers = [(b"host", b"bench")]
+        if json_body is not None:
+            raw_headers.append((b"content-type", b"application/json"))
+        for name, value in (headers or {}).items():
+            raw_headers.append((name.lower().encode(), value.encode()))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": urlencode(params or {}, doseq=True).encode(),
+            "root_path": "", "headers": raw_headers,
+            "client": (client, 50000), "server": ("bench", 80),
+        }
+        sent = False
+        response = {"status": None, "headers": {}, "body": b""}
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+
+        await self.app(scope, receive, send)
+        return response
+
+
+def make_records(bookings, blocks, rng):
+    """Realistic bookings and blocks spread over the past three years and the next one"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    room_ids = list(ROOM_TYPES)
+
+    def stay():
+        check_in = today + timedelta(days=rng.randint(-3 * 365, 365))
+        nights = rng.randint(1, 7)
+        return check_in, check_in + timedelta(days=nights), nights
+
+    booking_records = []
+    for i in range(bookings):
+        room_type = rng.choice(room_ids)
+        check_in, check_out, nights = stay()
+        booking_records.append({
+            "roomType": room_type, "roomName": ROOM_TYPES[room_type][0],
+            "checkIn": check_in, "checkOut": check_out, "guests": "2",
+            "fullName": f"Guest {i}", "email": f"guest{i}@example.com", "phone": None,
+            "nights": nights, "totalPrice": nights * 199.0, "status": "confirmed",
+            "createdAt": check_in - timedelta(days=rng.randint(0, 120), seconds=rng.randint(0, 86399)),
+        })
+
+    block_records = []
+    for i in range(blocks):
+        room_type = rng.choice(room_ids)
+        check_in, check_out, _ = stay()
+        unit = str(rng.randint(1, ROOM_TYPES[room_type][1]))
+        block_records.append({
+            "roomId": f"{room_type}-unit-{unit}", "roomType": room_type,
+            "roomName": ROOM_TYPES[room_type][0], "roomUnit": unit,
+            "checkIn": check_in, "checkOut": check_out, "reason": "Offline booking",
+            "createdAt": check_in - timedelta(days=rng.randint(0, 60), seconds=rng.randint(0, 86399)),
+        })
+    return booking_records, block_records
+
+
+def batches(records, size=5000):
+    for offset in range(0, len(records), size):
+        yield records[offset:offset + size]
+
+
+def seed_database(url, booking_records, block_records):
+    """Bulk-load rooms, bookings and blocks into SQL with a sync engine"""
+    from sqlalchemy import create_engine, insert
+    from database import Base, Room, Booking, BlockedBooking
+    from migrations import migrate, rebuild_daily_rollups
+    from routes import INITIAL_ROOMS
+
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        migrate(conn)
+        conn.execute(insert(Room), INITIAL_ROOMS)
+    with engine.begin() as conn:
+        for batch in batches(booking_records):
+            conn.execute(insert(Booking), batch)
+        for batch in batches(block_records):
+            conn.execute(insert(BlockedBooking), batch)
+        # Bulk inserts bypass the storage layer that keeps rollups current
+        rebuild_daily_rollups(conn)
+    engine.dispose()
+
+
+async def seed_storage(storage, booking_records, block_records):
+    """Bulk-load bookings and blocks through the storage interface (rooms are
+    seeded at startup)"""
+    from listings import BOOKINGS, BLOCKED_BOOKINGS
+    for batch in batches(booking_records):
+        await storage.import_records(BOOKINGS, batch)
+    for batch in batches(block_records):
+        await storage.import_records(BLOCKED_BOOKINGS, batch)
+
+
+def query_totals():
+    """(queries, requests) recorded so far by the metrics middleware"""
+    from metrics import REQUEST_QUERIES
+    queries = requests = 0
+    for series in REQUEST_QUERIES.series.values():
+        queries += series[-1]
+        requests += sum(series[:-1])
+    return queries, requests
+
+
+async def run_scenario(name, make_requests, concurrency):
+    """Run request factories with bounded concurrency and summarize them"""
+    latencies = []
+    errors = 0
+    statuses = {}
+    slots = asyncio.Semaphore(concurrency)
+    queries_before, requests_before = query_totals()
+
+    async def one(factory):
+        nonlocal errors
+        async with slots:
+            started = time.perf_counter()
+            response = await factory()
+            latencies.append(time.perf_counter() - started)
+            statuses[response["status"]] = statuses.get(response["status"], 0) + 1
+            if response["status"] >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(factory) for factory in make_requests))
+    wall = time.perf_counter() - started
+    queries_after, requests_after = query_totals()
+    served = max(requests_after - requests_before, 1)
+    result = {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "p50Ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95Ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 3),
+        "meanMs": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "throughputRps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "queriesPerRequest": round((queries_after - queries_before) / served, 2),
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+    print(f"{name:<22} {result['requests']:>6} req  p50 {result['p50Ms']:>8.2f} ms  "
+          f"p95 {result['p95Ms']:>8.2f} ms  p99 {result['p99Ms']:>8.2f} ms  "
+          f"{result['throughputRps']:>8.1f} req/s  {result['queriesPerRequest']:>5.2f} q/req  "
+          f"{result['statuses']}")
+    return result
+
+
+async def run_benchmarks(args, rng, records):
+    import server
+    from metrics import REQUEST_QUERIES  # noqa: F401  (registers metrics before traffic)
+    from storage import get_storage
+
+    app = server.app
+    client = ASGIClient(app)
+    lifespan = app.router.lifespan_context(app)
+    await lifespan.__aenter__()
+    try:
+        if args.backend != "mysql":
+            started = time.perf_counter()
+            await seed_storage(get_storage(), *records)
+            print(f"Seeded {args.backend} in {time.perf_counter() - started:.1f}s")
+        login = await client.request("POST", "/api/admin/login",
+                                     json_body={"username": args.admin_user, "password": args.admin_password})
+        token = json.loads(login["body"])["token"]
+        admin = {"Authorization": f"Bearer {token}"}
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        room_ids = list(ROOM_TYPES)
+        n = args.requests
+        results = {}
+
+        catalog = await client.request("GET", "/api/rooms")
+        etag = catalog["headers"].get("etag", "")
+        results["catalog"] = await run_scenario("catalog", [
+            (lambda: client.request("GET", "/api/rooms")) for _ in range(n)
+        ], args.concurrency)
+        results["catalog_revalidate"] = await run_scenario("catalog_revalidate", [
+            (lambda: client.request("GET", "/api/rooms", headers={"If-None-Match": etag})) for _ in range(n)
+        ], args.concurrency)
+
+        def availability():
+            check_in = today + timedelta(days=rng.randint(0, 300))
+            params = {
+                "roomType": rng.choice(room_ids),
+                "checkIn": check_in.isoformat(),
+                "checkOut": (check_in + timedelta(days=rng.randint(1, 7))).isoformat(),
+            }
+            return lambda: client.request("GET", "/api/rooms/availability", params=params)
+
+        results["availability_burst"] = await run_scenario(
+            "availability_burst", [availability() for _ in range(n)], args.concurrency)
+
+        def calendar():
+            start = today + timedelta(days=rng.randint(0, 300))
+            params = {"start": start.date().isoformat(), "end": (start + timedelta(days=30)).date().isoformat(),
+                      "roomTypes": room_ids}
+            return lambda: client.request("GET", "/api/rooms/availability/calendar", params=params)
+
+        results["availability_calendar"] = await run_scenario(
+            "availability_calendar", [calendar() for _ in range(max(n // 10, 1))], args.concurrency)
+
+        # A 30-night stay of every room type priced in one request
+        def quote():
+            check_in = today + timedelta(days=rng.randint(0, 300))
+            stays = [{"roomType": room_type, "checkIn": check_in.isoformat(),
+                      "checkOut": (check_in + timedelta(days=30)).isoformat()} for room_type in room_ids]
+            return lambda: client.request("POST", "/api/quotes", json_body={"stays": stays})
+
+        results["quote_batch"] = await run_scenario("quote_batch", [quote() for _ in range(n)], args.concurrency)
+
+        # Every request races for the same villa nights, far past the seeded
+        # history; exactly the villa's unit count may succeed
+        race_in = today + timedelta(days=5 * 365)
+        race_body = {
+            "roomType": "villa-1", "checkIn": race_in.isoformat(),
+            "checkOut": (race_in + timedelta(days=3)).isoformat(), "guests": "4",
+            "fullName": "Race Guest", "email": "race@example.com",
+        }
+        results["booking_race"] = await run_scenario("booking_race", [
+            (lambda: client.request("POST", "/api/bookings", json_body=race_body)) for _ in range(args.race)
+        ], args.race)
+        confirmed = results["booking_race"]["statuses"].get("200", 0)
+        results["booking_race"]["overbooked"] = confirmed > ROOM_TYPES["villa-1"][1]
+        if results["booking_race"]["overbooked"]:
+            print(f"  !! booking_race confirmed {confirmed} bookings for {ROOM_TYPES['villa-1'][1]} units")
+
+        # The same allocation of week-long blocks, sent one per request
+        # (as the dashboard used to) and as a single bulk request
+        def allocation(offset_days):
+            blocks = []
+            for i in range(args.allocation):
+                room_type = room_ids[i % len(room_ids)]
+                unit = "1"
+                check_in = today + timedelta(days=offset_days + 7 * i)
+                blocks.append({
+                    "roomId": f"{room_type}-unit-{unit}", "roomType": room_type,
+                    "roomName": ROOM_TYPES[room_type][0], "roomUnit": unit,
+                    "checkIn": check_in.isoformat(), "checkOut": (check_in + timedelta(days=7)).isoformat(),
+                })
+            return blocks
+
+        per_item = allocation(6 * 365)
+        started = time.perf_counter()
+        results["block_items"] = await run_scenario("block_items", [
+            (lambda body=body: client.request("POST", "/api/admin/blocked-bookings", json_body=body, headers=admin))
+            for body in per_item
+        ], 1)
+        results["block_items"]["totalMs"] = round((time.perf_counter() - started) * 1000, 3)
+        bulk_body = {"blocks": allocation(7 * 365)}
+        started = time.perf_counter()
+        results["block_bulk"] = await run_scenario("block_bulk", [
+            lambda: client.request("POST", "/api/admin/blocked-bookings/bulk", json_body=bulk_body, headers=admin)
+        ], 1)
+        results["block_bulk"]["totalMs"] = round((time.perf_counter() - started) * 1000, 3)
+        print(f"  {len(per_item)} blocks: {results['block_items']['totalMs']:.1f} ms one by one, "
+              f"{results['block_bulk']['totalMs']:.1f} ms in bulk")
+
+        def listing(path):
+            params = {"limit": 100}
+            if rng.random() < 0.5:
+                params["roomType"] = rng.choice(room_ids)
+            return lambda: client.request("GET", path, params=params, headers=admin)
+
+        results["admin_bookings"] = await run_scenario(
+            "admin_bookings", [listing("/api/bookings") for _ in range(max(n // 5, 1))], args.concurrency)
+        results["admin_blocked"] = await run_scenario(
+            "admin_blocked", [listing("/api/admin/blocked-bookings") for _ in range(max(n // 5, 1))],
+            args.concurrency)
+
+        # A year of nightly occupancy and revenue for every room type
+        def analytics():
+            start = today - timedelta(days=rng.randint(0, 365))
+            params = {"start": start.date().isoformat(), "end": (start + timedelta(days=365)).date().isoformat(),
+                      "nightly": "true"}
+            return lambda: client.request("GET", "/api/admin/analytics", params=params, headers=admin)
+
+        results["analytics_year"] = await run_scenario(
+            "analytics_year", [analytics() for _ in range(max(n // 10, 1))], args.concurrency)
+
+        mixed = []
+        for _ in range(n):
+            roll = rng.random()
+            if roll < 0.3:
+                mixed.append(lambda: client.request("GET", "/api/rooms"))
+            elif roll < 0.85:
+                mixed.append(availability())
+            else:
+                mixed.append(listing("/api/bookings"))
+        results["mixed"] = await run_scenario("mixed", mixed, args.concurrency)
+
+        # Flash-sale overload: far more availability requests than the limits
+        # admit, from many clients, while an admin pages through bookings.
+        # Admission control (off for the scenarios above) sheds the excess
+        # with 429/503 so admitted and admin requests keep their latency.
+        from admission import AdmissionControl, AdmissionMiddleware
+        guarded = ASGIClient(AdmissionMiddleware(app, AdmissionControl(enabled=True)))
+
+        public = []
+        for i in range(args.overload):
+            check_in = today + timedelta(days=rng.randint(0, 300))
+            params = {
+                "roomType": rng.choice(room_ids),
+                "checkIn": check_in.isoformat(),
+                "checkOut": (check_in + timedelta(days=rng.randint(1, 7))).isoformat(),
+            }
+            public.append(lambda params=params, ip=f"10.0.{i % 200 // 100}.{i % 100}": guarded.request(
+                "GET", "/api/rooms/availability", params=params, client=ip))
+        admin_pages = [
+            (lambda: guarded.request("GET", "/api/bookings", params={"limit": 100}, headers=admin))
+            for _ in range(max(args.overload // 20, 1))
+        ]
+        results["overload_public"], results["overload_admin"] = await asyncio.gather(
+            run_scenario("overload_public", public, args.overload_concurrency),
+            run_scenario("overload_admin", admin_pages, 4),
+        )
+        return results
+    finally:
+        await lifespan.__aexit__(None, None, None)
+
+
+def compare(results, baseline_path, tolerance):
+    baseline = json.loads(Path(baseline_path).read_text())["scenarios"]
+    regressions = []
+    print(f"\nAgainst {baseline_path} (tolerance {tolerance:.0%}):")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ("p95Ms", "queriesPerRequest"):
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}.{metric}")
+            print(f"  {name:<22} {metric:<18} {before:>10} -> {after:<10} ({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--blocks", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per read scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--race", type=int, default=50, help="concurrent requests in the booking race")
+    parser.add_argument("--overload", type=int, default=5000, help="availability requests in the overload scenario")
+    parser.add_argument("--overload-concurrency", type=int, default=500)
+    parser.add_argument("--allocation", type=int, default=60, help="blocks in the allocation scenarios")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--backend", choices=["mysql", "mongodb", "memory"], default="mysql",
+                        help="storage backend; mysql runs against SQLite, mongodb uses MONGO_URL/DB_NAME")
+    parser.add_argument("--database", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="compare against a saved JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--admin-user", default=os.environ.get("ADMIN_USERNAME", "admin"))
+    parser.add_argument("--admin-password", default=os.environ.get("ADMIN_PASSWORD", "admin123"))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    db_path = Path(args.database or Path(workdir) / "bench.db")
+    if db_path.exists():
+        db_path.unlink()
+    url = f"sqlite:///{db_path}"
+    # Configure the app before it is imported
+    os.environ["MYSQL_URL"] = url
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ.setdefault("TIMING_LOG", "false")
+    os.environ.setdefault("SLOW_QUERY_MS", "1000")
+    # Measure the handlers; the overload scenario turns admission control on itself
+    os.environ.setdefault("ADMISSION_ENABLED", "false")
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    rng = random.Random(args.seed)
+    records = make_records(args.bookings, args.blocks, rng)
+    if args.backend == "mysql":
+        started = time.perf_counter()
+        seed_database(url, *records)
+        print(f"Seeded {args.bookings} bookings and {args.blocks} blocks in {time.perf_counter() - started:.1f}s")
+
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(run_benchmarks(args, rng, records))
+    report = {
+        "meta": {
+            "createdAt": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "bookings": args.bookings,
+            "blocks": args.blocks,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "backend": args.backend,
+        },
+        "scenarios": results,
+    }
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Saved baseline to {args.save}")
+    failed = any(result.get("overbooked") for result in results.values())
+    if args.compare:
+        failed = bool(compare(results, args.compare, args.tolerance)) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Per-row cost of encoding admin listings.
+
+Compares the old path, where rows become Pydantic models and FastAPI
+validates them against ``response_model`` before ``json`` encodes them,
+with the single-pass path from column rows to bytes.
+
+    python tests/bench_serialization.py --rows 10000
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from listings import BOOKING_FIELDS  # noqa: E402
+from models import BookingResponse  # noqa: E402
+from serialization import JSONBytesResponse, rows_to_dicts  # noqa: E402
+
+
+def make_rows(count: int) -> list:
+    base = datetime(2026, 1, 1, 14, 0, 0)
+    rows = []
+    for i in range(count):
+        check_in = base + timedelta(days=i % 365)
+        rows.append((
+            i + 1, "double-1", "Double Room", check_in, check_in + timedelta(days=3), "2",
+            f"Guest {i}", f"guest{i}@example.com", None, 3, 597.0, "confirmed",
+            check_in - timedelta(days=30, microseconds=i),
+        ))
+    return rows
+
+
+async def old_path(rows: list, field) -> bytes:
+    models = [BookingResponse(**{**dict(zip(BOOKING_FIELDS, row)), "id": str(row[0])}) for row in rows]
+    content = await serialize_response(field=field, response_content=models, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def new_path(rows: list) -> bytes:
+    return JSONBytesResponse(rows_to_dicts(rows, BOOKING_FIELDS)).body
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare listing serialization paths")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    field = create_response_field(name="bench", type_=List[BookingResponse])
+    loop = asyncio.new_event_loop()
+
+    old_body = loop.run_until_complete(old_path(rows, field))
+    new_body = new_path(rows)
+    assert json.loads(old_body) == json.loads(new_body), "serialization paths disagree"
+
+    old = timed(lambda: loop.run_until_complete(old_path(rows, field)), args.repeat)
+    new = timed(lambda: new_path(rows), args.repeat)
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"  models + response_model + json : {old * 1000:8.1f} ms  {old / args.rows * 1e6:6.2f} us/row")
+    print(f"  rows -> dicts -> orjson        : {new * 1000:8.1f} ms  {new / args.rows * 1e6:6.2f} us/row")
+    print(f"  speedup                        : {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
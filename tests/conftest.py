@@ -0,0 +1,58 @@
+"""Fixtures for the API behaviour tests.
+
+Each test drives a fresh app in-process over ASGI, once against SQLite
+through the SQL backend and once against the in-memory backend.
+"""
+from pathlib import Path
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Before the app is imported: no limits or background workers in tests
+os.environ.setdefault("ADMISSION_ENABLED", "false")
+os.environ.setdefault("ARCHIVE_WORKER", "false")
+os.environ.setdefault("OUTBOX_WORKER", "false")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import server  # noqa: E402
+from auth import create_jwt_token  # noqa: E402
+from pricing import rate_calendar  # noqa: E402
+
+BACKENDS = ["mysql", "memory"]
+
+
+@pytest.fixture(params=BACKENDS)
+def api(request, monkeypatch, tmp_path):
+    """Runs ``scenario(client)`` against a started app and returns its result"""
+    monkeypatch.setattr(server, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(server, "MYSQL_URL", f"sqlite:///{tmp_path / 'test.db'}")
+
+    def run(scenario):
+        async def main():
+            rate_calendar.invalidate()
+            app = server.create_app()
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    return await scenario(client)
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def admin_headers():
+    return {"Authorization": f"Bearer {create_jwt_token('admin')}"}
+
+
+def stay(room_type="villa-1", check_in="2030-01-02T00:00:00Z", check_out="2030-01-04T00:00:00Z", **extra):
+    return {"roomType": room_type, "checkIn": check_in, "checkOut": check_out, **extra}
+
+
+def booking(**extra):
+    return stay(**{"guests": "2", "fullName": "Guest", "email": "guest@example.com", **extra})
@@ -0,0 +1,24 @@
+import asyncio
+
+from admission import AdmissionControl, AdmissionMiddleware, RouteLimits
+
+
+def test_trailing_slashes_do_not_bypass_limits():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def request(path):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": path, "headers": [], "client": ("10.0.0.1", 1234)}
+        await middleware(scope, None, send)
+        return sent[0]["status"]
+
+    admission = AdmissionControl({("POST", "/api/bookings"): ("bookings", RouteLimits(1, 1, 1, 0))}, enabled=True)
+    middleware = AdmissionMiddleware(app, admission)
+    statuses = [asyncio.run(request(path)) for path in ("/api/bookings/", "/api/bookings", "/api/bookings//")]
+    assert statuses == [200, 429, 429]
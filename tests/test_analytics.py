@@ -0,0 +1,43 @@
+from .conftest import booking, stay
+
+# One night (Jan 9) in inventory, sent as a local midnight east of UTC
+LATE = {"room_type": "double-1", "check_in": "2030-01-09T18:30:00Z", "check_out": "2030-01-10T18:30:00Z"}
+JANUARY = {"start": "2030-01-01", "end": "2030-02-01", "roomTypes": "double-1", "nightly": "true"}
+
+
+def test_rollups_count_the_nights_a_stay_occupies(api, admin_headers):
+    async def scenario(client):
+        report = lambda: client.get("/api/admin/analytics", params=JANUARY, headers=admin_headers)
+        created = (await client.post("/api/bookings", json=booking(**LATE))).json()
+        await client.post("/api/admin/blocked-bookings", headers=admin_headers, json=stay(
+            **LATE, roomId="double-1-unit-5", roomName="Double Room", roomUnit="5", reason="Offline booking"))
+        live = (await report()).json()
+        await client.post("/api/admin/analytics/rebuild", headers=admin_headers)
+        rebuilt = (await report()).json()
+        await client.delete(f"/api/bookings/{created['id']}", headers=admin_headers)
+        return created, live, rebuilt, (await report()).json()
+
+    created, live, rebuilt, cancelled = api(scenario)
+    assert created["nights"] == 1
+    for report in (live, rebuilt):
+        room = report["rooms"]["double-1"]
+        assert room["summary"]["roomNightsBooked"] == 1
+        assert room["summary"]["roomNightsBlocked"] == 1
+        assert room["summary"]["revenue"] == room["summary"]["adr"] == created["totalPrice"]
+        assert room["booked"][7:11] == [0, 1, 0, 0]
+        assert room["blocked"][7:11] == [0, 1, 0, 0]
+    summary = cancelled["rooms"]["double-1"]["summary"]
+    assert (summary["roomNightsBooked"], summary["revenue"], summary["cancellations"]) == (0, 0, 1)
+
+
+def test_booking_a_hold_counts_after_a_rebuild(api, admin_headers):
+    async def scenario(client):
+        hold = (await client.post("/api/holds", json=stay(room_type="double-1"))).json()
+        # Drops the hold's still empty rollup rows
+        await client.post("/api/admin/analytics/rebuild", headers=admin_headers)
+        created = (await client.post("/api/bookings", json=booking(room_type="double-1", holdId=hold["id"]))).json()
+        report = await client.get("/api/admin/analytics", params=JANUARY, headers=admin_headers)
+        return created, report.json()["rooms"]["double-1"]["summary"]
+
+    created, summary = api(scenario)
+    assert (summary["roomNightsBooked"], summary["revenue"]) == (2, created["totalPrice"])
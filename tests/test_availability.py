@@ -0,0 +1,11 @@
+from .conftest import stay
+
+
+def test_availability_rejects_inverted_stays(api):
+    async def scenario(client):
+        inverted = stay(check_in="2030-01-04T00:00:00Z", check_out="2030-01-02T00:00:00Z")
+        empty = stay(check_out="2030-01-02T00:00:00Z")
+        return [(await client.get("/api/rooms/availability", params=params)).status_code
+                for params in (inverted, empty, stay())]
+
+    assert api(scenario) == [400, 400, 200]
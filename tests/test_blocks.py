@@ -0,0 +1,28 @@
+from .conftest import stay
+
+
+def block(**extra):
+    return stay(**{"roomId": "villa-1-unit-1", "roomName": "Villa", "roomUnit": "1", "reason": "Offline booking",
+                   **extra})
+
+
+def test_single_blocks_are_validated_like_bulk_ones(api, admin_headers):
+    async def scenario(client):
+        post = lambda body: client.post("/api/admin/blocked-bookings", json=body, headers=admin_headers)
+        refused = [await post(body) for body in (
+            block(roomUnit="99"),
+            block(check_in="2030-01-04T00:00:00Z", check_out="2030-01-02T00:00:00Z"),
+            block(room_type="penthouse-1"),
+        )]
+        created = await post(block())
+        duplicate = await post(block(check_in="2030-01-03T00:00:00Z", check_out="2030-01-05T00:00:00Z"))
+        listed = await client.get("/api/admin/blocked-bookings", headers=admin_headers)
+        return ([(r.status_code, r.json()["detail"]) for r in refused], created.status_code,
+                (duplicate.status_code, duplicate.json()["detail"]), len(listed.json()))
+
+    refused, created, duplicate, listed = api(scenario)
+    assert refused == [(400, "Unknown unit 99"), (400, "Check-out must be after check-in"),
+                       (400, "Room type not found")]
+    assert created == 200
+    assert duplicate == (400, "Unit 1 is already blocked for these dates")
+    assert listed == 1
@@ -0,0 +1,65 @@
+import asyncio
+
+from .conftest import booking, stay
+
+
+def test_concurrent_bookings_never_overbook(api):
+    async def scenario(client):
+        responses = await asyncio.gather(*(client.post("/api/bookings", json=booking()) for _ in range(6)))
+        availability = await client.get("/api/rooms/availability", params=stay())
+        return [r.status_code for r in responses], availability.json()["availableUnits"]
+
+    statuses, available = api(scenario)
+    # The villa has 2 units
+    assert sorted(statuses) == [200, 200, 400, 400, 400, 400]
+    assert available == 0
+
+
+def test_idempotent_booking_is_made_once(api, admin_headers):
+    async def scenario(client):
+        headers = {"Idempotency-Key": "retry-1"}
+        first = await client.post("/api/bookings", json=booking(), headers=headers)
+        retry = await client.post("/api/bookings", json=booking(), headers=headers)
+        changed = await client.post("/api/bookings", json=booking(guests="3"), headers=headers)
+        bookings = await client.get("/api/bookings", headers=admin_headers)
+        return first, retry, changed, bookings.json()
+
+    first, retry, changed, bookings = api(scenario)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert changed.status_code == 422
+    assert len(bookings) == 1
+
+
+def test_hold_reserves_a_unit_until_booked_or_released(api):
+    async def scenario(client):
+        available = lambda: client.get("/api/rooms/availability", params=stay())
+        hold = (await client.post("/api/holds", json=stay())).json()
+        other = (await client.post("/api/holds", json=stay())).json()
+        after_holds = (await available()).json()["availableUnits"]
+        without_hold = await client.post("/api/bookings", json=booking())
+        with_hold = await client.post("/api/bookings", json=booking(holdId=hold["id"]))
+        release = {"X-Release-Token": other["releaseToken"]}
+        released = await client.delete(f"/api/holds/{other['id']}", headers=release)
+        released_again = await client.delete(f"/api/holds/{other['id']}", headers=release)
+        return (after_holds, without_hold.status_code, with_hold.status_code,
+                released.status_code, released_again.status_code, (await available()).json()["availableUnits"])
+
+    assert api(scenario) == (0, 400, 200, 200, 404, 1)
+
+
+def test_holds_are_capped_per_client_and_released_by_token(api, monkeypatch):
+    monkeypatch.setattr("routes.HOLD_MAX_PER_CLIENT", 2)
+
+    async def scenario(client):
+        first = (await client.post("/api/holds", json=stay(room_type="double-1"))).json()
+        await client.post("/api/holds", json=stay(room_type="double-1"))
+        over = await client.post("/api/holds", json=stay(room_type="single-1"))
+        without_token = await client.delete(f"/api/holds/{first['id']}")
+        wrong_token = await client.delete(f"/api/holds/{first['id']}", headers={"X-Release-Token": first["id"]})
+        released = await client.delete(f"/api/holds/{first['id']}", headers={"X-Release-Token": first["releaseToken"]})
+        again = await client.post("/api/holds", json=stay(room_type="single-1"))
+        return [r.status_code for r in (over, without_token, wrong_token, released, again)]
+
+    assert api(scenario) == [429, 422, 404, 200, 200]
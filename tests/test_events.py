@@ -0,0 +1,126 @@
+import asyncio
+
+import broadcast
+from broadcast import AVAILABILITY, BOOKINGS, Broadcaster, broadcaster
+
+from .conftest import booking
+
+
+def lines(chunk, field):
+    return [line.split(": ", 1)[1] for line in chunk.decode().splitlines() if line.startswith(field + ": ")]
+
+
+async def take(stream, count):
+    return [await stream.__anext__() for _ in range(count)]
+
+
+def test_events_rejects_bad_requests(api):
+    async def scenario(client):
+        unknown = await client.get("/api/events", params={"topics": "nope"})
+        anonymous = await client.get("/api/events", params={"topics": BOOKINGS})
+        forged = await client.get("/api/events", params={"topics": BOOKINGS, "token": "forged"})
+        full, broadcaster.max_subscribers = broadcaster.max_subscribers, 0
+        try:
+            busy = await client.get("/api/events")
+        finally:
+            broadcaster.max_subscribers = full
+        return unknown.status_code, anonymous.status_code, forged.status_code, busy.status_code
+
+    assert api(scenario) == (400, 401, 401, 503)
+
+
+def test_writes_publish_once_committed(api, admin_headers):
+    async def scenario(client):
+        stream = broadcaster.stream([BOOKINGS, AVAILABILITY])
+        await stream.__anext__()
+        created = (await client.post("/api/bookings", json=booking())).json()
+        await client.delete(f"/api/bookings/{created['id']}", headers=admin_headers)
+        chunks = await take(stream, 4)
+        await stream.aclose()
+        return [lines(chunk, "event")[0] for chunk in chunks], lines(chunks[0], "data")[0]
+
+    events, data = api(scenario)
+    assert events == ["booking.created", AVAILABILITY, "booking.cancelled", AVAILABILITY]
+    assert '"email":"guest@example.com"' in data
+
+
+def test_reconnect_replays_missed_events():
+    async def scenario():
+        hub = Broadcaster(replay=8)
+        first = hub.stream([AVAILABILITY], ["villa-1"])
+        await first.__anext__()
+        hub.publish(AVAILABILITY, AVAILABILITY, {"n": 1}, "villa-1")
+        seen = lines((await first.__anext__()), "id")[0]
+        await first.aclose()
+        hub.publish(AVAILABILITY, AVAILABILITY, {"n": 2}, "double-1")
+        hub.publish(AVAILABILITY, AVAILABILITY, {"n": 3}, "villa-1")
+        again = hub.stream([AVAILABILITY], ["villa-1"], last_event_id=seen)
+        chunks = await take(again, 2)
+        await again.aclose()
+        return seen, chunks[1]
+
+    seen, replayed = asyncio.run(scenario())
+    boot, number = seen.split("-")
+    assert number == "1"
+    assert lines(replayed, "id") == [f"{boot}-3"]
+    assert lines(replayed, "data") == ['{"n":3}']
+
+
+def test_ids_from_another_process_resync():
+    async def scenario():
+        before, after = Broadcaster(), Broadcaster()
+        for hub in (before, after):
+            hub.publish(AVAILABILITY, AVAILABILITY, {}, "villa-1")
+            hub.publish(AVAILABILITY, AVAILABILITY, {}, "villa-1")
+        results = []
+        for last_event_id in (f"{before.boot}-1", "1", "garbage"):
+            stream = after.stream([AVAILABILITY], last_event_id=last_event_id)
+            results.append(lines((await take(stream, 2))[1], "event"))
+            await stream.aclose()
+        return results
+
+    assert asyncio.run(scenario()) == [["resync"]] * 3
+
+
+def test_slow_subscriber_gets_resync(monkeypatch):
+    monkeypatch.setattr(broadcast, "SSE_QUEUE_SIZE", 4)
+
+    async def scenario():
+        hub = Broadcaster()
+        stream = hub.stream([AVAILABILITY])
+        await stream.__anext__()
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        for _ in range(10):
+            hub.publish(AVAILABILITY, AVAILABILITY, {}, "villa-1")
+        chunks = [await waiting, await stream.__anext__()]
+        hub.publish(AVAILABILITY, AVAILABILITY, {}, "villa-1")
+        chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return [lines(chunk, "event")[0] for chunk in chunks], len(hub.subscriptions)
+
+    assert asyncio.run(scenario()) == ([AVAILABILITY, "resync", AVAILABILITY], 0)
+
+
+def test_admin_streams_take_short_lived_tokens_in_the_url(api, admin_headers):
+    async def scenario(client):
+        anonymous = await client.post("/api/events/token")
+        issued = await client.post("/api/events/token", headers=admin_headers)
+        stream_token = issued.json()["token"]
+        admin_token = admin_headers["Authorization"].replace("Bearer ", "")
+        # Past authentication a full worker answers 503 rather than streaming
+        full, broadcaster.max_subscribers = broadcaster.max_subscribers, 0
+        try:
+            statuses = [(await client.get("/api/events", params={"topics": BOOKINGS, **params},
+                                          headers=headers)).status_code
+                        for params, headers in (
+                            ({"token": stream_token}, {}),
+                            ({}, admin_headers),
+                            ({"token": admin_token}, {}),
+                        )]
+        finally:
+            broadcaster.max_subscribers = full
+        as_admin = await client.get("/api/admin/blocked-bookings", headers={"Authorization": f"Bearer {stream_token}"})
+        return anonymous.status_code, issued.json()["expiresIn"], statuses, as_admin.status_code
+
+    assert api(scenario) == (401, 60, [503, 503, 401], 401)
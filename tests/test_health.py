@@ -0,0 +1,9 @@
+HEALTH = ["/api/health/db-pool", "/api/health/db-replicas", "/api/health/outbox", "/api/health/admission"]
+
+
+def test_health_endpoints_are_admin_only(api, admin_headers):
+    async def scenario(client):
+        return [((await client.get(path)).status_code, (await client.get(path, headers=admin_headers)).status_code)
+                for path in HEALTH]
+
+    assert api(scenario) == [(401, 200)] * len(HEALTH)
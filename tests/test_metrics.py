@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import server
+from metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT, MetricsMiddleware, instrument_engine
+
+
+def test_failed_statements_do_not_leave_query_timers_behind():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM missing")
+        assert conn.info["query_started"] == []
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+        assert conn.info["query_started"] == []
+
+
+def test_event_streams_are_not_timed_as_requests():
+    async def stream(scope, receive, send):
+        headers = [(b"content-type", b"text/event-stream; charset=utf-8")]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        in_flight.append(REQUESTS_IN_FLIGHT.values.get(("TRACE",)))
+        await send({"type": "http.response.body", "body": b""})
+
+    async def sent(message):
+        pass
+
+    in_flight = []
+    scope = {"type": "http", "method": "TRACE", "path": "/api/events"}
+    asyncio.run(MetricsMiddleware(stream)(scope, None, sent))
+    assert in_flight == [0]
+    assert REQUESTS_IN_FLIGHT.values[("TRACE",)] == 0
+    assert not [key for key in REQUEST_LATENCY.series if key[0] == "TRACE"]
+
+
+def test_metrics_endpoint_is_off_by_default(api):
+    async def scenario(client):
+        return (await client.get("/metrics")).status_code
+
+    assert not server.METRICS_ENABLED
+    assert api(scenario) == 404
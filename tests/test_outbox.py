@@ -0,0 +1,15 @@
+import asyncio
+import logging
+
+from outbox import BOOKING_CREATED, LogSink
+
+
+def test_log_sink_leaves_guest_details_out(caplog):
+    event = {"id": "7", "topic": BOOKING_CREATED, "payload": {
+        "id": "42", "fullName": "Ada Guest", "email": "ada@example.com", "phone": "+1 555 0100",
+    }}
+    with caplog.at_level(logging.INFO, logger="outbox"):
+        asyncio.run(LogSink().deliver([event]))
+    assert "booking 42" in caplog.text
+    for detail in ("Ada Guest", "ada@example.com", "555 0100"):
+        assert detail not in caplog.text
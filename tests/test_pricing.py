@@ -0,0 +1,54 @@
+from .conftest import booking, stay
+
+# One unit of the double room (5 units) is 0.2 occupancy
+DOUBLE = {"room_type": "double-1", "check_in": "2030-03-04T00:00:00Z", "check_out": "2030-03-06T00:00:00Z"}
+
+
+def occupancy_rule(min_occupancy, adjustment=2):
+    return {"roomType": "double-1", "kind": "occupancy", "minOccupancy": min_occupancy, "adjustment": adjustment}
+
+
+async def quote_total(client, **where):
+    response = await client.post("/api/quotes", json={"stays": [stay(**where)]})
+    return response.json()["quotes"][0]["total"]
+
+
+def test_occupancy_rule_applies_at_exactly_its_threshold(api, admin_headers):
+    async def scenario(client):
+        await client.post("/api/admin/rate-rules", json=occupancy_rule(0.2), headers=admin_headers)
+        before = await quote_total(client, **DOUBLE)
+        await client.post("/api/bookings", json=booking(**DOUBLE))
+        return before, await quote_total(client, **DOUBLE)
+
+    # 2 nights at 199, then doubled once 1 of 5 units is booked
+    assert api(scenario) == (398.0, 796.0)
+
+
+def test_own_hold_does_not_raise_the_booking_price(api, admin_headers):
+    async def scenario(client):
+        await client.post("/api/admin/rate-rules", json=occupancy_rule(0.2), headers=admin_headers)
+        hold = (await client.post("/api/holds", json=stay(**DOUBLE))).json()
+        # Someone else's hold does count
+        quoted = await quote_total(client, **DOUBLE)
+        booked = await client.post("/api/bookings", json=booking(**DOUBLE, holdId=hold["id"]))
+        return quoted, booked.json()["totalPrice"]
+
+    assert api(scenario) == (796.0, 398.0)
+
+
+def test_stays_are_charged_for_the_nights_they_occupy(api):
+    # 36 hours, but on the nights of Jan 9 and Jan 10 as inventory counts them
+    late = {"room_type": "single-1", "check_in": "2030-01-09T18:00:00Z", "check_out": "2030-01-11T06:00:00Z"}
+
+    async def scenario(client):
+        quote = (await client.post("/api/quotes", json={"stays": [stay(**late)]})).json()["quotes"][0]
+        booked = (await client.post("/api/bookings", json=booking(**late))).json()
+        calendar = (await client.get("/api/rooms/availability/calendar", params={
+            "roomTypes": "single-1", "start": "2030-01-08", "end": "2030-01-12",
+        })).json()
+        return quote, booked, calendar["rooms"]["single-1"]["booked"]
+
+    quote, booked, nights = api(scenario)
+    assert nights == [0, 1, 1, 0]
+    assert quote["nights"] == booked["nights"] == 2
+    assert quote["total"] == booked["totalPrice"] == 2 * 129